@@ -0,0 +1,222 @@
+"""Memory footprint of morphing: allocations per record and memory retained while streaming records through `Recipe.morph`.
+
+Usage:
+    python benchmarks/memory_footprint.py [--records 200000] [--config auto_drop auto_finalize ...] [--update-baseline]
+
+Every configuration of the recipe is measured after the warmup:
+- allocated: memory held by the result and the state of a record right after `morph`, broken down by module (tracemalloc)
+- peak: the highest memory used while a record is morphed, above the memory before the call (tracemalloc)
+- retained: growth of traced memory over `--traced-records` records divided by their number, broken down by module (tracemalloc)
+- retained blocks: growth of the number of allocated memory blocks over the whole stream of `--records` records divided by their number,
+  the stream isn't traced, so it runs at full speed
+
+Retained memory should stay near zero. The run fails (exit code 1) when allocated or peak memory per record exceeds the baseline
+by more than the tolerance or when retained memory per record exceeds the baseline by more than the slack.
+Caches filled by the warmup are divided by the number of records, so retained memory per record depends on the numbers of records:
+baselines are stored in `memory_baseline.json` next to this file together with the parameters of the run and the version of Python,
+they are updated with `--update-baseline`, and a run with other parameters isn't compared with them (exit code 2).
+Records are morphed at several thousand records/s, so the default run of all configurations takes 5-10 minutes, the stream of `--records` takes most of it.
+"""
+import argparse
+import gc
+import json
+import random
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from morpher import create_recipe
+from morpher.recipe import SourceFieldStrategy
+
+BASELINE_PATH = Path(__file__).resolve().parent / "memory_baseline.json"
+PACKAGE_DIR = Path(__file__).resolve().parent.parent / "morpher"
+
+RECIPE = """take id . ^ string
+take name . !lower . @ name_lower . ^ string
+take email . ^safe_cast string
+take score . ^default_cast integer 0
+take created_at . ^ timestamp
+take tags . #first . !upper . @ first_tag . ^ string
+take location . # . !extract $.country . @ country . ^ string
+take attributes . # . !extract $.plan . @ plan . ^safe_cast string
+drop note"""
+
+CONFIGS = {
+    "auto_drop": {},
+    "auto_finalize": {"source_fields_stategy": SourceFieldStrategy.AUTO_FINALIZE},
+    "memory_bounded": {"with_memory_bounded_state": True},
+    "specialized": {"with_type_specialization": True},
+    "state_pooling": {"with_state_pooling": True}
+}
+
+#Optional fields are taken from a fixed set in a fixed order, so caches of the recipe (layouts, statistics) are filled by the warmup
+EXTRA_FIELDS = 10
+#Allowed growth of the number of allocated blocks over the stream, blocks per record
+BLOCKS_SLACK = 0.001
+
+def generate_records(count: int, seed: int = 0):
+    #values are never null, because finalization of null source fields fails (AUTO_FINALIZE)
+    rnd = random.Random(seed)
+    for i in range(count):
+        record = {
+            "id": i,
+            "name": rnd.choice(["Ann", "Bob", "Carol", "Dave"]) + str(rnd.randrange(1000)),
+            "email": "user{}@example.com".format(rnd.randrange(100_000)),
+            "score": rnd.random() * 100,
+            "active": rnd.random() < 0.5,
+            "created_at": "2024-{:02d}-{:02d}T10:{:02d}:00+00:00".format(rnd.randint(1, 12), rnd.randint(1, 28), rnd.randrange(60)),
+            "tags": [rnd.choice(["new", "vip", "trial", "churn"]) for _ in range(rnd.randint(1, 4))],
+            "location": {"country": rnd.choice(["IL", "DE", "US"]), "city": "City{}".format(rnd.randrange(50))},
+            "attributes": {"plan": rnd.choice(["free", "pro", "team"]), "seats": rnd.randint(1, 50)},
+            "note": "note {}".format(i)
+        }
+        for k in sorted(rnd.sample(range(EXTRA_FIELDS), rnd.randint(0, 3))):
+            record["extra_{}".format(k)] = rnd.randrange(1000)
+        yield record
+
+def _module(filename: str) -> str:
+    path = Path(filename)
+    if path.is_relative_to(PACKAGE_DIR):
+        return str(path.relative_to(PACKAGE_DIR.parent))
+    return "<other>"
+
+def _by_module(snapshot: tracemalloc.Snapshot, base: tracemalloc.Snapshot) -> dict[str, int]:
+    result = {}
+    for stat in snapshot.compare_to(base, "filename"):
+        module = _module(stat.traceback[0].filename)
+        result[module] = result.get(module, 0) + stat.size_diff
+    return result
+
+def _snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+
+def measure(options: dict, records: int, traced_records: int, sample: int, warmup: int) -> dict:
+    recipe = create_recipe(recipe_str=RECIPE, **options)
+    ds = list(generate_records(sample, seed=1))
+    #warmup fills caches of the recipe and specializes actions, they are not counted
+    for d in generate_records(warmup, seed=2):
+        recipe.morph(d)
+
+    tracemalloc.start()
+    try:
+        #allocated: results and states of the sample are kept alive, so everything they hold is still traced
+        base = _snapshot()
+        results = [recipe.morph(d) for d in ds]
+        allocated = _by_module(_snapshot(), base)
+        del results
+
+        #peak: one record at a time, the peak is reset before every call
+        peak = 0
+        for d in ds:
+            current = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            recipe.morph(d)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - current)
+
+        #retained: results are dropped right away, so the memory of the process should stay flat
+        base = _snapshot()
+        for d in generate_records(traced_records, seed=3):
+            recipe.morph(d)
+        retained = _by_module(_snapshot(), base)
+    finally:
+        tracemalloc.stop()
+
+    gc.collect()
+    blocks = sys.getallocatedblocks()
+    started_at = time.perf_counter()
+    for d in generate_records(records, seed=4):
+        recipe.morph(d)
+    elapsed = time.perf_counter() - started_at
+    gc.collect()
+    return {
+        "allocated_per_record": sum(allocated.values()) / sample,
+        "peak_per_record": peak,
+        "retained_per_record": sum(retained.values()) / traced_records,
+        "retained_blocks_per_record": (sys.getallocatedblocks() - blocks) / records,
+        "allocated_by_module": {k: v / sample for k, v in sorted(allocated.items(), key=lambda x: -x[1]) if v},
+        "retained_by_module": {k: v for k, v in sorted(retained.items(), key=lambda x: -x[1]) if v},
+        "records_per_sec": records / elapsed
+    }
+
+def run_parameters(args: argparse.Namespace) -> dict:
+    return {
+        "python": "{}.{}".format(*sys.version_info[:2]),
+        "records": args.records,
+        "traced_records": args.traced_records,
+        "sample": args.sample,
+        "warmup": args.warmup
+    }
+
+def check(name: str, result: dict, baseline: dict, tolerance: float, slack: float) -> list[str]:
+    if baseline is None:
+        return []
+    failures = []
+    for metric in ["allocated_per_record", "peak_per_record"]:
+        if result[metric] > baseline[metric] * (1 + tolerance):
+            failures.append("{}: {} {:.0f} B > baseline {:.0f} B".format(name, metric, result[metric], baseline[metric]))
+    if result["retained_per_record"] > baseline["retained_per_record"] + slack:
+        failures.append("{}: retained_per_record {:.2f} B > baseline {:.2f} B".format(
+            name, result["retained_per_record"], baseline["retained_per_record"]
+        ))
+    if result["retained_blocks_per_record"] > baseline["retained_blocks_per_record"] + BLOCKS_SLACK:
+        failures.append("{}: retained_blocks_per_record {:.4f} > baseline {:.4f}".format(
+            name, result["retained_blocks_per_record"], baseline["retained_blocks_per_record"]
+        ))
+    return failures
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--records", type=int, default=200_000, help="number of records streamed to measure retained blocks")
+    arg_parser.add_argument("--traced-records", type=int, default=20_000, help="number of records to measure retained memory by module")
+    arg_parser.add_argument("--sample", type=int, default=1000, help="number of records to measure allocated and peak memory")
+    arg_parser.add_argument("--warmup", type=int, default=10_000)
+    arg_parser.add_argument("--config", nargs="+", choices=list(CONFIGS), default=list(CONFIGS))
+    arg_parser.add_argument("--tolerance", type=float, default=0.1, help="allowed relative growth of allocated and peak memory")
+    arg_parser.add_argument("--slack", type=float, default=1.0, help="allowed growth of retained memory, bytes per record")
+    arg_parser.add_argument("--update-baseline", action="store_true", help="store results as the new baseline")
+    args = arg_parser.parse_args()
+
+    baselines = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    parameters = run_parameters(args)
+    if not args.update_baseline:
+        mismatched = [name for name in args.config if name in baselines and baselines[name].get("parameters") != parameters]
+        if mismatched:
+            print("Baselines of {} are measured with other parameters, run with them or update the baselines:".format(", ".join(mismatched)))
+            for name in mismatched:
+                print("{:>16}: {}".format(name, baselines[name].get("parameters")))
+            sys.exit(2)
+    failures = []
+    print("{:>16} {:>14} {:>10} {:>14} {:>16} {:>12}".format("config", "allocated, B", "peak, B", "retained, B", "retained blocks", "records/sec"))
+    for name in args.config:
+        result = measure(CONFIGS[name], args.records, args.traced_records, args.sample, args.warmup)
+        print("{:>16} {:>14.0f} {:>10.0f} {:>14.3f} {:>16.4f} {:>12,.0f}".format(
+            name,
+            result["allocated_per_record"],
+            result["peak_per_record"],
+            result["retained_per_record"],
+            result["retained_blocks_per_record"],
+            result["records_per_sec"]
+        ))
+        for module, size in result["allocated_by_module"].items():
+            print("{:>16}   {:<40} {:>10.0f} B/record".format("", module, size))
+        for module, size in result["retained_by_module"].items():
+            print("{:>16}   retained by {:<28} {:>10} B".format("", module, size))
+        failures.extend(check(name, result, baselines.get(name), args.tolerance, args.slack))
+        if args.update_baseline:
+            baselines[name] = {
+                "parameters": parameters,
+                **{k: round(result[k], 4) for k in ["allocated_per_record", "peak_per_record", "retained_per_record", "retained_blocks_per_record"]}
+            }
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(baselines, indent=4) + "\n")
+        print("Baseline is written to {}".format(BASELINE_PATH))
+    elif failures:
+        print("\n".join(["", "Memory regressions:", *failures]))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
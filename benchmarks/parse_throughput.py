@@ -0,0 +1,73 @@
+"""Throughput of lexing and parsing of large machine-generated recipes.
+
+Usage:
+    python benchmarks/parse_throughput.py [--lines 10000 20000 40000 80000] [--repeat 3] [--with-gc]
+
+Time per line should stay roughly constant while the size of the recipe grows.
+Lexing and parsing create a lot of small objects without reference cycles, so the cyclic garbage collector is paused
+while they are timed (the library never touches the collector itself), `--with-gc` keeps it running.
+"""
+import argparse
+import gc
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from morpher.lexer import Lexer
+from morpher.morpher_parser import Parser
+
+LINE_TEMPLATES = [
+    "take field_{i} . ^ string",
+    "take field_{i} . !lower . @ lower_{i} . ^safe_cast string",
+    "take obj_{i} . #partial a b c . !extract $.a . @prefix p_ . ^default_cast integer 0",
+    "take list_{i} . #first . !upper . @suffix _first . ^ string",
+    "take obj_{i} . !flatten . @split",
+    "take ts_{i} . ^ timestamp",
+    "drop field_{i}",
+    "-- comment for field {i}",
+    "take cont_{i}\n\t!lower . @ cont_alias_{i}\n\t^safe_cast integer",
+]
+
+def generate_recipe(lines: int, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    return "\n".join(rnd.choice(LINE_TEMPLATES).format(i=i) for i in range(lines))
+
+def measure(recipe_str: str, repeat: int, with_gc: bool = False) -> tuple[float, float]:
+    lex_time = parse_time = float("inf")
+    for _ in range(repeat):
+        if not with_gc:
+            gc.disable()
+        try:
+            start = time.perf_counter()
+            parts = Lexer().tokenize(recipe_str)
+            lexed = time.perf_counter()
+            Parser().parse(parts)
+            parsed = time.perf_counter()
+        finally:
+            gc.enable()
+        lex_time = min(lex_time, lexed - start)
+        parse_time = min(parse_time, parsed - lexed)
+    return lex_time, parse_time
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--lines", type=int, nargs="+", default=[10_000, 20_000, 40_000, 80_000])
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--with-gc", action="store_true", help="keep the cyclic garbage collector running while lexing and parsing")
+    args = arg_parser.parse_args()
+
+    print("{:>8} {:>10} {:>10} {:>14} {:>12}".format("lines", "lex, ms", "parse, ms", "lines/sec", "us/line"))
+    for lines in args.lines:
+        recipe_str = generate_recipe(lines)
+        n_lines = recipe_str.count("\n") + 1
+        lex_time, parse_time = measure(recipe_str, args.repeat, args.with_gc)
+        total = lex_time + parse_time
+        print("{:>8} {:>10.1f} {:>10.1f} {:>14,.0f} {:>12.2f}".format(
+            n_lines, lex_time * 1000, parse_time * 1000, n_lines / total, total / n_lines * 1e6
+        ))
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,2 @@
-from .morpher import morph, create_morph, create_recipe
+from .morpher import morph, create_morph, create_recipe, create_reloadable_recipe, morph_many, morph_many_parallel, morph_file, morph_file_parallel
 from .recipe.functions import register_function
\ No newline at end of file
@@ -0,0 +1,282 @@
+import argparse
+import os
+import signal
+import sys
+import time
+from typing import BinaryIO, Iterable, Iterator, List
+from .recipe import SourceFieldStrategy
+from .recipe.executor import DEFAULT_BATCH_SIZE
+
+#Interval between progress reports of `run`, in seconds
+PROGRESS_INTERVAL = 1.0
+
+def _parse_named_recipes(values: List[str]) -> dict[str, str]:
+    recipes = {}
+    for value in values:
+        name, delimiter, path = value.partition("=")
+        if not delimiter or not name or not path:
+            raise argparse.ArgumentTypeError("Recipe should be provided as NAME=PATH, got '{}'".format(value))
+        with open(path) as f:
+            recipes[name] = f.read()
+    return recipes
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError("should be a positive integer, got '{}'".format(value))
+    return number
+
+def _add_recipe_options(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--strategy",
+        choices=[x.name for x in SourceFieldStrategy],
+        default=SourceFieldStrategy.AUTO_DROP.name,
+        help="what to do with source fields which are not processed by the recipe"
+    )
+    parser.add_argument("--timestamp-cast", action="store_true", help="cast source string fields which look like timestamps to timestamps")
+    parser.add_argument("--import", dest="imports", action="append", default=[], metavar="MODULE", help="module to import before compiling recipes (e.g. to register functions)")
+
+def _serve(args: argparse.Namespace) -> int:
+    from .server import MorphServer, WorkerType
+
+    address = args.socket if args.socket else (args.host, args.port)
+    server = MorphServer(
+        _parse_named_recipes(args.recipe),
+        address,
+        workers=args.workers,
+        worker_type=WorkerType[args.worker_type.upper()],
+        source_fields_stategy=SourceFieldStrategy[args.strategy],
+        with_source_fields_timestamp_cast=args.timestamp_cast,
+        imports=args.imports,
+        max_in_flight=args.max_in_flight
+    )
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    print("Serving {} on {}".format(", ".join(sorted(server.recipes)), server.server_address), file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+def _explain(args: argparse.Namespace) -> int:
+    import importlib
+    import json
+    from .morpher import create_recipe
+
+    for module in args.imports:
+        importlib.import_module(module)
+    recipe = create_recipe(
+        recipe_path=args.recipe,
+        source_fields_stategy=SourceFieldStrategy[args.strategy],
+        with_source_fields_timestamp_cast=args.timestamp_cast,
+        with_memory_bounded_state=args.memory_bounded
+    )
+    sample = None
+    if args.sample:
+        with open(args.sample) as f:
+            sample = json.load(f)
+    #flushed right away, so a closed stdout is reported while `main` still runs (see `main`)
+    print(recipe.explain(sample, args.runs), flush=True)
+    return 0
+
+class _Progress:
+    """Counters of `run` which are reported to stderr every `PROGRESS_INTERVAL` seconds and at the end"""
+
+    def __init__(self, is_enabled: bool) -> None:
+        self.is_enabled = is_enabled
+        self.read = 0
+        self.written = 0
+        self.started_at = self.reported_at = time.monotonic()
+
+    def update(self, read: int, written: int):
+        self.read += read
+        self.written += written
+        if self.is_enabled and time.monotonic() - self.reported_at >= PROGRESS_INTERVAL:
+            self.report()
+
+    def report(self, is_final: bool = False):
+        self.reported_at = time.monotonic()
+        elapsed = self.reported_at - self.started_at
+        message = "{} records read, {} written in {:.1f}s ({:.0f} records/s)".format(
+            self.read,
+            self.written,
+            elapsed,
+            self.read / elapsed if elapsed > 0 else 0.0
+        )
+        if is_final:
+            #records in flight between workers and the output are known only at the end
+            message = "done: {}, {} rejected".format(message, self.read - self.written)
+        print(message, file=sys.stderr, flush=True)
+
+def _detect_input_format(f: BinaryIO, input_format: str):
+    from .files import InputFormat, detect_format
+
+    if input_format:
+        return InputFormat[input_format.upper()]
+    return detect_format(f)
+
+def _open_input(path: str, args: argparse.Namespace) -> BinaryIO:
+    import contextlib
+    from .files import decompress, detect_compression, open_input
+
+    if path != "-":
+        return open_input(path, with_decompression_thread=args.decompression_thread)
+    #stdin itself is never closed, only the stream of its decompressed content
+    stdin = sys.stdin.buffer
+    stream = decompress(stdin, detect_compression(stdin), args.decompression_thread)
+    return contextlib.nullcontext(stdin) if stream is stdin else stream
+
+def _batches(items: Iterable, batch_size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _run_sequential(recipe, f: BinaryIO, input_format, args: argparse.Namespace, output: BinaryIO, progress: _Progress):
+    import json
+    from .files import encode_results, read_records
+
+    decode = recipe.create_decoder() if args.projection else json.loads
+    records = (record for record, _ in read_records(f, input_format=input_format, decode=decode))
+    for batch in _batches(records, args.batch_size):
+        results = recipe.morph_batch(batch)
+        output.write(encode_results(results))
+        progress.update(len(batch), sum(1 for x in results if x is not None))
+
+def _run_parallel(executor, f: BinaryIO, input_format, args: argparse.Namespace, output: BinaryIO, progress: _Progress):
+    from .files import InputFormat, encode_results, read_json_array
+
+    counter = [0]
+    def count(items: Iterable) -> Iterator:
+        for item in items:
+            counter[0] += 1
+            yield item
+
+    if input_format == InputFormat.NDJSON:
+        #lines are sent to workers as they are and decoded there
+        results = executor.map_lines(count(line for line in f if not line.isspace()))
+    else:
+        results = executor.map(count(record for record, _ in read_json_array(f)))
+    #rejected records are skipped by workers, so the number of read records is taken from the input
+    for batch in _batches(results, args.batch_size):
+        output.write(encode_results(batch))
+        read, counter[0] = counter[0], 0
+        progress.update(read, len(batch))
+    progress.update(counter[0], 0)
+
+def _run(args: argparse.Namespace) -> int:
+    import contextlib
+    import importlib
+
+    for module in args.imports:
+        importlib.import_module(module)
+    with open(args.recipe) as f:
+        recipe_str = f.read()
+    recipe_options = {
+        "source_fields_stategy": SourceFieldStrategy[args.strategy],
+        "with_source_fields_timestamp_cast": args.timestamp_cast,
+        "with_type_specialization": args.type_specialization,
+        "with_state_pooling": args.state_pooling
+    }
+    progress = _Progress(args.progress)
+
+    with contextlib.ExitStack() as stack:
+        if args.workers > 1:
+            from .transport import SharedMemoryExecutor
+
+            executor = stack.enter_context(SharedMemoryExecutor(
+                recipe_str,
+                recipe_options=recipe_options,
+                workers=args.workers,
+                batch_size=args.batch_size,
+                imports=args.imports,
+                with_projection=args.projection
+            ))
+            run_input = lambda f, input_format, output: _run_parallel(executor, f, input_format, args, output, progress)
+        else:
+            from .morpher import create_recipe
+
+            recipe = create_recipe(recipe_str=recipe_str, **recipe_options)
+            run_input = lambda f, input_format, output: _run_sequential(recipe, f, input_format, args, output, progress)
+
+        output = stack.enter_context(open(args.output, "wb")) if args.output else sys.stdout.buffer
+        for path in args.inputs or ["-"]:
+            with _open_input(path, args) as f:
+                run_input(f, _detect_input_format(f, args.format), output)
+            output.flush()
+    if args.progress:
+        progress.report(is_final=True)
+    return 0
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="morpher", description="Transform your structured data with a configurable recipe")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve = subparsers.add_parser("serve", help="serve preloaded recipes over a Unix domain socket or a local TCP port")
+    serve.add_argument("--recipe", action="append", required=True, metavar="NAME=PATH", help="named recipe to preload, may be repeated")
+    address = serve.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket", help="path of the Unix domain socket")
+    address.add_argument("--port", type=int, help="TCP port")
+    serve.add_argument("--host", default="127.0.0.1", help="TCP host, localhost by default")
+    serve.add_argument("--workers", type=_positive_int, default=None, help="number of workers, number of CPUs by default")
+    serve.add_argument("--worker-type", choices=["thread", "process"], default="thread")
+    serve.add_argument("--max-in-flight", type=_positive_int, default=64, help="maximum number of requests processed at once per connection")
+    _add_recipe_options(serve)
+    serve.set_defaults(handler=_serve)
+
+    explain = subparsers.add_parser("explain", help="print the compiled execution plan of the recipe")
+    explain.add_argument("recipe", help="path of the recipe")
+    explain.add_argument("--sample", help="JSON file with a record to estimate the cost of every action")
+    explain.add_argument("--runs", type=int, default=200, help="number of calibration runs with the sample record")
+    explain.add_argument("--memory-bounded", action="store_true", help="compile the recipe in memory-bounded mode")
+    _add_recipe_options(explain)
+    explain.set_defaults(handler=_explain)
+
+    run = subparsers.add_parser("run", help="morph NDJSON or JSON array files (or stdin), optionally compressed, into NDJSON")
+    run.add_argument("recipe", help="path of the recipe")
+    run.add_argument("inputs", nargs="*", metavar="INPUT", help="input files, '-' or nothing for stdin")
+    run.add_argument("-o", "--output", help="path of the output file, stdout by default")
+    run.add_argument("--format", choices=["ndjson", "json_array"], default=None, help="format of inputs, detected by their content by default")
+    run.add_argument("--workers", type=_positive_int, default=1, help="number of worker processes, records are morphed in this process if 1 (default)")
+    run.add_argument("--batch-size", type=_positive_int, default=DEFAULT_BATCH_SIZE, help="number of records morphed at once")
+    run.add_argument("--projection", action="store_true", help="decode only source fields read by the recipe from NDJSON inputs")
+    run.add_argument("--type-specialization", action="store_true", help="specialize actions for types of values of the first records")
+    run.add_argument("--state-pooling", action="store_true", help="reuse states and values of source fields between records")
+    run.add_argument("--decompression-thread", action="store_true", help="decompress gzip, bz2 and xz inputs in a background thread")
+    run.add_argument("--progress", action="store_true", help="report the number of records and throughput to stderr")
+    _add_recipe_options(run)
+    run.set_defaults(handler=_run)
+
+    return parser
+
+def main(argv: List[str] = None) -> int:
+    args = create_parser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except argparse.ArgumentTypeError as e:
+        print("morpher: error: {}".format(e), file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        #reader of stdout has exited (e.g. `| head`), the rest of the output isn't needed.
+        #stdout is redirected to devnull, so flushing it at exit doesn't fail again
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError, EOFError) as e:
+        #missing files, malformed records or recipes and truncated compressed inputs, notes tell where the error is
+        print("morpher: error: {}".format(str(e) or type(e).__name__), file=sys.stderr)
+        for note in getattr(e, "__notes__", []):
+            print("  {}".format(note), file=sys.stderr)
+        return 1
@@ -0,0 +1,5 @@
+from .files import process_file, encode_results
+from .readers import InputFormat, read_records, read_ndjson, read_json_array, detect_format
+from .checkpoint import Checkpoint, CheckpointFile
+from .partitions import Partition, split_file, process_file_partitioned
+from .compression import Compression, ThreadedReader, detect_compression, decompress, open_input
\ No newline at end of file
@@ -0,0 +1,64 @@
+import json
+import os
+from dataclasses import dataclass, asdict
+from typing import Optional
+
+@dataclass
+class Checkpoint:
+    """Position of the file run which is fully written to the output.
+
+    `input_offset` is the byte offset in the input right after the last processed record
+    `records` is the number of processed records
+    `output_offset` is the size of the output with results of these records
+    `input_size` and `input_mtime_ns` identify the version of the input file
+    `fingerprint` is the fingerprint of the recipe
+    `is_complete` is True when the whole input is processed
+    """
+    input_path: str
+    output_path: str
+    input_size: int
+    input_mtime_ns: int
+    fingerprint: str
+    input_offset: int = 0
+    records: int = 0
+    output_offset: int = 0
+    is_complete: bool = False
+
+    def is_same_run(self, other: "Checkpoint") -> bool:
+        """Checks if both checkpoints belong to the run with the same input, output and recipe"""
+        return (
+            self.input_path == other.input_path
+            and self.output_path == other.output_path
+            and self.input_size == other.input_size
+            and self.input_mtime_ns == other.input_mtime_ns
+            and self.fingerprint == other.fingerprint
+        )
+
+class CheckpointFile:
+    """Local file with the last committed checkpoint.
+    Checkpoint is written to a temporary file which atomically replaces the previous one, so a crash never leaves a partially written checkpoint.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def load(self) -> Optional[Checkpoint]:
+        try:
+            with open(self.path) as f:
+                return Checkpoint(**json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def save(self, checkpoint: Checkpoint):
+        tmp_path = "{}.tmp".format(self.path)
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(checkpoint), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
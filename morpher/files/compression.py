@@ -0,0 +1,166 @@
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import threading
+from enum import Enum
+from typing import BinaryIO, Optional
+from .readers import DEFAULT_CHUNK_SIZE
+
+#Compressed input is decompressed by stdlib codecs chunk by chunk while it's read, it's never decompressed to disk or into memory at once
+Compression = Enum("Compression", ["NONE", "GZIP", "BZ2", "XZ"])
+
+_EXTENSIONS = {
+    ".gz": Compression.GZIP,
+    ".bz2": Compression.BZ2,
+    ".xz": Compression.XZ,
+    ".lzma": Compression.XZ
+}
+_MAGIC_BYTES = [
+    (b"\x1f\x8b", Compression.GZIP),
+    (b"BZh", Compression.BZ2),
+    (b"\xfd7zXZ\x00", Compression.XZ)
+]
+_OPENERS = {
+    Compression.GZIP: gzip.open,
+    Compression.BZ2: bz2.open,
+    Compression.XZ: lzma.open
+}
+#Number of decompressed chunks read ahead by the decompression thread
+MAX_CHUNKS_AHEAD = 4
+#Interval of checks that the reader is closed while the decompression thread waits for it, in seconds
+POLL_INTERVAL = 0.1
+
+def _magic_compression(head: bytes) -> Compression:
+    for magic, compression in _MAGIC_BYTES:
+        if head.startswith(magic):
+            return compression
+    return Compression.NONE
+
+def detect_compression(f: BinaryIO, path: str = None) -> Compression:
+    """Detects the compression by the extension of the path (`.gz`, `.bz2`, `.xz`, `.lzma`) or by magic bytes at the beginning of the file,
+    the position of the file is not changed
+
+    Args:
+        f (BinaryIO): file opened in binary mode, streams which can't seek (e.g. stdin) should support `peek`
+        path (str, optional): path of the file. Defaults to None.
+
+    Returns:
+        Compression: NONE if the file isn't compressed
+    """
+    if path:
+        for extension, compression in _EXTENSIONS.items():
+            if path.endswith(extension):
+                return compression
+    if not f.seekable():
+        return _magic_compression(f.peek(8))
+    position = f.tell()
+    try:
+        return _magic_compression(f.read(8))
+    finally:
+        f.seek(position)
+
+class ThreadedReader(io.RawIOBase):
+    """Stream which reads chunks of the underlying stream in a background thread, so decompression overlaps with morphing.
+    Codecs of gzip, bz2 and xz release the GIL while they decompress. Only `MAX_CHUNKS_AHEAD` chunks are read ahead, so memory stays bounded.
+    The stream can't seek, closing it stops the thread and closes the underlying stream.
+    """
+
+    def __init__(self, f: BinaryIO, chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+        super().__init__()
+        self._f = f
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(MAX_CHUNKS_AHEAD)
+        self._chunk = memoryview(b"")
+        self._is_eof = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._read_chunks, name="morpher-decompression", daemon=True)
+        self._thread.start()
+
+    def _put(self, item: bytes | Exception):
+        while not self._stopped.is_set():
+            try:
+                self._chunks.put(item, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def _read_chunks(self):
+        try:
+            while not self._stopped.is_set():
+                chunk = self._f.read(self._chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            #errors of decompression (e.g. truncated input) are raised by the reader
+            self._put(e)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if not self._chunk:
+            if self._is_eof:
+                return 0
+            item = self._chunks.get()
+            if isinstance(item, Exception):
+                self._is_eof = True
+                raise item
+            if not item:
+                self._is_eof = True
+                return 0
+            self._chunk = memoryview(item)
+        size = min(len(b), len(self._chunk))
+        b[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self._stopped.set()
+            self._thread.join()
+            self._f.close()
+        super().close()
+
+def _threaded(stream: BinaryIO) -> BinaryIO:
+    return io.BufferedReader(ThreadedReader(stream), DEFAULT_CHUNK_SIZE)
+
+def decompress(f: BinaryIO, compression: Compression, with_decompression_thread: bool = False) -> BinaryIO:
+    """Wraps the stream (e.g. stdin) with the stream of its decompressed content, the stream itself is not closed together with it
+
+    Args:
+        f (BinaryIO): stream opened in binary mode
+        compression (Compression): compression of the stream
+        with_decompression_thread (bool, optional): if True the content is decompressed in a background thread (see `ThreadedReader`).
+            Defaults to False.
+
+    Returns:
+        BinaryIO: decompressed stream, the stream itself if it isn't compressed
+    """
+    if compression == Compression.NONE:
+        return f
+    stream = _OPENERS[compression](f)
+    return _threaded(stream) if with_decompression_thread else stream
+
+def open_input(path: str, compression: Optional[Compression] = None, with_decompression_thread: bool = False) -> BinaryIO:
+    """Opens the input file in binary mode, compressed files are decompressed while they are read
+
+    Args:
+        path (str): path of the file
+        compression (Optional[Compression], optional): compression of the file, detected by the extension or the content if not provided.
+            Defaults to None.
+        with_decompression_thread (bool, optional): if True compressed content is decompressed in a background thread (see `ThreadedReader`).
+            Defaults to False.
+
+    Returns:
+        BinaryIO: stream of the (decompressed) content of the file
+    """
+    if compression is None:
+        with open(path, "rb") as f:
+            compression = detect_compression(f, path)
+    if compression == Compression.NONE:
+        return open(path, "rb")
+    stream = _OPENERS[compression](path, "rb")
+    return _threaded(stream) if with_decompression_thread else stream
@@ -0,0 +1,110 @@
+import itertools
+import json
+import os
+import time
+from typing import BinaryIO, List
+from .checkpoint import Checkpoint, CheckpointFile
+from .readers import InputFormat, read_records
+from .compression import open_input
+from ..recipe import Recipe
+from ..recipe.executor import DEFAULT_BATCH_SIZE
+
+DEFAULT_CHECKPOINT_INTERVAL = 10.0
+
+def encode_results(results: List[tuple]) -> bytes:
+    """Encodes results of morphing as NDJSON, metadata and states are not written, records rejected by `where` clauses (None) are skipped"""
+    return "".join([json.dumps(x[0], ensure_ascii=False) + "\n" for x in results if x is not None]).encode("utf-8")
+
+def _commit(output_file: BinaryIO, checkpoint: Checkpoint, checkpoint_file: CheckpointFile):
+    #output is durable before the checkpoint which refers to it
+    output_file.flush()
+    os.fsync(output_file.fileno())
+    checkpoint.output_offset = output_file.tell()
+    checkpoint_file.save(checkpoint)
+
+def process_file(
+    input_path: str,
+    output_path: str,
+    recipe: Recipe,
+    checkpoint_path: str = None,
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    input_format: InputFormat = None,
+    with_projection: bool = False,
+    with_decompression_thread: bool = False
+) -> Checkpoint:
+    """Morphs records of NDJSON or JSON array file and writes results into NDJSON file.
+    Input compressed with gzip, bz2 or xz is decompressed while it's read (see `open_input`), offsets of checkpoints are offsets in decompressed content.
+
+    With `checkpoint_path` the position of the run is committed to the checkpoint file every `checkpoint_interval` seconds and at the end.
+    Run with the same input, output and recipe resumes from the last checkpoint: output is truncated to the committed size,
+    so results written after the checkpoint are not duplicated. Run which is already complete isn't repeated.
+
+    Args:
+        input_path (str): path of the input file
+        output_path (str): path of the output file
+        recipe (Recipe): recipe to morph records
+        checkpoint_path (str, optional): path of the checkpoint file. Defaults to None.
+        checkpoint_interval (float, optional): interval between checkpoints in seconds. Defaults to DEFAULT_CHECKPOINT_INTERVAL.
+        batch_size (int, optional): number of records morphed at once. Defaults to DEFAULT_BATCH_SIZE.
+        input_format (InputFormat, optional): format of the input, detected by its content if not provided. Defaults to None.
+        with_projection (bool, optional): if True NDJSON records are decoded only partially, source fields not read by the recipe
+            are skipped (see `Recipe.create_decoder`). Defaults to False.
+        with_decompression_thread (bool, optional): if True compressed input is decompressed in a background thread,
+            so decompression overlaps with morphing. Defaults to False.
+
+    Raises:
+        ValueError: checkpoint belongs to another run
+
+    Returns:
+        Checkpoint: final position of the run
+    """
+    stat = os.stat(input_path)
+    checkpoint = Checkpoint(
+        os.path.abspath(input_path),
+        os.path.abspath(output_path),
+        stat.st_size,
+        stat.st_mtime_ns,
+        recipe.fingerprint
+    )
+    checkpoint_file = None
+    if checkpoint_path:
+        checkpoint_file = CheckpointFile(checkpoint_path)
+        saved_checkpoint = checkpoint_file.load()
+        if saved_checkpoint is not None:
+            if not saved_checkpoint.is_same_run(checkpoint):
+                raise ValueError("Checkpoint {} belongs to another run (input, output or recipe differ)".format(checkpoint_path))
+            if saved_checkpoint.is_complete:
+                return saved_checkpoint
+            checkpoint = saved_checkpoint
+
+    is_resumed = checkpoint.input_offset > 0 and os.path.exists(output_path)
+    if not is_resumed:
+        checkpoint.input_offset = checkpoint.records = checkpoint.output_offset = 0
+    #stream of the decompression thread can't seek, resumed runs seek to the checkpoint by decompressing the input before it in this thread
+    input_file = open_input(input_path, with_decompression_thread=with_decompression_thread and not is_resumed)
+    with input_file, open(output_path, "r+b" if is_resumed else "wb") as output_file:
+        if is_resumed:
+            output_file.truncate(checkpoint.output_offset)
+            output_file.seek(checkpoint.output_offset)
+
+        decode = recipe.create_decoder() if with_projection else json.loads
+        records = read_records(input_file, checkpoint.input_offset, input_format, decode)
+        committed_at = time.monotonic()
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            output_file.write(encode_results(recipe.morph_batch([record for record, _ in batch])))
+            checkpoint.input_offset = batch[-1][1]
+            checkpoint.records += len(batch)
+            if checkpoint_file is not None and time.monotonic() - committed_at >= checkpoint_interval:
+                _commit(output_file, checkpoint, checkpoint_file)
+                committed_at = time.monotonic()
+
+        checkpoint.is_complete = True
+        if checkpoint_file is not None:
+            _commit(output_file, checkpoint, checkpoint_file)
+        else:
+            checkpoint.output_offset = output_file.tell()
+    return checkpoint
@@ -0,0 +1,155 @@
+import importlib
+import json
+import mmap
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List
+from .files import encode_results
+from .readers import InputFormat, detect_format, read_ndjson
+from .compression import Compression, detect_compression
+from ..recipe import Recipe
+from ..recipe.executor import DEFAULT_BATCH_SIZE
+
+@dataclass
+class Partition:
+    """Byte range of NDJSON input processed by one worker process.
+
+    `start` is the offset of the first line of the range, `end` is the offset right after its last line
+    `output_path` is the file with results of the range
+    `records` is the number of morphed records
+    """
+    start: int
+    end: int
+    output_path: str = None
+    records: int = 0
+
+def split_file(input_path: str, partitions: int) -> List[Partition]:
+    """Splits NDJSON file into byte ranges of similar size aligned to the beginnings of lines.
+    The file is memory-mapped and only bytes around the boundaries are scanned, nothing is decoded.
+
+    Args:
+        input_path (str): path of NDJSON file
+        partitions (int): maximum number of ranges, small files produce fewer ranges
+
+    Returns:
+        List[Partition]: non-empty ranges in the order of the file
+    """
+    size = os.path.getsize(input_path)
+    if not size:
+        return []
+    result = []
+    with open(input_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        start = 0
+        for i in range(1, partitions + 1):
+            end = size if i == partitions else max(size * i // partitions, start)
+            if end < size:
+                #boundary is moved right after the end of the line it falls into
+                newline = mm.find(b"\n", end)
+                end = size if newline < 0 else newline + 1
+            if end > start:
+                result.append(Partition(start, end))
+            start = end
+            if start >= size:
+                break
+    return result
+
+#Recipe compiled in the worker process
+_worker_recipe: Recipe = None
+_worker_decode: Callable[[bytes], Any] = json.loads
+
+def _init_worker(recipe_str: str, recipe_options: dict, imports: Iterable[str], with_projection: bool = False):
+    global _worker_recipe, _worker_decode
+    #modules are imported to register functions used by the recipe
+    for module in imports:
+        importlib.import_module(module)
+    from ..morpher import create_recipe
+    _worker_recipe = create_recipe(recipe_str=recipe_str, **recipe_options)
+    if with_projection:
+        _worker_decode = _worker_recipe.create_decoder()
+
+def _morph_partition(input_path: str, partition: Partition, batch_size: int) -> Partition:
+    #the range is read and decoded in the worker, so records are never pickled between processes
+    with open(input_path, "rb") as input_file, open(partition.output_path, "wb") as output_file:
+        batch = []
+        for record, _ in read_ndjson(input_file, partition.start, partition.end, _worker_decode):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                output_file.write(encode_results(_worker_recipe.morph_batch(batch)))
+                partition.records += len(batch)
+                batch = []
+        if batch:
+            output_file.write(encode_results(_worker_recipe.morph_batch(batch)))
+            partition.records += len(batch)
+    return partition
+
+def _concatenate(partitions: List[Partition], output_path: str):
+    with open(output_path, "wb") as output_file:
+        for partition in partitions:
+            with open(partition.output_path, "rb") as f:
+                shutil.copyfileobj(f, output_file)
+            os.remove(partition.output_path)
+
+def process_file_partitioned(
+    input_path: str,
+    output_path: str,
+    recipe_str: str,
+    recipe_options: dict = None,
+    workers: int = None,
+    partitions: int = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    imports: Iterable[str] = (),
+    merge: bool = True,
+    with_projection: bool = False
+) -> List[Partition]:
+    """Morphs records of a large NDJSON file in parallel worker processes and writes results into NDJSON file.
+
+    The file is split into byte ranges aligned to lines (see `split_file`). Every worker compiles the recipe from `recipe_str`,
+    reads its range directly from the file and writes results into its own part file `<output_path>.<index>`.
+    Results of all ranges are written in the order of the input records.
+
+    Args:
+        input_path (str): path of NDJSON file
+        output_path (str): path of the output file
+        recipe_str (str): text of the recipe, compiled in every worker
+        recipe_options (dict, optional): keyword arguments of `create_recipe` (e.g. source_fields_stategy). Defaults to None.
+        workers (int, optional): number of worker processes. Defaults to the number of CPUs.
+        partitions (int, optional): number of byte ranges. Defaults to the number of workers.
+        batch_size (int, optional): number of records morphed at once. Defaults to DEFAULT_BATCH_SIZE.
+        imports (Iterable[str], optional): modules imported in workers to register functions used by the recipe. Defaults to ().
+        merge (bool, optional): if True part files are concatenated into `output_path` and removed,
+            otherwise part files are left as they are. Defaults to True.
+        with_projection (bool, optional): if True records are decoded only partially, source fields not read by the recipe
+            are skipped (see `Recipe.create_decoder`). Defaults to False.
+
+    Raises:
+        ValueError: input is a JSON array or it's compressed (it can be processed by `process_file`)
+
+    Returns:
+        List[Partition]: processed ranges in the order of the file
+    """
+    with open(input_path, "rb") as f:
+        #compressed input can't be split into byte ranges without decompressing it
+        if detect_compression(f, input_path) != Compression.NONE:
+            raise ValueError("Compressed input can't be split into partitions")
+        if detect_format(f) != InputFormat.NDJSON:
+            raise ValueError("Only NDJSON input can be split into partitions")
+    from ..morpher import create_recipe
+    #recipe is compiled in this process too, so errors in the recipe are raised before starting workers
+    create_recipe(recipe_str=recipe_str, **(recipe_options or {}))
+    workers = workers or os.cpu_count() or 1
+    result = split_file(input_path, partitions or workers)
+    for index, partition in enumerate(result):
+        partition.output_path = "{}.{:05d}".format(output_path, index)
+
+    initargs = (recipe_str, recipe_options or {}, tuple(imports), with_projection)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+        futures = [pool.submit(_morph_partition, input_path, partition, batch_size) for partition in result]
+        result = [future.result() for future in futures]
+
+    if merge:
+        _concatenate(result, output_path)
+        for partition in result:
+            partition.output_path = output_path
+    return result
@@ -0,0 +1,176 @@
+import codecs
+import json
+import re
+from enum import Enum
+from typing import Any, BinaryIO, Callable, Iterator, Optional
+
+#Records are read either from NDJSON (one JSON object per line) or from a JSON array of objects
+InputFormat = Enum("InputFormat", ["NDJSON", "JSON_ARRAY"])
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+_WHITESPACE = b" \t\r\n"
+_SPACES_RE = re.compile(r"[ \t\r\n]*")
+_DELIMITERS_RE = re.compile(r"[ \t\r\n,]*")
+
+def detect_format(f: BinaryIO) -> InputFormat:
+    """Detects the format by the first non-whitespace byte of the file, the position of the file is not changed
+
+    Args:
+        f (BinaryIO): file opened in binary mode, streams which can't seek (e.g. stdin) should support `peek`
+
+    Returns:
+        InputFormat: JSON_ARRAY if the file starts with "[", NDJSON otherwise
+    """
+    #buffered beginning is checked without reading it, so streams which can't go back (stdin, decompressed stdin) are supported
+    peek = getattr(f, "peek", None)
+    if peek is not None:
+        stripped = peek(4096).lstrip(_WHITESPACE)
+        if stripped or not f.seekable():
+            return InputFormat.JSON_ARRAY if stripped[:1] == b"[" else InputFormat.NDJSON
+    position = f.tell()
+    try:
+        while True:
+            chunk = f.read(4096)
+            if not chunk:
+                return InputFormat.NDJSON
+            stripped = chunk.lstrip(_WHITESPACE)
+            if stripped:
+                return InputFormat.JSON_ARRAY if stripped[:1] == b"[" else InputFormat.NDJSON
+    finally:
+        f.seek(position)
+
+def read_ndjson(
+    f: BinaryIO,
+    start: int = 0,
+    end: Optional[int] = None,
+    decode: Callable[[bytes], Any] = json.loads
+) -> Iterator[tuple[dict, int]]:
+    """Reads records from NDJSON file starting from the byte offset `start`, which should be the beginning of a line
+
+    Args:
+        f (BinaryIO): file opened in binary mode
+        start (int, optional): offset to start from. Defaults to 0.
+        end (Optional[int], optional): offset to stop at, the line which starts before it is read till its end. Defaults to None.
+        decode (Callable[[bytes], Any], optional): decoder of lines (e.g. `Recipe.create_decoder`). Defaults to json.loads.
+
+    Raises:
+        ValueError: line isn't a valid JSON
+
+    Yields:
+        Iterator[tuple[dict, int]]: record and the offset right after its line
+    """
+    if start:
+        f.seek(start)
+    offset = start
+    for line in f:
+        if end is not None and offset >= end:
+            break
+        offset += len(line)
+        if line.isspace():
+            continue
+        try:
+            record = decode(line)
+        except ValueError as e:
+            e.add_note("Error in parsing line ending at byte {}".format(offset))
+            raise
+        yield record, offset
+
+def read_json_array(f: BinaryIO, start: int = 0, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[tuple[dict, int]]:
+    """Reads records from JSON array incrementally, so the whole array is never loaded into memory.
+    Reading can be resumed from the offset of any record returned before.
+
+    Args:
+        f (BinaryIO): file opened in binary mode
+        start (int, optional): offset right after one of the records or 0. Defaults to 0.
+        chunk_size (int, optional): size of chunks to read. Defaults to DEFAULT_CHUNK_SIZE.
+
+    Raises:
+        ValueError: file isn't a valid JSON array
+
+    Yields:
+        Iterator[tuple[dict, int]]: record and the offset right after it
+    """
+    decode = json.JSONDecoder().raw_decode
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    if start:
+        f.seek(start)
+    #text of the buffer before `position` is already processed, `offset` is the byte offset of `position`
+    buffer = ""
+    position = 0
+    offset = start
+    is_eof = False
+
+    def fill(size: int = chunk_size) -> bool:
+        nonlocal buffer, position, is_eof
+        if is_eof:
+            return False
+        chunk = f.read(size)
+        is_eof = not chunk
+        buffer = buffer[position:] + utf8.decode(chunk, final=is_eof)
+        position = 0
+        return not is_eof
+
+    def skip(pattern: re.Pattern) -> Optional[str]:
+        #skips matching symbols and returns the next one (None at the end of the file)
+        nonlocal position, offset
+        while True:
+            end = pattern.match(buffer, position).end()
+            #skipped symbols are ASCII, so their number is the number of bytes
+            offset += end - position
+            position = end
+            if position < len(buffer):
+                return buffer[position]
+            if not fill():
+                return None
+
+    if not start:
+        if skip(_SPACES_RE) != "[":
+            raise ValueError("JSON array should start with '['")
+        position += 1
+        offset += 1
+
+    while True:
+        symbol = skip(_DELIMITERS_RE)
+        if symbol is None:
+            raise ValueError("JSON array isn't closed")
+        if symbol == "]":
+            return
+        #value larger than the chunk is read in growing chunks, so it isn't decoded again for every small chunk
+        read_size = chunk_size
+        while True:
+            try:
+                record, end = decode(buffer, position)
+                #value at the very end of the buffer may be incomplete unless it ends with a closing symbol
+                if end < len(buffer) or is_eof or buffer[end - 1] in "}]\"":
+                    break
+            except ValueError:
+                if is_eof:
+                    raise
+            fill(read_size)
+            read_size *= 2
+        offset += len(buffer[position:end].encode("utf-8"))
+        position = end
+        yield record, offset
+
+def read_records(
+    f: BinaryIO,
+    start: int = 0,
+    input_format: InputFormat = None,
+    decode: Callable[[bytes], Any] = json.loads
+) -> Iterator[tuple[dict, int]]:
+    """Reads records from NDJSON or JSON array (see `read_ndjson` and `read_json_array`)
+
+    Args:
+        f (BinaryIO): file opened in binary mode
+        start (int, optional): offset to start from. Defaults to 0.
+        input_format (InputFormat, optional): format of the file, detected by its content if not provided. Defaults to None.
+        decode (Callable[[bytes], Any], optional): decoder of NDJSON lines, records of JSON array are always decoded by json. Defaults to json.loads.
+
+    Yields:
+        Iterator[tuple[dict, int]]: record and the offset right after it
+    """
+    if input_format is None:
+        input_format = detect_format(f)
+    if input_format == InputFormat.JSON_ARRAY:
+        return read_json_array(f, start)
+    return read_ndjson(f, start, decode=decode)
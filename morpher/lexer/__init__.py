@@ -1 +1 @@
-from .lexer import Lexer, Token, Dot, Part
\ No newline at end of file
+from .lexer import Lexer, Token, Dot, Part, Line, DOT
\ No newline at end of file
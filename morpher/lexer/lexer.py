@@ -1,15 +1,20 @@
+import re
 from typing import List
 
 COMMENTS_STARTER = "--"
 CONTINUATION_SYMBOL = "\t"
 PARTS_SPLITTER = " . "
 TOKENS_SPLITTER = " "
+#Line of `where` clause is a single part, its operands may be JSON strings in double quotes with spaces and " . " inside
+FILTER_STARTER = "where"
+FILTER_TOKENS_RE = re.compile(r'"(?:[^"\\]|\\.)*"|\S+')
 
 PARTS_SPLITTER_TOKEN = "DOT"
 
 class Token:
     """Base class for tokens
     """ 
+    __slots__ = ("token",)
 
     def __init__(self, s: str):
         self.token = s 
@@ -24,6 +29,8 @@ class Dot(Token):
     """Class for "."-token, which is a delimiter between commands
     """
 
+    __slots__ = ()
+
     def __init__(self):
         super().__init__(PARTS_SPLITTER_TOKEN)
     
@@ -33,6 +40,7 @@ class Dot(Token):
 class Part:
     """ Class for representing a single command - combination of Tokens
     """
+    __slots__ = ("tokens",)
 
     def __init__(self, tokens: List[Token]):
         self.tokens = tokens
@@ -44,6 +52,20 @@ class Part:
         tokens_str = ", ".join(map(str, self.tokens))
         return "PART: [{}]".format(tokens_str)
 
+class Line(list):
+    """Tokens of a single line of the recipe (together with its continuation lines).
+    Line remembers its number and text in the recipe, so instructions can be traced back to the source (see `Recipe.explain`)
+    """
+    __slots__ = ("number", "text")
+
+    def __init__(self, number: int = None, text: str = None):
+        super().__init__()
+        self.number = number
+        self.text = text
+
+#Dot carries no state, so a single instance is shared by all parts
+DOT = Dot()
+
 class Lexer:
     """ Lexer class.
     It's capable of tokenizing an input string 
@@ -53,6 +75,8 @@ class Lexer:
         """Tokenizes an input string and returns a list of tokens.
         During tokenization it removes all empty strings and all comments (see COMMENTS_STARTER constant).
         Line break can be treated as a continuation of the previous command if it starts with a special symbol (see CONTINUATION_SYMBOL constant)
+        Line of `where` clause (see FILTER_STARTER constant) is a single part, where tokens in double quotes may contain spaces
+        Tokenization is done in a single pass over the lines, so it's linear in the size of the input string.
 
         Args:
             s (str): input string
@@ -61,51 +85,51 @@ class Lexer:
             e: Any error during lexing
 
         Returns:
-            List[Part]: list, containing `Part` objects (which are list of `Token` objects internaly) separated by `Dot` objects
+            List[Part]: list of `Line` objects, containing `Part` objects (which are list of `Token` objects internaly) separated by `Dot` objects
         """        
         #accumulator of results
         result = []
 
-        #buffer to remember tokens from the previous line in case we encounter continuation after the line break
-        prev_line_tokens = []
+        #tokens of the last added line; continuation lines are appended to it in place
+        line_tokens = None
 
         #line by line
-        for i, line in enumerate(s.splitlines()):
+        for number, line in enumerate(s.splitlines(), 1):
             try:
-                line_tokens = []
+                stripped = line.strip()
 
-                # Skip empty lines
-                if len(line.strip()) == 0:
-                    continue
-                
-                # Skip any string with comments
-                if line.lstrip().startswith(COMMENTS_STARTER):
+                # Skip empty lines and any string with comments
+                if not stripped or stripped.startswith(COMMENTS_STARTER):
                     continue
 
                 # If line begins with CONTINUATION_SYMBOL, then continue list of tokens from the previous line
-                if line.startswith(CONTINUATION_SYMBOL):
-                    line_tokens = prev_line_tokens
-                    result.pop(-1) #remove last element from the result because we are continuing it
-                    # In case there was no PARTS_SPLITTER token in the end of previous line we add it
-                    if line_tokens[-1] != PARTS_SPLITTER:
-                        line_tokens.append(Dot())
-                
-                parts = line.split(PARTS_SPLITTER)
-                for p in parts:
+                # (the previous line always ends with a Dot, so there is no need to add one)
+                if line.startswith(CONTINUATION_SYMBOL) and line_tokens is not None:
+                    tokens_to_extend = line_tokens
+                    tokens_to_extend.text += "\n" + line
+                else:
+                    tokens_to_extend = Line(number, line)
+                    result.append(tokens_to_extend) # adding all parts from this line to the results
+
+                if stripped.split(TOKENS_SPLITTER, 1)[0] == FILTER_STARTER:
+                    tokens_to_extend.append(Part([Token(x) for x in FILTER_TOKENS_RE.findall(stripped)]))
+                    tokens_to_extend.append(DOT)
+                    line_tokens = tokens_to_extend
+                    continue
+
+                for p in line.split(PARTS_SPLITTER):
                     p_stripped = p.strip()
                     
                     # in case of consecutive PARTS_SPLITTER without any tokens in between we just ignore it
-                    if len(p_stripped) == 0:
+                    if not p_stripped:
                         continue
 
                     # splitting a string between two PARTS_SPLITTER into separate tokens by TOKENS_SPLITTER
-                    tokens = [Token(x) for x in p_stripped.split(TOKENS_SPLITTER)]
-                    part = Part(tokens) # all tokens between two PARTS_SPLITTER is a single Part
-                    line_tokens.append(part)
-                    line_tokens.append(Dot()) # adding a Dot as a separator of parts
+                    # all tokens between two PARTS_SPLITTER is a single Part
+                    tokens_to_extend.append(Part([Token(x) for x in p_stripped.split(TOKENS_SPLITTER)]))
+                    tokens_to_extend.append(DOT) # adding a Dot as a separator of parts
 
-                result.append(line_tokens) # adding all parts from this line to the results
-                prev_line_tokens = line_tokens # remembering this line in case of continuation in the next line
+                line_tokens = tokens_to_extend # remembering this line in case of continuation in the next line
             except Exception as e:
                 e.add_note("Error in lexing line: {}".format(line))
                 raise
@@ -1,7 +1,9 @@
 import json
-from typing import Callable
-from .recipe import SourceFieldStrategy, Recipe
+from typing import Callable, Iterable, Iterator, Optional
+from .recipe import SourceFieldStrategy, Recipe, Executor, ExecutionMode, ReloadableRecipe, ResultCache, CachedRecipe, Metrics
 from .recipe.state import MorphState
+from .files import Checkpoint, InputFormat, Partition, process_file, process_file_partitioned, open_input
+from .transport import SharedMemoryExecutor
 from .lexer import Lexer
 from .morpher_parser import Parser
 
@@ -12,14 +14,16 @@ def morph(
     recipe_str: str = None, 
     recipe_path: str = None, 
     source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
-    with_source_fields_timestamp_cast: bool = False
-) -> tuple[dict, dict, MorphState] :
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False
+) -> Optional[tuple[dict, dict, MorphState]] :
     _source_dict = None 
     if source_dict:
         _source_dict = source_dict
     elif source_json_path:
-        with open(source_json_path) as f:
-            s = json.loads(f.read())
+        #compressed files (e.g. `.json.gz`) are decompressed while they are read
+        with open_input(source_json_path) as f:
+            s = json.load(f)
         _source_dict = s 
     else:
         print("Either source_dict or source_json_path should be provided!")
@@ -38,7 +42,8 @@ def morph(
         instructions = Parser().parse(tokens)
         _recipe = Recipe(
             source_fields_stategy=source_fields_stategy, 
-            with_source_fields_timestamp_cast=with_source_fields_timestamp_cast
+            with_source_fields_timestamp_cast=with_source_fields_timestamp_cast,
+            with_memory_bounded_state=with_memory_bounded_state
         ).translate(instructions)
 
     return _recipe.morph(_source_dict)
@@ -48,7 +53,8 @@ def create_morph(
     recipe_str: str = None, 
     recipe_path: str = None, 
     source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
-    with_source_fields_timestamp_cast: bool = False
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False
 ) -> Callable[[dict], tuple[dict, dict, MorphState]]:
     def f(
         source_dict: dict
@@ -59,7 +65,8 @@ def create_morph(
             recipe_str=recipe_str, 
             recipe_path=recipe_path, 
             source_fields_stategy=source_fields_stategy, 
-            with_source_fields_timestamp_cast=with_source_fields_timestamp_cast
+            with_source_fields_timestamp_cast=with_source_fields_timestamp_cast,
+            with_memory_bounded_state=with_memory_bounded_state
         )
 
     return f
@@ -69,7 +76,11 @@ def create_recipe(
     recipe_str: str = None, 
     recipe_path: str = None, 
     source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
-    with_source_fields_timestamp_cast: bool = False
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False,
+    metrics: Metrics = None,
+    with_type_specialization: bool = False,
+    with_state_pooling: bool = False
 ):
     _recipe = None 
     _recipe_str = recipe_str
@@ -84,6 +95,202 @@ def create_recipe(
         instructions = Parser().parse(tokens)
         _recipe = Recipe(
             source_fields_stategy=source_fields_stategy, 
-            with_source_fields_timestamp_cast=with_source_fields_timestamp_cast
+            with_source_fields_timestamp_cast=with_source_fields_timestamp_cast,
+            with_memory_bounded_state=with_memory_bounded_state,
+            metrics=metrics,
+            with_type_specialization=with_type_specialization,
+            with_state_pooling=with_state_pooling
         ).translate(instructions)
-    return _recipe
\ No newline at end of file
+    return _recipe
+
+def create_reloadable_recipe(
+    recipe_path: str,
+    source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False,
+    poll_interval: float = None,
+    watch: bool = True,
+    metrics: Metrics = None,
+    with_type_specialization: bool = False,
+    with_state_pooling: bool = False
+) -> ReloadableRecipe:
+    kwargs = {}
+    if poll_interval:
+        kwargs["poll_interval"] = poll_interval
+    _recipe = ReloadableRecipe(
+        recipe_path, 
+        source_fields_stategy=source_fields_stategy, 
+        with_source_fields_timestamp_cast=with_source_fields_timestamp_cast,
+        with_memory_bounded_state=with_memory_bounded_state,
+        metrics=metrics,
+        with_type_specialization=with_type_specialization,
+        with_state_pooling=with_state_pooling,
+        **kwargs
+    )
+    if watch:
+        _recipe.start()
+    return _recipe
+
+def morph_many(
+    source_dicts: Iterable[dict],
+    recipe: Recipe | ReloadableRecipe = None, 
+    recipe_str: str = None, 
+    recipe_path: str = None, 
+    source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False,
+    mode: ExecutionMode = ExecutionMode.SEQUENTIAL,
+    workers: int = None,
+    batch_size: int = None,
+    result_cache: ResultCache = None,
+    metrics: Metrics = None,
+    with_type_specialization: bool = False,
+    with_state_pooling: bool = False
+) -> Iterator[tuple[dict, dict, MorphState]]:
+    _recipe = create_recipe(
+        recipe=recipe, 
+        recipe_str=recipe_str, 
+        recipe_path=recipe_path, 
+        source_fields_stategy=source_fields_stategy, 
+        with_source_fields_timestamp_cast=with_source_fields_timestamp_cast,
+        with_memory_bounded_state=with_memory_bounded_state,
+        metrics=metrics,
+        with_type_specialization=with_type_specialization,
+        with_state_pooling=with_state_pooling
+    )
+    if result_cache is not None:
+        #duplicate records are not morphed again, their state is None
+        _recipe = CachedRecipe(_recipe, result_cache)
+    executor_kwargs = {"mode": mode, "workers": workers}
+    if batch_size:
+        executor_kwargs["batch_size"] = batch_size
+    with Executor(_recipe, **executor_kwargs) as executor:
+        yield from executor.map(source_dicts)
+
+def morph_many_parallel(
+    source_dicts: Iterable[dict],
+    recipe_str: str = None, 
+    recipe_path: str = None, 
+    source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False,
+    with_type_specialization: bool = False,
+    with_state_pooling: bool = False,
+    workers: int = None,
+    batch_size: int = None,
+    imports: Iterable[str] = ()
+) -> Iterator[tuple[dict, dict, None]]:
+    _recipe_str = recipe_str
+    if recipe_path:
+        with open(recipe_path) as f:
+            _recipe_str = f.read()
+    if not _recipe_str:
+        print("Either recipe_str or recipe_path should be provided!")
+        raise ValueError
+
+    recipe_options = {
+        "source_fields_stategy": source_fields_stategy,
+        "with_source_fields_timestamp_cast": with_source_fields_timestamp_cast,
+        "with_memory_bounded_state": with_memory_bounded_state,
+        "with_type_specialization": with_type_specialization,
+        "with_state_pooling": with_state_pooling
+    }
+    kwargs = {}
+    if batch_size:
+        kwargs["batch_size"] = batch_size
+    with SharedMemoryExecutor(_recipe_str, recipe_options=recipe_options, workers=workers, imports=imports, **kwargs) as executor:
+        yield from executor.map(source_dicts)
+
+def morph_file(
+    input_path: str,
+    output_path: str,
+    recipe: Recipe = None, 
+    recipe_str: str = None, 
+    recipe_path: str = None, 
+    source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False,
+    checkpoint_path: str = None,
+    checkpoint_interval: float = None,
+    batch_size: int = None,
+    input_format: InputFormat = None,
+    metrics: Metrics = None,
+    with_type_specialization: bool = False,
+    with_state_pooling: bool = False,
+    with_projection: bool = False,
+    with_decompression_thread: bool = False
+) -> Checkpoint:
+    _recipe = create_recipe(
+        recipe=recipe, 
+        recipe_str=recipe_str, 
+        recipe_path=recipe_path, 
+        source_fields_stategy=source_fields_stategy, 
+        with_source_fields_timestamp_cast=with_source_fields_timestamp_cast,
+        with_memory_bounded_state=with_memory_bounded_state,
+        metrics=metrics,
+        with_type_specialization=with_type_specialization,
+        with_state_pooling=with_state_pooling
+    )
+    kwargs = {}
+    if checkpoint_interval is not None:
+        kwargs["checkpoint_interval"] = checkpoint_interval
+    if batch_size:
+        kwargs["batch_size"] = batch_size
+    return process_file(
+        input_path, 
+        output_path, 
+        _recipe, 
+        checkpoint_path=checkpoint_path, 
+        input_format=input_format, 
+        with_projection=with_projection, 
+        with_decompression_thread=with_decompression_thread, 
+        **kwargs
+    )
+
+def morph_file_parallel(
+    input_path: str,
+    output_path: str,
+    recipe_str: str = None, 
+    recipe_path: str = None, 
+    source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
+    with_source_fields_timestamp_cast: bool = False,
+    with_memory_bounded_state: bool = False,
+    with_type_specialization: bool = False,
+    with_state_pooling: bool = False,
+    workers: int = None,
+    partitions: int = None,
+    batch_size: int = None,
+    imports: Iterable[str] = (),
+    merge: bool = True,
+    with_projection: bool = False
+) -> list[Partition]:
+    _recipe_str = recipe_str
+    if recipe_path:
+        with open(recipe_path) as f:
+            _recipe_str = f.read()
+    if not _recipe_str:
+        print("Either recipe_str or recipe_path should be provided!")
+        raise ValueError
+
+    recipe_options = {
+        "source_fields_stategy": source_fields_stategy,
+        "with_source_fields_timestamp_cast": with_source_fields_timestamp_cast,
+        "with_memory_bounded_state": with_memory_bounded_state,
+        "with_type_specialization": with_type_specialization,
+        "with_state_pooling": with_state_pooling
+    }
+    kwargs = {}
+    if batch_size:
+        kwargs["batch_size"] = batch_size
+    return process_file_partitioned(
+        input_path, 
+        output_path, 
+        _recipe_str, 
+        recipe_options=recipe_options, 
+        workers=workers, 
+        partitions=partitions, 
+        imports=imports, 
+        merge=merge, 
+        with_projection=with_projection, 
+        **kwargs
+    )
\ No newline at end of file
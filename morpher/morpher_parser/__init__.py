@@ -1,2 +1,2 @@
-from .morpher_parser import Parser, Instruction, Operation, Input, Pointer, Transformation, Naming, Casting 
-from .morpher_parser import InputOperation, PointerOperation, TransformationOperation, NamingOperation, CastingOperation
\ No newline at end of file
+from .morpher_parser import Parser, Instruction, Operation, Input, Pointer, Transformation, Naming, Casting, Filter
+from .morpher_parser import InputOperation, PointerOperation, TransformationOperation, NamingOperation, CastingOperation, FilterOperation
\ No newline at end of file
@@ -1,13 +1,15 @@
 from enum import Enum 
 from typing import List, Optional, Self
-from ..lexer import Token, Dot, Part
+from ..lexer import Token, Dot, Part, DOT
 
 #Enums for every operation divided by type of operations
 Input = Enum("Input", ["TAKE", "DROP"])
 Pointer = Enum("Pointer", ["FULL", "PARTIAL", "FIRST", "LAST", "NTH"])
-Transformation = Enum("Transformation", ["ID", "EXTRACT", "FLATTEN", "APPLY", "LOWER", "UPPER"])
+Transformation = Enum("Transformation", ["ID", "EXTRACT", "FLATTEN", "APPLY", "LOWER", "UPPER", "MAP"])
 Naming = Enum("Naming", ["ALIAS", "PREFIX", "SUFFIX", "SPLIT"])
 Casting = Enum("Casting", ["CAST", "SAFE_CAST", "DEFAULT_CAST"])
+#`where` clause isn't a part of the cycle of operations: it's the only operation of its instruction
+Filter = Enum("Filter", ["WHERE"])
 
 #Dictionary to map operation literal to the exact type of operation (exact enum)
 operation_to_enum = {
@@ -26,6 +28,7 @@ operation_to_enum = {
     "!apply": Transformation.APPLY,
     "!lower": Transformation.LOWER,
     "!upper": Transformation.UPPER,
+    "!map": Transformation.MAP,
     "@": Naming.ALIAS,
     "@alias": Naming.ALIAS,
     "@prefix": Naming.PREFIX,
@@ -34,9 +37,19 @@ operation_to_enum = {
     "^": Casting.CAST,
     "^cast": Casting.CAST,
     "^safe_cast": Casting.SAFE_CAST,
-    "^default_cast": Casting.DEFAULT_CAST
+    "^default_cast": Casting.DEFAULT_CAST,
+    "where": Filter.WHERE
 }
 
+#Dictionary to map the exact type of operation to its full literal (e.g. `#full` for `#`)
+enum_to_operation = {v: k for k, v in operation_to_enum.items()}
+
+#Delimiter of operations applied by `!map` to every element of the list, e.g. `!map #partial id url | !lower | ^ string`
+MAP_SPLITTER = "|"
+
+#Operations which can't be applied to a single element: they need the whole instruction or produce values for `@split`
+map_forbidden_operations = {Transformation.FLATTEN, Transformation.MAP}
+
 #Dictionart to map operation type name to the default operation (enum) for this type
 operation_type_to_default_command = {
     "Pointer": Pointer.FULL,
@@ -49,11 +62,24 @@ class Operation:
         self.operation = operation
         self.args = args[0] 
         self.operation_type = operation.__class__.__name__
+        #operation wasn't written in the recipe, but was added by the parser to fill the gap in the cycle of operations
+        self.is_default = False
 
     def __repr__(self):
         args = ", ".join(map(str, self.args))
         return "{} op: {} {}".format(self.operation_type, self.operation, args)
 
+    def to_recipe(self) -> str:
+        """Returns the operation as it would be written in the recipe
+
+        Returns:
+            str: literal of the operation with its arguments
+        """
+        args = self.args[0] if self.args else []
+        if self.operation == Transformation.MAP:
+            return " ".join([enum_to_operation[self.operation], " {} ".format(MAP_SPLITTER).join(op.to_recipe() for op in args)])
+        return " ".join([enum_to_operation[self.operation], *map(str, args)])
+
 class InputOperation(Operation):
     def __init__(self, operation: Input, *args: List):
         super().__init__(operation, *args)
@@ -94,6 +120,24 @@ class CastingOperation(Operation):
     def new(cls, operation: Input, *args: List) -> Self:
         return cls(operation, args)
 
+class FilterOperation(Operation):
+    def __init__(self, operation: Filter, *args: List):
+        super().__init__(operation, *args)
+
+    @classmethod
+    def new(cls, operation: Filter, *args: List) -> Self:
+        return cls(operation, args)
+
+#Dictionary to map enum class of the operation to the corresponding Operation subclass
+operation_enum_to_class = {
+    Input: InputOperation,
+    Pointer: PointerOperation,
+    Transformation: TransformationOperation,
+    Naming: NamingOperation,
+    Casting: CastingOperation,
+    Filter: FilterOperation
+}
+
 class OperationFactory:
     """ Factory class to instantiate Operations
     """
@@ -117,20 +161,49 @@ class OperationFactory:
         if not operation:
             raise ValueError("Can't instantiate default operation for type name {}".format(operation_type))
 
-        if isinstance(operation, Input):
-            operation_object = InputOperation.new(operation)
-        elif isinstance(operation, Pointer):
-            operation_object = PointerOperation.new(operation)
-        elif isinstance(operation, Transformation):
-            operation_object = TransformationOperation.new(operation)
-        elif isinstance(operation, Naming):
-            operation_object = NamingOperation.new(operation)
-        elif isinstance(operation, Casting):
-            operation_object = CastingOperation.new(operation)
-        else:
+        operation_class = operation_enum_to_class.get(operation.__class__, None)
+        if operation_class is None:
             raise ValueError("Unknown operation class for {} - no corresponding Operation subclass".format(operation))
 
-        return operation_object
+        default_operation = operation_class.new(operation)
+        default_operation.is_default = True
+        return default_operation
+
+    @staticmethod
+    def map_operations(args: List[str]) -> List[Operation]:
+        """Instantiate operations applied by `!map` to every element of the list.
+        Operations are separated by MAP_SPLITTER, only Pointer, Transformation and Casting operations are allowed and Casting can be only the last one.
+
+        Args:
+            args (List[str]): arguments of `!map`
+
+        Raises:
+            ValueError: no operations, unknown or forbidden operation, Casting operation is not the last one
+
+        Returns:
+            List[Operation]: operations in the order of application
+        """
+        groups = [[]]
+        for arg in args:
+            if arg == MAP_SPLITTER:
+                groups.append([])
+            else:
+                groups[-1].append(arg)
+
+        operations = []
+        for group in groups:
+            if not group:
+                raise ValueError("Empty operation in `!map {}`".format(" ".join(args)))
+            operation = operation_to_enum.get(group[0], None)
+            if not operation:
+                raise ValueError("Can't instantiate an operation for the token '{}' in `!map`".format(group[0]))
+            if isinstance(operation, (Input, Naming, Filter)) or operation in map_forbidden_operations:
+                raise ValueError("Operation '{}' can't be used in `!map`".format(group[0]))
+            if operations and isinstance(operations[-1].operation, Casting):
+                raise ValueError("Casting operation should be the last one in `!map`")
+            operation_class = operation_enum_to_class[operation.__class__]
+            operations.append(operation_class.new(operation, group[1:]))
+        return operations
 
     @staticmethod
     def from_token(token: Token) -> Optional[Operation]:
@@ -140,28 +213,24 @@ class OperationFactory:
 
         elif isinstance(token, Part):
             #first token in a Part defines an operation
-            operation = operation_to_enum.get(token[0](), None)
+            tokens = token.tokens
+            operation = operation_to_enum.get(tokens[0].token, None)
             if not operation:
                 raise ValueError("Can't instantiate an operation for the token '{}'".format(token))
             
             #all other tokens in a Part are arguments for this operation
-            args = list(map(lambda x: x(), token[1:]))
+            args = [x.token for x in tokens[1:]]
+
+            #arguments of `!map` are operations themselves
+            if operation == Transformation.MAP:
+                args = OperationFactory.map_operations(args)
 
             #instantiating and providing arguments
-            if isinstance(operation, Input):
-                operation_object = InputOperation.new(operation, args)
-            elif isinstance(operation, Pointer):
-                operation_object = PointerOperation.new(operation, args)
-            elif isinstance(operation, Transformation):
-                operation_object = TransformationOperation.new(operation, args)
-            elif isinstance(operation, Naming):
-                operation_object = NamingOperation.new(operation, args)
-            elif isinstance(operation, Casting):
-                operation_object = CastingOperation.new(operation, args)
-            else:
+            operation_class = operation_enum_to_class.get(operation.__class__, None)
+            if operation_class is None:
                 raise ValueError("Unknown operation class for {} - no corresponding Operation subclass".format(operation))
 
-            return operation_object 
+            return operation_class.new(operation, args)
 
         #no need to instantiate any operation for any other Token class
         elif isinstance(token, Token):
@@ -173,10 +242,14 @@ class Instruction:
     - 1 Input operation
     - 0-N Pointer/Transformation/Naming operations
     - 0-1 Casting operation
+    or a single Filter operation (`where` clause), which selects records to morph.
     It's a list of Operations under the hood.
     """
-    def __init__(self, operations) -> None:
+    def __init__(self, operations, line: int = None, text: str = None) -> None:
         self.operations = operations
+        #position of the instruction in the recipe, unknown for instructions which are not parsed from the recipe
+        self.line = line
+        self.text = text
 
     def __getitem__(self, i) -> Operation:
         return self.operations[i]
@@ -193,6 +266,33 @@ class Parser:
     # Operations in a particular instruction should follow a pattern
     # Each Instruction should start from `Input` Operation and be followed by other operations as present in this list (maybe repeating the cycle more than once)
     operation_order = ["Input", "Pointer", "Transformation", "Naming", "Casting"]
+
+    @classmethod
+    def _build_fill_table(cls) -> dict[tuple[str, str], tuple[str, ...]]:
+        """Precomputes the types of operations to fill the gaps for every pair of previous and current operation types.
+
+        Rules to fill the gap:
+        - If current operation is more to the right of the previous then we add all operations between them
+        - If current operation is more to the left of the previous then we are moving in the cycle and adding operations until we encounter current operation
+        - If current operation is the same as previous, then we will ad the full cycle of operations
+        - In the end we remove all Input and Casting operations, because there should be only one such operation in every instruction
+        - Nothing is filled if current operation is the first in the order
+
+        Returns:
+            dict[tuple[str, str], tuple[str, ...]]: transition table with pairs of operation types as keys
+        """
+        order = cls.operation_order
+        table = {}
+        for prev_operation_idx, prev_operation_type in enumerate(order):
+            for curr_operation_idx, curr_operation_type in enumerate(order):
+                if curr_operation_idx == 0:
+                    operation_to_fill = []
+                elif curr_operation_idx > prev_operation_idx:
+                    operation_to_fill = order[prev_operation_idx+1:curr_operation_idx]
+                else:
+                    operation_to_fill = order[prev_operation_idx+1:] + order[:curr_operation_idx]
+                table[(prev_operation_type, curr_operation_type)] = tuple(x for x in operation_to_fill if x not in ["Input", "Casting"])
+        return table
     
     def _fill_operations(self, prev_operation_type: str, curr_operation_type: str) -> List[Operation]:
         """Fill the gaps between two operations according to the cycle of operations (see operation_order class variable)
@@ -204,35 +304,12 @@ class Parser:
         Returns:
             List[Operation]: List of operations to be added before current operation to fullfil the cycle
         """
-
-        #We don't need to fill anything if current operation is the first in the order
-        if curr_operation_type == self.operation_order[0]:
-            return []
-            
-        #Rules to fill the gap:
-        #- If current operation is more to the right of the previous then we add all operations between them
-        #- If current operation is more to the left of the previous then we are moving in the cycle and adding operations until we encounter current operation
-        #- If current operation is the same as previous, then we will ad the full cycle of operations
-        #- In the end we remove all Input and Casting operations, because there should be only one such operation in every instruction
-        prev_operation_idx = self.operation_order.index(prev_operation_type)
-        curr_operation_idx = self.operation_order.index(curr_operation_type)
-        if curr_operation_idx > prev_operation_idx:
-            operation_to_fill = self.operation_order[prev_operation_idx+1:curr_operation_idx]
-        elif curr_operation_idx <= prev_operation_idx:
-            operation_to_fill = self.operation_order[prev_operation_idx+1:] + self.operation_order[:curr_operation_idx]
-        operation_to_fill = list(filter(lambda x: x not in ["Input", "Casting"], operation_to_fill))
-
-        #We are instantiating each added operation
-        results = []
-        for item in operation_to_fill:
-            operation = OperationFactory().default_operation(item)
-            results.append(operation)
-        
-        return results
+        return [OperationFactory.default_operation(item) for item in _fill_table[(prev_operation_type, curr_operation_type)]]
 
     def parse(self, parts: List[Part]) -> List[Instruction]:
         """Parses list of Parts into list of Instructions consisting of Operations
         During parsing we strictly follow the cycle of commands (see operation_order class variable) and filling the gaps with a default Operations of absent Type
+        Gaps are looked up in the precomputed transition table, so parsing is linear in the number of tokens.
 
         Args:
             parts (List[Part]): list of Parts from lexer
@@ -240,30 +317,42 @@ class Parser:
         Returns:
             List[Instruction]: list of Instructions
         """
-
+        from_token = OperationFactory.from_token
+        fill_operations = self._fill_operations
         instructions = []
         for part in parts:
             operations = []
 
             #we always remember type of previous operation to be able to fill the gaps according to the cycle of operations' types
-            prev_operation_type = None
+            #if there are no previous tokens, then we suppose that the previous operation is the first one in the order
+            prev_operation_type = self.operation_order[0]
             for token in part:
+                #separators never produce operations
+                if token is DOT:
+                    continue
+
                 #in case of uknown token we'll encounter an exception here
-                operation = OperationFactory().from_token(token)
+                operation = from_token(token)
 
                 #operation is None only for the case if Token is not an instance of Part object
                 #in other words, it doesn't contain any actual action
                 if not operation:
                     continue 
 
-                #if there are no previous tokens, then we suppose that the previous operation is the first one in the order
-                if not prev_operation_type:
-                    prev_operation_type = self.operation_order[0]
+                #`where` clause is never combined with other operations
+                if operation.operation_type == "Filter" or prev_operation_type == "Filter":
+                    if operations:
+                        raise ValueError("`where` clause should be the only operation in the line: {}".format(getattr(part, "text", part)))
+                    operations.append(operation)
+                    prev_operation_type = operation.operation_type
+                    continue
 
                 #filling the gaps between prev_operation_type and current operation type
-                operations += self._fill_operations(prev_operation_type, operation.operation_type)
+                operations += fill_operations(prev_operation_type, operation.operation_type)
 
                 operations.append(operation)
                 prev_operation_type = operation.operation_type
-            instructions.append(Instruction(operations))
-        return instructions
\ No newline at end of file
+            instructions.append(Instruction(operations, getattr(part, "number", None), getattr(part, "text", None)))
+        return instructions
+
+_fill_table = Parser._build_fill_table()
\ No newline at end of file
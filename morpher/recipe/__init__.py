@@ -1 +1,6 @@
-from .recipe import Recipe, SourceFieldStrategy
\ No newline at end of file
+from .recipe import Recipe, SourceFieldStrategy
+from .executor import Executor, ExecutionMode
+from .reloadable import ReloadableRecipe
+from .cache import ResultCache, CachedRecipe
+from .metrics import Metrics, MetricsAggregator, PrometheusFileExporter
+from .shadow import ShadowRecipe, ShadowReport
\ No newline at end of file
@@ -1,13 +1,17 @@
 import jsonpath_ng
 from abc import ABC, abstractmethod
-from copy import copy
+from dataclasses import replace
+from typing import Any, Callable, Iterable, List, Optional
 from .state import MorphState
-from .values import Value, AbsentValue, NullValue, ObjectValue, ListValue, ScalarValue
-from .value_types import FinalType
+from .values import Value, AbsentValue, NullValue, ObjectValue, ListValue, ScalarValue, ObjectView, FlattenView, materialize
+from .value_types import FinalType, CastKernel, CastStatistics
 from .functions import registered_functions
+from ..morpher_parser import Operation, Pointer, Transformation, Casting
 
 #All actions and corresponding transformations are there
 #Every action "runs" by applying different transformations to the passed state
+#Actions are shared between all records (and threads) processed by the recipe, so they never change their own attributes in `run`
+#and never change `Value` objects in place - new values are created instead
 
 str_to_final_type = {
     "string": FinalType.STRING,
@@ -22,14 +26,62 @@ str_to_final_type = {
     "date": FinalType.DATE
 }
 
+def _is_live(name: str, live_names: frozenset) -> bool:
+    #temp field is read by `Take` either by its exact name or by its name without delimiter
+    return live_names is None or name in live_names or name.split("$")[0] in live_names
+
+def _is_view_live(view: FlattenView, live_names: frozenset) -> bool:
+    prefix = view.parent.actual_name + "_"
+    return live_names is None or any(name.startswith(prefix) for name in live_names)
+
+def _passthrough(input: MorphState) -> MorphState:
+    return input
+
 class Action(ABC):
     """Base class for Actiona. 
     Every action can be run through the usage of `run` method, which should receive some state and return updated state.
     """
+    #names read by the following instructions; naming actions don't store temp fields with other names (None means all names are read)
+    live_names = None
+    #action never changes the state, so specialized execution skips it
+    is_noop = False
+    #classes of values which the action returns unchanged and the class of values which `_run_unchecked` (if the action defines it) processes
+    passthrough_classes = ()
+    expected_class = None
+
     @abstractmethod
     def run(self, input: MorphState) -> MorphState:
         input.value = input.source_fields 
 
+    def run_batch(self, inputs: List[MorphState]) -> List[MorphState]:
+        """Runs action for the batch of states (one state per record).
+        By default action is run for every state separately, but actions can override it to process the whole column of values at once.
+
+        Args:
+            inputs (List[MorphState]): states of all records in the batch
+
+        Returns:
+            List[MorphState]: updated states in the same order
+        """
+        return [self.run(input) for input in inputs]
+
+    def specialize(self, value_class: type) -> Optional[Callable[[MorphState], MorphState]]:
+        """Returns `run` specialized for values of exactly this class, which skips checks of the type of the value.
+        It's called only when the guard on the class of the value holds (see `specialization`).
+
+        Args:
+            value_class (type): class of the current value observed for this action
+
+        Returns:
+            Optional[Callable[[MorphState], MorphState]]: specialized function or None if there is no specialized version
+        """
+        if value_class in self.passthrough_classes:
+            return _passthrough
+        if value_class is self.expected_class:
+            #action without `_run_unchecked` stays on the generic `run`
+            return getattr(self, "_run_unchecked", None)
+        return None
+
 class Take(Action):
     def __init__(self, args) -> None:
         super().__init__()
@@ -45,9 +97,13 @@ class Take(Action):
                 for k,v in input.temp_fields.items():
                     name_wo_delimiter = k.split("$")[0]
                     if self.name == name_wo_delimiter:
-                        input.value = v 
-                        input.value.actual_name = self.name
+                        input.value = replace(v, actual_name=self.name)
                         return input
+            for view in input.lazy_fields:
+                v = view.find(self.name)
+                if v is not None:
+                    input.value = v
+                    return input
             input.value = AbsentValue(original_name=self.name)
 
         return input
@@ -59,14 +115,19 @@ class Drop(Action):
 
     def run(self, input: MorphState) -> MorphState:
         input.value = AbsentValue(original_name=self.name, actual_name=self.name)
-        if self.name in input.dropped_fields:
-            return input 
-        elif self.name in input.source_fields:
-            value_to_drop = input.source_fields[self.name]
-            input.dropped_fields.update({self.name: value_to_drop})
+        if self.name not in input.source_fields:
             return input
+        if self.name not in input.dropped_fields:
+            input.dropped_fields.update({self.name: input.source_fields[self.name]})
+        #final field taken from the source field so far (e.g. by finalization) is dropped with it, the field taken again after the drop is kept
+        final_v = input.final_fields.get(self.name)
+        if final_v is not None and final_v.original_name == self.name:
+            del input.final_fields[self.name]
+        return input
 
 class Full(Action):
+    is_noop = True
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -74,9 +135,12 @@ class Full(Action):
         return input
 
 class Partial(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ObjectValue
+
     def __init__(self, args) -> None:
         super().__init__()
-        self.fields_to_keep = args 
+        self.fields_to_keep = frozenset(args)
 
     def run(self, input: MorphState) -> MorphState:
         if isinstance(input.value, AbsentValue):
@@ -85,12 +149,18 @@ class Partial(Action):
             return input
         if not isinstance(input.value, ObjectValue):
             raise ValueError
-        old_v = input.value.value
-        new_v = {k: v for k,v in old_v.items() if k in self.fields_to_keep}
-        input.value.value = new_v
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
+        #the object is not copied, view references the original one
+        new_v = ObjectView(input.value.value, self.fields_to_keep)
+        input.value = replace(input.value, value=new_v)
         return input
 
 class First(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ListValue
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -102,6 +172,9 @@ class First(Action):
             return input
         if not isinstance(input.value, ListValue):
             raise ValueError
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
         old_v = input.value.value
         if len(old_v) == 0:
             null_value = NullValue.inherit(input.value)
@@ -113,6 +186,9 @@ class First(Action):
             return input
 
 class Last(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ListValue
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -123,6 +199,9 @@ class Last(Action):
             return input
         if not isinstance(input.value, ListValue):
             raise ValueError
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
         old_v = input.value.value
         if len(old_v) == 0:
             null_value = NullValue.inherit(input.value)
@@ -134,6 +213,9 @@ class Last(Action):
             return input
 
 class Nth(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ListValue
+
     def __init__(self, args) -> None:
         super().__init__()
         self.index = int(args[0])
@@ -145,6 +227,9 @@ class Nth(Action):
             return input
         if not isinstance(input.value, ListValue):
             raise ValueError
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
         old_v = input.value.value
         if abs(self.index) >= len(old_v):
             null_value = NullValue.inherit(input.value)
@@ -156,6 +241,8 @@ class Nth(Action):
             return input
 
 class ID(Action):
+    is_noop = True
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -163,6 +250,9 @@ class ID(Action):
         return input
 
 class Extract(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ObjectValue
+
     def __init__(self, args) -> None:
         super().__init__()
         self.path = jsonpath_ng.parse(args[0])
@@ -174,7 +264,10 @@ class Extract(Action):
             return input
         if not isinstance(input.value, ObjectValue):
             raise ValueError
-        old_v = input.value.value
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
+        old_v = materialize(input.value.value)
         new_v = self.path.find(old_v)
         if len(new_v) > 1:
             new_v = [match.value for match in new_v]
@@ -190,6 +283,9 @@ class Extract(Action):
         return input
 
 class Flatten(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ObjectValue
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -200,18 +296,18 @@ class Flatten(Action):
             return input
         if not isinstance(input.value, ObjectValue):
             raise ValueError
+        return self._run_unchecked(input)
 
-        old_v = input.value.value
-        flatten_v = ListValue.inherit(input.value, new_value=[])
-        for k, v in old_v.items():
-            new_value = Value.create_value_from_previous(input.value, v)
-            new_value.actual_name = input.value.actual_name + "_" + k
-            flatten_v.value.append(new_value)
+    def _run_unchecked(self, input: MorphState) -> MorphState:
+        #values of the object are wrapped into `Value` objects only when they are accessed
+        flatten_v = ListValue.inherit(input.value, new_value=FlattenView(input.value, input.value.value))
 
         input.value = flatten_v
         return input
 
 class Apply(Action):
+    passthrough_classes = (AbsentValue,)
+
     def __init__(self, args) -> None:
         super().__init__()
 
@@ -219,10 +315,7 @@ class Apply(Action):
         if self.f is None:
             raise ValueError
 
-    def run(self, input: MorphState) -> MorphState:
-        if isinstance(input.value, AbsentValue):
-            return input
-        results = self.f(input.value.value)
+    def _set_results(self, input: MorphState, results: Any) -> MorphState:
         if isinstance(results, list):
             list_of_values = []
             for i in results:
@@ -245,7 +338,134 @@ class Apply(Action):
         
         return input
 
+    def run(self, input: MorphState) -> MorphState:
+        if isinstance(input.value, AbsentValue):
+            return input
+        results = self.f(materialize(input.value.value))
+        return self._set_results(input, results)
+
+    def run_batch(self, inputs: List[MorphState]) -> List[MorphState]:
+        #collecting the column of values from all records where the value is present
+        present = [input for input in inputs if not isinstance(input.value, AbsentValue)]
+        if not present:
+            return inputs
+        column_results = self.f.call_batch([materialize(input.value.value) for input in present])
+        for input, results in zip(present, column_results):
+            self._set_results(input, results)
+        return inputs
+
+class Map(Action):
+    """Applies the chain of Pointer, Transformation and Casting operations to every element of the list.
+    Elements are processed as raw values without wrapping them into `Value` objects, null elements stay null.
+    The result is the list of the same length.
+    """
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ListValue
+
+    def __init__(self, args: List[Operation]) -> None:
+        super().__init__()
+
+        steps = [self._create_step(op) for op in args]
+        #identity operations are skipped, so they cost nothing per element
+        self.steps = tuple(step for step in steps if step is not None)
+
+    @staticmethod
+    def _create_step(op: Operation) -> Optional[Callable[[Any], Any]]:
+        operation = op.operation
+        args = op.args[0] if op.args else []
+        if operation in (Pointer.FULL, Transformation.ID):
+            return None
+        elif operation == Pointer.PARTIAL:
+            keys_to_keep = frozenset(args)
+
+            def step(v):
+                if not isinstance(v, dict):
+                    raise ValueError
+                return {k: x for k, x in v.items() if k in keys_to_keep}
+        elif operation in (Pointer.FIRST, Pointer.LAST):
+            index = 0 if operation == Pointer.FIRST else -1
+
+            def step(v):
+                if not isinstance(v, list):
+                    raise ValueError
+                return v[index] if v else None
+        elif operation == Pointer.NTH:
+            index = int(args[0])
+
+            def step(v):
+                if not isinstance(v, list):
+                    raise ValueError
+                return v[index] if abs(index) < len(v) else None
+        elif operation == Transformation.EXTRACT:
+            path = jsonpath_ng.parse(args[0])
+
+            def step(v):
+                if not isinstance(v, dict):
+                    raise ValueError
+                matches = path.find(v)
+                if len(matches) > 1:
+                    return [match.value for match in matches]
+                elif len(matches) == 1:
+                    return matches[0].value
+                return None
+        elif operation == Transformation.APPLY:
+            step = registered_functions().get(args[0])
+            if step is None:
+                raise ValueError
+        elif operation == Transformation.LOWER:
+            step = lambda v: v.lower() if isinstance(v, str) else v
+        elif operation == Transformation.UPPER:
+            step = lambda v: v.upper() if isinstance(v, str) else v
+        elif operation in (Casting.CAST, Casting.SAFE_CAST, Casting.DEFAULT_CAST):
+            kernel = _cast_action_classes[operation](args).kernel
+
+            def step(v):
+                new_v, e = kernel.convert(v)
+                if e is not None:
+                    return kernel.on_failure(v, e)
+                return new_v
+        else:
+            raise ValueError("Operation {} can't be used in `!map`".format(operation))
+        return step
+
+    def _map(self, values: Iterable) -> list:
+        steps = self.steps
+        result = []
+        append = result.append
+        for v in values:
+            for step in steps:
+                if v is None:
+                    break
+                v = step(v)
+            append(v)
+        return result
+
+    def run(self, input: MorphState) -> MorphState:
+        if isinstance(input.value, AbsentValue):
+            return input
+        if isinstance(input.value, NullValue):
+            return input
+        if not isinstance(input.value, ListValue):
+            raise ValueError
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
+        old_v = input.value.value
+        #lists produced by `!flatten` and `!apply` contain `Value` objects, source lists contain raw values
+        if isinstance(old_v, FlattenView):
+            values = old_v.source.values()
+        elif old_v and isinstance(old_v[0], Value):
+            values = [v.value for v in old_v]
+        else:
+            values = old_v
+
+        input.value = replace(input.value, value=self._map(values))
+        return input
+
 class Lower(Action):
+    passthrough_classes = (AbsentValue, NullValue, ListValue, ObjectValue)
+    expected_class = ScalarValue
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -254,7 +474,9 @@ class Lower(Action):
             return input
         if not isinstance(input.value, ScalarValue):
             return input
-        
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
         old_v = input.value.value
         new_v = old_v.lower() if isinstance(old_v, str) else old_v
 
@@ -263,6 +485,9 @@ class Lower(Action):
         return input
 
 class Upper(Action):
+    passthrough_classes = (AbsentValue, NullValue, ListValue, ObjectValue)
+    expected_class = ScalarValue
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -271,7 +496,9 @@ class Upper(Action):
             return input
         if not isinstance(input.value, ScalarValue):
             return input
-        
+        return self._run_unchecked(input)
+
+    def _run_unchecked(self, input: MorphState) -> MorphState:
         old_v = input.value.value
         new_v = old_v.upper() if isinstance(old_v, str) else old_v
 
@@ -289,14 +516,14 @@ class Alias(Action):
 
     def run(self, input: MorphState) -> MorphState:
         if self.name:
-            input.value.actual_name = self.name
-            #input.temp_fields[input.value.actual_name] = copy(input.value)
+            input.value = replace(input.value, actual_name=self.name)
         elif input.value.actual_name is None:
-            input.value.actual_name = input.value.original_name
+            input.value = replace(input.value, actual_name=input.value.original_name)
         else:
             pass
 
-        input.temp_fields[input.value.actual_name] = copy(input.value) 
+        if _is_live(input.value.actual_name, self.live_names):
+            input.temp_fields[input.value.actual_name] = input.value
 
         return input
 
@@ -308,11 +535,12 @@ class Prefix(Action):
 
     def run(self, input: MorphState) -> MorphState:
         if input.value.actual_name: 
-            input.value.actual_name = self.prefix + input.value.actual_name
+            input.value = replace(input.value, actual_name=self.prefix + input.value.actual_name)
         else:
-            input.value.actual_name = self.prefix + input.value.original_name
+            input.value = replace(input.value, actual_name=self.prefix + input.value.original_name)
 
-        input.temp_fields[input.value.actual_name] = copy(input.value)
+        if _is_live(input.value.actual_name, self.live_names):
+            input.temp_fields[input.value.actual_name] = input.value
 
         return input
 
@@ -324,15 +552,19 @@ class Suffix(Action):
 
     def run(self, input: MorphState) -> MorphState:
         if input.value.actual_name: 
-            input.value.actual_name = input.value.actual_name + self.suffix
+            input.value = replace(input.value, actual_name=input.value.actual_name + self.suffix)
         else:
-            input.value.actual_name = input.value.original_name + self.suffix
+            input.value = replace(input.value, actual_name=input.value.original_name + self.suffix)
 
-        input.temp_fields[input.value.actual_name] = copy(input.value)
+        if _is_live(input.value.actual_name, self.live_names):
+            input.temp_fields[input.value.actual_name] = input.value
 
         return input
 
 class Split(Action):
+    passthrough_classes = (AbsentValue, NullValue)
+    expected_class = ListValue
+
     def __init__(self, args=None) -> None:
         super().__init__()
 
@@ -343,9 +575,20 @@ class Split(Action):
             return input
         if not isinstance(input.value, ListValue):
             raise ValueError
+        return self._run_unchecked(input)
 
+    def _run_unchecked(self, input: MorphState) -> MorphState:
+        #flattened object is not expanded, its items are found by `Take` on demand
+        if isinstance(input.value.value, FlattenView):
+            if _is_view_live(input.value.value, self.live_names):
+                input.lazy_fields.append(input.value.value)
+            return input
+
+        #values are never changed in place, so items are referenced without copying
         for i, v in enumerate(input.value):
-            input.temp_fields["{}${}".format(v.actual_name, i)] = copy(v)
+            name = "{}${}".format(v.actual_name, i)
+            if _is_live(name, self.live_names):
+                input.temp_fields[name] = v
 
         return input    
 
@@ -354,48 +597,96 @@ class Cast(Action):
         super().__init__()
 
         self.target_type = str_to_final_type[args[0]]
+        #kernel is bound once, so casting a value doesn't look up anything
+        self.kernel = self._create_kernel(args)
+        #statistics can be replaced by the recipe to share counters between all cast actions
+        self.statistics = CastStatistics()
+
+    def _create_kernel(self, args) -> CastKernel:
+        return CastKernel(self.target_type)
 
     def run(self, input: MorphState) -> MorphState:
-        new_v = self.target_type.cast(input.value.value, is_safe=False)
-        input.value.value = new_v
-        input.value.actual_type = self.target_type
+        value = input.value
+        old_v = value.value
+        if old_v is None:
+            new_v = None
+            self.statistics.add(value.actual_name, True, False)
+        else:
+            new_v, e = self.kernel.convert(materialize(old_v))
+            self.statistics.add(value.actual_name, False, e is not None)
+            if e is not None:
+                input.failed_fields.append(value.actual_name)
+                new_v = self.kernel.on_failure(old_v, e)
 
-        input.final_fields[input.value.actual_name] = copy(input.value)
+        input.final_fields[value.actual_name] = replace(value, value=new_v, actual_type=self.target_type)
         input.value = AbsentValue()
 
         return input
 
-class SafeCast(Action):
+    def run_batch(self, inputs: List[MorphState]) -> List[MorphState]:
+        #the whole column is converted at once, failure policy is applied only to failed values
+        raw_values = [materialize(input.value.value) for input in inputs]
+        converted, failed, null = self.kernel.convert_column(raw_values)
+        counts = {}
+        for i, input in enumerate(inputs):
+            value = input.value
+            new_v = converted[i]
+            if failed[i]:
+                input.failed_fields.append(value.actual_name)
+                old_v = raw_values[i]
+                new_v = self.kernel.on_failure(old_v, self.kernel.convert(old_v)[1])
+            name_counts = counts.get(value.actual_name)
+            if name_counts is None:
+                name_counts = counts[value.actual_name] = [0, 0, 0]
+            name_counts[2 if null[i] else (1 if failed[i] else 0)] += 1
+            input.final_fields[value.actual_name] = replace(value, value=new_v, actual_type=self.target_type)
+            input.value = AbsentValue()
+        for name, (success, failure, null_count) in counts.items():
+            self.statistics.add_counts(name, success, failure, null_count)
+        return inputs
+
+class SafeCast(Cast):
+    def _create_kernel(self, args) -> CastKernel:
+        return CastKernel(self.target_type, is_safe=True)
+
+class DefaultCast(Cast):
     def __init__(self, args) -> None:
-        super().__init__()
-
-        self.target_type = str_to_final_type[args[0]]
-
-    def run(self, input: MorphState) -> MorphState:
-        new_v = self.target_type.cast(input.value.value, is_safe=True)
-        input.value.value = new_v
-        input.value.actual_type = self.target_type
+        self.default_value = None 
+        if len(args) > 1:
+            self.default_value = args[1]
+        super().__init__(args)
 
-        input.final_fields[input.value.actual_name] = copy(input.value)
-        input.value = AbsentValue()
+    def _create_kernel(self, args) -> CastKernel:
+        return CastKernel(self.target_type, is_safe=True, with_default=True, default_value=self.default_value)
 
-        return input
+#Cast actions by operation, used to create cast kernels for `!map`
+_cast_action_classes = {
+    Casting.CAST: Cast,
+    Casting.SAFE_CAST: SafeCast,
+    Casting.DEFAULT_CAST: DefaultCast
+}
 
-class DefaultCast(Action):
+class ReleaseFields(Action):
+    """Releases source and temp fields which are not read by any of the following instructions.
+    It's added by `Recipe` in memory-bounded mode after the last instruction which reads the field.
+    """
     def __init__(self, args) -> None:
         super().__init__()
 
-        self.target_type = str_to_final_type[args[0]]
-        self.default_value = None 
-        if len(args) > 1:
-            self.default_value = args[1]
+        self.names = frozenset(args[0])
+        self.live_names = args[1]
 
     def run(self, input: MorphState) -> MorphState:
-        new_v = self.target_type.cast(input.value.value, is_safe=True, with_default=True, default_value=self.default_value)
-        input.value.value = new_v
-        input.value.actual_type = self.target_type
-
-        input.final_fields[input.value.actual_name] = copy(input.value)
-        input.value = AbsentValue()
-
-        return input
\ No newline at end of file
+        names = self.names
+        live_names = self.live_names
+        temp_fields = input.temp_fields
+        if temp_fields:
+            for k in [k for k in temp_fields if (k in names or k.split("$")[0] in names) and not _is_live(k, live_names)]:
+                del temp_fields[k]
+        source_fields = input.source_fields
+        for name in names:
+            if name not in live_names:
+                source_fields.pop(name, None)
+        if input.lazy_fields:
+            input.lazy_fields = [view for view in input.lazy_fields if _is_view_live(view, live_names)]
+        return input
@@ -0,0 +1,208 @@
+import hashlib
+import json
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, List, Optional
+from .recipe import Recipe
+from .reloadable import ReloadableRecipe
+from .state import MorphState
+
+DEFAULT_MAX_ENTRIES = 10_000
+
+def record_hash(d: dict) -> bytes:
+    """Hash of the record. Keys are hashed in their order, because results depend on it
+    (e.g. `^ json` of objects and result keys of finalized source fields)
+
+    Args:
+        d (dict): record
+
+    Returns:
+        bytes: 16-byte digest
+    """
+    s = json.dumps(d, ensure_ascii=False, separators=(",", ":"), default=repr)
+    return hashlib.blake2b(s.encode("utf-8"), digest_size=16).digest()
+
+def bytes_hash(raw: bytes) -> bytes:
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+class ResultCache:
+    """LRU cache of morphing results.
+    Entries are evicted when there are more than `max_entries` of them or when their total size exceeds `max_size`
+    (size of the entry is estimated as the size of the serialized input record).
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES, max_size: Optional[int] = None) -> None:
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Any) -> Optional[tuple[dict, dict]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Any, value: tuple[dict, dict], size: int = 0):
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self.size -= old_entry[1]
+            self._entries[key] = (value, size)
+            self.size += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_size is not None and self.size > self.max_size)
+            ):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict[str, Any]:
+        """Returns metrics of the cache
+
+        Returns:
+            dict[str, Any]: numbers of hits, misses and evictions, hit ratio, number of entries and their total size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "size": self.size
+            }
+
+class CachedRecipe:
+    """Recipe which returns cached results for records it has already morphed.
+
+    Records are identified by the hash of the record (or hash of the raw bytes for `morph_bytes`), by the fingerprint of the recipe
+    and by the registrations of functions used with `!apply`, so one cache may be shared between recipes,
+    and results of the previous version of a reloadable recipe or of a re-registered function are never returned.
+    Cached records are not morphed at all, so the state is None for them.
+    Caching is correct only if results depend on the record alone, so recipes which use functions not registered as pure (`is_pure`)
+    are never cached, their records are always morphed.
+    Records rejected by `where` clauses are not cached, their results are None.
+    """
+
+    def __init__(self, recipe: Recipe | ReloadableRecipe, cache: ResultCache = None) -> None:
+        self.recipe = recipe
+        self.cache = cache if cache is not None else ResultCache()
+        #the last recipe and its key, they're replaced together, so threads never see the key of another version
+        self._recipe_key = (None, None)
+
+    def _current_recipe(self) -> Recipe:
+        #reloadable recipe may be swapped at any moment, so the same version is used for the key and for morphing
+        if isinstance(self.recipe, ReloadableRecipe):
+            return self.recipe.recipe
+        return self.recipe
+
+    def _key(self, recipe: Recipe) -> Optional[tuple]:
+        #identity of the recipe in keys of the cache, None if its results can't be cached
+        cached_recipe, key = self._recipe_key
+        if cached_recipe is not recipe:
+            key = None
+            if all(f.is_pure for f in recipe.functions):
+                key = (recipe.fingerprint, tuple(f.registration for f in recipe.functions))
+            self._recipe_key = (recipe, key)
+        return key
+
+    def _entry_size(self, d: dict) -> int:
+        if self.cache.max_size is None:
+            return 0
+        return len(json.dumps(d, ensure_ascii=False, default=repr))
+
+    @staticmethod
+    def _copy(value: tuple[dict, dict]) -> tuple[dict, dict, Optional[MorphState]]:
+        #cached results are never returned, so the caller may change them freely, metadata is read-only and shared anyway
+        result, metadata = value
+        return dict(result), metadata, None
+
+    def _put(self, key: tuple[tuple, bytes], result: dict, metadata: dict, size: int):
+        self.cache.put(key, (dict(result), metadata), size)
+
+    def morph(self, d: dict) -> Optional[tuple[dict, dict, Optional[MorphState]]]:
+        recipe = self._current_recipe()
+        recipe_key = self._key(recipe)
+        if recipe_key is None:
+            return recipe.morph(d)
+        key = (recipe_key, record_hash(d))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._copy(cached)
+        morphed = recipe.morph(d)
+        if morphed is None:
+            return None
+        result, metadata, state = morphed
+        self._put(key, result, metadata, self._entry_size(d))
+        return result, metadata, state
+
+    def morph_bytes(self, raw: bytes) -> Optional[tuple[dict, dict, Optional[MorphState]]]:
+        """Morphs the record serialized as JSON. The record is decoded only if it's not found in the cache
+
+        Args:
+            raw (bytes): serialized record
+
+        Returns:
+            Optional[tuple[dict, dict, Optional[MorphState]]]: result, metadata and state (None for cached records), None for rejected records
+        """
+        recipe = self._current_recipe()
+        recipe_key = self._key(recipe)
+        if recipe_key is None:
+            return recipe.morph(json.loads(raw))
+        key = (recipe_key, bytes_hash(raw))
+        cached = self.cache.get(key)
+        if cached is not None:
+            return self._copy(cached)
+        morphed = recipe.morph(json.loads(raw))
+        if morphed is None:
+            return None
+        result, metadata, state = morphed
+        self._put(key, result, metadata, len(raw))
+        return result, metadata, state
+
+    def morph_batch(self, ds: List[dict]) -> List[Optional[tuple[dict, dict, Optional[MorphState]]]]:
+        recipe = self._current_recipe()
+        recipe_key = self._key(recipe)
+        if recipe_key is None:
+            return recipe.morph_batch(ds)
+        results = [None] * len(ds)
+        #positions of missed records by key, duplicates inside the batch are morphed only once
+        missed = {}
+        for i, d in enumerate(ds):
+            key = (recipe_key, record_hash(d))
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = self._copy(cached)
+            else:
+                missed.setdefault(key, []).append(i)
+
+        if missed:
+            morphed = recipe.morph_batch([ds[positions[0]] for positions in missed.values()])
+            for (key, positions), morphed_result in zip(missed.items(), morphed):
+                if morphed_result is None:
+                    continue
+                result, metadata, state = morphed_result
+                self._put(key, result, metadata, self._entry_size(ds[positions[0]]))
+                results[positions[0]] = (result, metadata, state)
+                for i in positions[1:]:
+                    results[i] = self._copy((result, metadata))
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        return self.cache.stats()
@@ -0,0 +1,66 @@
+from typing import List
+from .state import MorphState
+from .values import Value
+from .specialization import _value_classes
+
+#Source fields remembered by every state, the table is cleared when records with ever-changing fields overflow it
+MAX_SLOTS = 4096
+
+class MorphContext:
+    """Reusable execution context of one thread: states and `Value` objects of source fields are reused between records.
+
+    Every state of the context is cleared before the next record instead of being created again. Every state keeps the `Value` object
+    of every source field it has seen (its slot): if the next record has the field with a value of the same type, only the raw value of the slot
+    is replaced. Values are never changed by actions (they create new values instead), so this is the only place which changes them.
+    States and values are reused only after results of the previous record are built, so results are independent of the context,
+    but states must not leave the recipe (see `Recipe.with_state_pooling`).
+    """
+    __slots__ = ("states", "slots")
+
+    def __init__(self) -> None:
+        self.states: List[MorphState] = []
+        self.slots: List[dict[str, tuple[type, Value]]] = []
+
+    def _reset(self, i: int, d: dict) -> MorphState:
+        if i == len(self.states):
+            self.states.append(MorphState())
+            self.slots.append({})
+        state = self.states[i]
+        slots = self.slots[i]
+        if len(slots) > MAX_SLOTS:
+            slots.clear()
+
+        state.temp_fields.clear()
+        state.final_fields.clear()
+        state.dropped_fields.clear()
+        state.lazy_fields.clear()
+        state.failed_fields.clear()
+        state.deoptimizations = 0
+        state.value = None
+        source_fields = state.source_fields
+        source_fields.clear()
+        for k, v in d.items():
+            raw_class = v.__class__
+            slot = slots.get(k)
+            if slot is not None and slot[0] is raw_class:
+                value = slot[1]
+                value.value = v
+            else:
+                value_class = _value_classes.get(raw_class)
+                if value_class is None:
+                    #values of other types (e.g. subclasses of dict) are created as usual and not reused
+                    value = Value.create_value(k, v)
+                else:
+                    cls, temp_type = value_class
+                    value = cls(k, k, temp_type, temp_type, v)
+                    slots[k] = (raw_class, value)
+            source_fields[k] = value
+        return state
+
+    def state(self, d: dict) -> MorphState:
+        """Returns the state for the record, it's the same object for every call"""
+        return self._reset(0, d)
+
+    def batch_states(self, ds: List[dict]) -> List[MorphState]:
+        """Returns states for records of the batch, the context keeps as many states as the largest batch has records"""
+        return [self._reset(i, d) for i, d in enumerate(ds)]
@@ -0,0 +1,98 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from itertools import islice
+from typing import Iterable, Iterator, List
+from .recipe import Recipe
+from .state import MorphState
+
+ExecutionMode = Enum("ExecutionMode", ["SEQUENTIAL", "BATCH", "THREAD_POOL"])
+
+DEFAULT_BATCH_SIZE = 256
+
+def _batches(ds: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    it = iter(ds)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def _accepted(results: List[tuple]) -> List[tuple]:
+    #results of records rejected by `where` clauses are None
+    return [result for result in results if result is not None]
+
+class Executor:
+    """Runs a compiled recipe over a stream of records.
+
+    Modes:
+    - `SEQUENTIAL` morphs records one by one with `Recipe.morph`
+    - `BATCH` morphs records in batches with `Recipe.morph_batch`, so batch-capable functions receive a column of values
+    - `THREAD_POOL` morphs batches in a pool of threads sharing the same recipe. It pays off when registered functions release the GIL or on free-threaded Python builds.
+
+    Results are always yielded in the order of the input records, records rejected by `where` clauses of the recipe are skipped.
+    """
+
+    def __init__(
+        self,
+        recipe: Recipe,
+        mode: ExecutionMode = ExecutionMode.SEQUENTIAL,
+        workers: int = None,
+        batch_size: int = DEFAULT_BATCH_SIZE
+    ) -> None:
+        self.recipe = recipe
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+    def _run_thread_pool(self, ds: Iterable[dict]) -> Iterator[tuple[dict, dict, MorphState]]:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="morpher")
+
+        #only a bounded number of batches is submitted at once, so the input is consumed lazily
+        futures = deque()
+        max_pending = self.workers * 2
+        for batch in _batches(ds, self.batch_size):
+            futures.append(self._pool.submit(self.recipe.morph_batch, batch))
+            if len(futures) >= max_pending:
+                yield from _accepted(futures.popleft().result())
+        while futures:
+            yield from _accepted(futures.popleft().result())
+
+    def map(self, ds: Iterable[dict]) -> Iterator[tuple[dict, dict, MorphState]]:
+        """Morphs every record from `ds`
+
+        Args:
+            ds (Iterable[dict]): records to morph
+
+        Raises:
+            ValueError: unknown execution mode
+
+        Yields:
+            Iterator[tuple[dict, dict, MorphState]]: result, metadata and state for every accepted record
+        """
+        if self.mode == ExecutionMode.SEQUENTIAL:
+            for d in ds:
+                result = self.recipe.morph(d)
+                if result is not None:
+                    yield result
+        elif self.mode == ExecutionMode.BATCH:
+            for batch in _batches(ds, self.batch_size):
+                yield from _accepted(self.recipe.morph_batch(batch))
+        elif self.mode == ExecutionMode.THREAD_POOL:
+            yield from self._run_thread_pool(ds)
+        else:
+            raise ValueError("Unknown execution mode {}".format(self.mode))
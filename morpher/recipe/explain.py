@@ -0,0 +1,308 @@
+import time
+from copy import copy
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+from .filters import is_filter_instruction
+from .actions import Action, Take, Drop, Full, ID, Partial, Flatten, Nth, Apply, Map, Alias, Prefix, Suffix, Split, Cast, ReleaseFields, _is_live
+
+DEFAULT_CALIBRATION_RUNS = 200
+#longer operations are not aligned in the report
+MAX_OPERATION_WIDTH = 32
+
+@dataclass
+class StepPlan:
+    """Single action of the instruction: the operation it's compiled from and what it does"""
+    operation: str
+    action: str
+    details: str = ""
+    is_default: bool = False
+    cost_ns: Optional[float] = None
+
+@dataclass
+class InstructionPlan:
+    """Compiled instruction with the fields it reads and writes.
+
+    `source_fields` are fields of the record read by the instruction
+    `temp_dependencies` are temp fields read by the instruction with the numbers of instructions which store them
+    `writes` are temp and final fields stored by the instruction
+    `optimizations` are optimizations applied to the instruction
+    """
+    number: int
+    line: Optional[int]
+    text: Optional[str]
+    steps: List[StepPlan] = field(default_factory=list)
+    source_fields: List[str] = field(default_factory=list)
+    temp_dependencies: List[str] = field(default_factory=list)
+    writes: List[str] = field(default_factory=list)
+    optimizations: List[str] = field(default_factory=list)
+    cost_ns: Optional[float] = None
+
+@dataclass
+class Calibration:
+    """Average time to morph the sample record, in nanoseconds"""
+    runs: int
+    record_ns: float
+    conversion_ns: float
+    finalization_ns: float
+
+@dataclass
+class Plan:
+    """Execution plan of the compiled recipe (see `Recipe.explain`)"""
+    fingerprint: str
+    options: dict[str, Any]
+    instructions: List[InstructionPlan]
+    source_fields: List[str]
+    final_fields: List[str]
+    calibration: Optional[Calibration] = None
+    filters: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [
+            "Plan of recipe {} ({} instructions, {} actions)".format(
+                self.fingerprint[:12], len(self.instructions), sum(len(x.steps) for x in self.instructions)
+            ),
+            "Options: " + ", ".join("{} {}".format(k, v) for k, v in self.options.items()),
+            "Source fields: " + (", ".join(self.source_fields) or "-"),
+            "Final fields: " + (", ".join(self.final_fields) or "-")
+        ]
+        if self.filters:
+            lines.append("Filters (checked before morphing): " + "; ".join(self.filters))
+        calibration = self.calibration
+        if calibration is not None:
+            lines.append("Estimated cost: {} per record ({:,.0f} records/s) from {} runs; state conversion {}, finalization {}".format(
+                _format_ns(calibration.record_ns),
+                1e9 / calibration.record_ns if calibration.record_ns else 0,
+                calibration.runs,
+                _format_ns(calibration.conversion_ns),
+                _format_ns(calibration.finalization_ns)
+            ))
+
+        width = min(max([len(step.operation) for x in self.instructions for step in x.steps] + [0]), MAX_OPERATION_WIDTH)
+        for instruction in self.instructions:
+            lines.append("")
+            header = "[{}]".format(instruction.number)
+            if instruction.line is not None:
+                header += " line {}: {}".format(instruction.line, " . ".join(x.strip() for x in instruction.text.splitlines()))
+            if instruction.cost_ns is not None and calibration is not None and calibration.record_ns:
+                header += "  -- {} ({:.0%})".format(_format_ns(instruction.cost_ns), instruction.cost_ns / calibration.record_ns)
+            lines.append(header)
+            for step in instruction.steps:
+                lines.append("    {}  {:9}  {}{}".format(
+                    step.operation.ljust(width),
+                    "(default)" if step.is_default else "",
+                    "{}: {}".format(step.action, step.details) if step.details else step.action,
+                    "  -- {}".format(_format_ns(step.cost_ns)) if step.cost_ns is not None else ""
+                ))
+            for title, items in [
+                ("reads source fields", instruction.source_fields),
+                ("reads temp fields", instruction.temp_dependencies),
+                ("writes", instruction.writes),
+                ("optimizations", instruction.optimizations)
+            ]:
+                if items:
+                    lines.append("    {}: {}".format(title, "; ".join(items)))
+        return "\n".join(lines)
+
+def _format_ns(ns: float) -> str:
+    if ns >= 1e6:
+        return "{:.2f} ms".format(ns / 1e6)
+    return "{:.2f} us".format(ns / 1e3)
+
+class _FieldTracker:
+    """Static tracking of temp fields stored by instructions, so reads of the following instructions are resolved to them"""
+
+    def __init__(self) -> None:
+        self.temp_fields = {}
+        self.split_fields = {}
+        self.flatten_prefixes = {}
+
+    def resolve(self, name: str) -> Optional[str]:
+        #the same order as in `Take`: exact temp field, source field, item of the split list, item of the split object
+        if name in self.temp_fields:
+            return "{} from [{}]".format(name, self.temp_fields[name])
+        base_name = name.split("$")[0]
+        if base_name in self.split_fields:
+            return "{} from [{}] (if there is no such source field)".format(name, self.split_fields[base_name])
+        for prefix, number in self.flatten_prefixes.items():
+            if name.startswith(prefix):
+                return "{} from [{}] (if there is no such source field)".format(name, number)
+        return None
+
+def _describe(action: Action) -> tuple[str, Optional[str]]:
+    """Describes the action regardless of the field it works with
+
+    Returns:
+        tuple[str, Optional[str]]: details and applied optimization
+    """
+    if isinstance(action, (Full, ID)):
+        return "no-op", None
+    elif isinstance(action, Partial):
+        return "keeps {}".format(", ".join(sorted(action.fields_to_keep))), "#partial is a lazy view, the object isn't copied"
+    elif isinstance(action, Flatten):
+        return "values of the object", "!flatten is a lazy view, items are created on access"
+    elif isinstance(action, Nth):
+        return "item {}".format(action.index), None
+    elif isinstance(action, Apply):
+        f = action.f
+        kinds = []
+        if f.is_pure:
+            kinds.append("pure, memoized up to {} values".format(f.cache_size))
+        if f.is_batch:
+            kinds.append("batch function")
+        return ", ".join(kinds), "!apply {} is called once per column in batch mode".format(f.name) if f.is_batch else None
+    elif isinstance(action, Map):
+        return "{} steps per element".format(len(action.steps)), "!map runs over raw elements without `Value` objects"
+    elif isinstance(action, Cast):
+        optimization = None
+        if action.kernel.is_vectorized():
+            optimization = "{} of numeric columns is vectorized in batch mode".format(action.target_type.name)
+        return repr(action.kernel), optimization
+    return "", None
+
+def _instruction_plan(number: int, instruction: Any, actions: tuple, tracker: _FieldTracker) -> InstructionPlan:
+    plan = InstructionPlan(number, instruction.line, instruction.text)
+    operations = list(instruction.operations)
+    name = None
+    is_flattened = False
+    for i, action in enumerate(actions):
+        operation = operations[i] if i < len(operations) else None
+        step = StepPlan(
+            operation.to_recipe() if operation is not None else "",
+            type(action).__name__,
+            is_default=operation is not None and operation.is_default
+        )
+        details, optimization = _describe(action)
+
+        if isinstance(action, Take):
+            name = action.name
+            temp_field = tracker.resolve(name)
+            if temp_field is not None:
+                plan.temp_dependencies.append(temp_field)
+                details = "temp field " + temp_field
+            else:
+                plan.source_fields.append(name)
+                details = "source field " + name
+        elif isinstance(action, Drop):
+            name = action.name
+            plan.source_fields.append(name)
+            details = "drops source field " + name
+        elif isinstance(action, Flatten):
+            is_flattened = True
+        elif isinstance(action, (Alias, Prefix, Suffix)):
+            if isinstance(action, Alias) and action.name:
+                name = action.name
+            elif isinstance(action, Prefix):
+                name = action.prefix + name
+            elif isinstance(action, Suffix):
+                name = name + action.suffix
+            if _is_live(name, action.live_names):
+                tracker.temp_fields[name] = number
+                plan.writes.append("temp field " + name)
+                details = "stores temp field " + name
+            else:
+                details = "temp field {} isn't stored".format(name)
+                optimization = "temp field {} is never read, so it isn't stored".format(name)
+        elif isinstance(action, Split):
+            if is_flattened:
+                tracker.flatten_prefixes[name + "_"] = number
+                plan.writes.append("temp fields {}_<key>".format(name))
+                details = "items {}_<key> are found on demand".format(name)
+                optimization = "@split of the flattened object isn't expanded"
+            else:
+                tracker.split_fields[name] = number
+                plan.writes.append("temp fields {}$<index>".format(name))
+                details = "stores temp fields {}$<index>".format(name)
+        elif isinstance(action, Cast):
+            plan.writes.append("final field {} ({})".format(name, action.target_type.name))
+        elif isinstance(action, ReleaseFields):
+            released = ", ".join(sorted(action.names))
+            step.operation = ""
+            details = "releases " + released
+            optimization = "{} released after the last read".format(released)
+
+        step.details = details
+        if optimization is not None:
+            plan.optimizations.append(optimization)
+        plan.steps.append(step)
+
+    defaults = list(dict.fromkeys(step.operation for step in plan.steps if step.is_default and step.details == "no-op"))
+    if defaults:
+        plan.optimizations.append("injected {} are no-ops".format(", ".join(defaults)))
+    plan.optimizations = list(dict.fromkeys(plan.optimizations))
+    return plan
+
+def _calibrate(recipe: Any, plans: List[InstructionPlan], sample: dict, runs: int) -> Calibration:
+    #calibration uses its own copy of the recipe, so cast statistics of the recipe aren't changed
+    calibration_recipe = type(recipe)(
+        source_fields_stategy=recipe.source_fields_stategy,
+        with_source_fields_timestamp_cast=recipe.with_source_fields_timestamp_cast,
+        with_memory_bounded_state=recipe.with_memory_bounded_state
+    ).translate(recipe.original_instructions)
+    actions = calibration_recipe.actions_list
+    action_ns = [0] * len(actions)
+    conversion_ns = 0
+    finalization_ns = 0
+    perf_counter_ns = time.perf_counter_ns
+
+    for _ in range(runs):
+        t0 = perf_counter_ns()
+        state = copy(calibration_recipe.dict_to_state(sample))
+        finalization_actions = calibration_recipe._create_finalization_actions(state.source_fields)
+        t1 = perf_counter_ns()
+        for action in finalization_actions:
+            state = action.run(state)
+        t2 = perf_counter_ns()
+        finalization_ns += t2 - t1
+        conversion_ns += t1 - t0
+        for i, action in enumerate(actions):
+            state = action.run(state)
+            t3 = perf_counter_ns()
+            action_ns[i] += t3 - t2
+            t2 = t3
+        calibration_recipe._state_to_dict_and_metadata(state)
+        conversion_ns += perf_counter_ns() - t2
+
+    i = 0
+    for plan in plans:
+        for step in plan.steps:
+            step.cost_ns = action_ns[i] / runs
+            i += 1
+        plan.cost_ns = sum(step.cost_ns for step in plan.steps)
+    return Calibration(
+        runs,
+        (sum(action_ns) + conversion_ns + finalization_ns) / runs,
+        conversion_ns / runs,
+        finalization_ns / runs
+    )
+
+def explain_recipe(recipe: Any, sample: dict = None, runs: int = DEFAULT_CALIBRATION_RUNS) -> Plan:
+    """Builds the execution plan of the compiled recipe.
+    Cost of every action is estimated by morphing the sample record `runs` times, no cost is estimated without the sample.
+
+    Args:
+        recipe (Recipe): translated recipe
+        sample (dict, optional): record to calibrate costs. Defaults to None.
+        runs (int, optional): number of calibration runs. Defaults to DEFAULT_CALIBRATION_RUNS.
+
+    Returns:
+        Plan: plan of the recipe
+    """
+    tracker = _FieldTracker()
+    plans = []
+    #`where` clauses have no actions, they are listed separately
+    instructions = [x for x in recipe.original_instructions if not is_filter_instruction(x)]
+    for number, (instruction, actions) in enumerate(zip(instructions, recipe.instruction_actions), 1):
+        plans.append(_instruction_plan(number, instruction, actions, tracker))
+
+    source_fields = list(dict.fromkeys(name for plan in plans for name in plan.source_fields))
+    final_fields = [x[len("final field "):] for plan in plans for x in plan.writes if x.startswith("final field ")]
+    options = {
+        "source fields strategy": recipe.source_fields_stategy.name,
+        "timestamp cast": "on" if recipe.with_source_fields_timestamp_cast else "off",
+        "memory-bounded state": "on" if recipe.with_memory_bounded_state else "off",
+        "type specialization": "on" if recipe.with_type_specialization else "off",
+        "state pooling": "on" if recipe.with_state_pooling else "off"
+    }
+    calibration = _calibrate(recipe, plans, sample, runs) if sample is not None else None
+    filters = [x.text for x in recipe.filters]
+    return Plan(recipe.fingerprint, options, plans, source_fields, final_fields, calibration, filters)
@@ -0,0 +1,125 @@
+import json
+from threading import Lock
+from typing import Any, Callable, List
+from ..morpher_parser import Instruction, FilterOperation
+
+def _equals(value: Any, operand: Any) -> bool:
+    #booleans are compared only with booleans, so `where flag == 1` doesn't match `true`
+    if (value.__class__ is bool) != (operand.__class__ is bool):
+        return False
+    return value == operand
+
+def _ordered(compare: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    def test(value: Any, operand: Any) -> bool:
+        if value is None or value.__class__ is bool or operand.__class__ is bool:
+            return False
+        try:
+            return compare(value, operand)
+        except TypeError:
+            #values of incomparable types (e.g. a string and a number) never match
+            return False
+    return test
+
+#Binary operators with exactly one operand
+_BINARY_OPERATORS = {
+    "==": _equals,
+    "!=": lambda value, operand: not _equals(value, operand),
+    "<": _ordered(lambda value, operand: value < operand),
+    "<=": _ordered(lambda value, operand: value <= operand),
+    ">": _ordered(lambda value, operand: value > operand),
+    ">=": _ordered(lambda value, operand: value >= operand)
+}
+#Operators with one or more operands
+_LIST_OPERATORS = {"in", "not_in"}
+#Operators without operands, they check the presence of the field itself
+_UNARY_OPERATORS = {"exists", "missing"}
+
+def _parse_operand(token: str) -> Any:
+    #operands are JSON literals (numbers, true, false, null, "quoted strings"), any other token is a plain string
+    try:
+        return json.loads(token)
+    except ValueError:
+        return token
+
+def is_filter_instruction(instruction: Instruction) -> bool:
+    return bool(instruction.operations) and isinstance(instruction[0], FilterOperation)
+
+class RecordFilter:
+    """Predicate of the `where` clause, it's checked against raw source fields of the record before the record is converted to the state.
+
+    Clauses:
+    - `where <field>` - the field is present and its value is truthy
+    - `where <field> ==|!=|<|<=|>|>= <operand>` - comparison with a JSON literal or a plain string, absent field is compared as null
+    - `where <field> in|not_in <operand> ...` - the value is (not) one of operands
+    - `where <field> exists|missing` - the field is present (absent) in the record, null values are present
+    Values of different types never match in ordering comparisons, booleans are equal only to booleans.
+    """
+    __slots__ = ("name", "operator", "operands", "text", "test")
+
+    def __init__(self, args: List[str]) -> None:
+        if not args:
+            raise ValueError("`where` needs the name of the field")
+        self.name = args[0]
+        self.operator = args[1] if len(args) > 1 else None
+        self.operands = [_parse_operand(x) for x in args[2:]]
+        self.text = " ".join(["where", *args])
+        self.test = self._compile()
+
+    def _compile(self) -> Callable[[dict], bool]:
+        name = self.name
+        operator = self.operator
+        operands = self.operands
+        if operator is None:
+            return lambda d: bool(d.get(name))
+        if operator in _UNARY_OPERATORS:
+            if operands:
+                raise ValueError("`{}` doesn't take operands: `{}`".format(operator, self.text))
+            if operator == "exists":
+                return lambda d: name in d
+            return lambda d: name not in d
+        if operator in _LIST_OPERATORS:
+            if not operands:
+                raise ValueError("`{}` needs at least one operand: `{}`".format(operator, self.text))
+            if operator == "in":
+                return lambda d: any(_equals(d.get(name), operand) for operand in operands)
+            return lambda d: not any(_equals(d.get(name), operand) for operand in operands)
+        compare = _BINARY_OPERATORS.get(operator)
+        if compare is None:
+            raise ValueError("Unknown operator '{}' in `{}`".format(operator, self.text))
+        if len(operands) != 1:
+            raise ValueError("`{}` needs exactly one operand: `{}`".format(operator, self.text))
+        operand = operands[0]
+        return lambda d: compare(d.get(name), operand)
+
+    def __call__(self, d: dict) -> bool:
+        return self.test(d)
+
+    def __repr__(self) -> str:
+        return self.text
+
+class FilterStatistics:
+    """Counters of records which passed all `where` clauses and of records rejected by every clause"""
+
+    def __init__(self) -> None:
+        self.accepted = 0
+        self._rejected = {}
+        self._lock = Lock()
+
+    def add(self, accepted: int, rejected_by: List[str] = ()):
+        with self._lock:
+            self.accepted += accepted
+            for text in rejected_by:
+                self._rejected[text] = self._rejected.get(text, 0) + 1
+
+    def as_dict(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "accepted": self.accepted,
+                "rejected": sum(self._rejected.values()),
+                "rejected_by": dict(self._rejected)
+            }
+
+    def reset(self):
+        with self._lock:
+            self.accepted = 0
+            self._rejected.clear()
@@ -1,20 +1,186 @@
-from typing import Callable, Any
+import itertools
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Any, List
 
-_registered_functions: dict[str, Callable[[Any], Any]] = {}
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-def register_function(name: str, f: Callable[[Any], Any]):
-    """Register function `f` to be used in recipes under the `name` 
+DEFAULT_CACHE_SIZE = 1024
+#Counter of registrations, every registered function gets its own number, even if it replaces the function with the same name
+_registrations = itertools.count()
+
+class RegisteredFunction:
+    """Function registered to be used in recipes with `!apply`.
+
+    Function can be marked as pure (its results depend only on its argument), then results are memoized in a bounded LRU cache.
+    Function can be marked as batch-capable, then it receives a whole column of values (list or NumPy array) and returns a column of results.
+    Both kinds of functions can be called with a single value (`__call__`) or with a column of values (`call_batch`).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        f: Callable[[Any], Any],
+        is_pure: bool = False,
+        is_batch: bool = False,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        as_array: bool = False
+    ) -> None:
+        self.name = name
+        self.f = f
+        self.is_pure = is_pure
+        self.is_batch = is_batch
+        self.cache_size = cache_size
+        self.as_array = as_array and numpy is not None
+        #identity of the registration, results of the function re-registered under the same name must not be mixed with the old ones
+        self.registration = next(_registrations)
+
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _cache_key(value: Any) -> Any:
+        #type is a part of the key, because 1, 1.0 and True are equal for dict, but shouldn't share results
+        #lists and dicts are not hashable, so such values are never memoized
+        if isinstance(value, (list, dict)):
+            return None
+        return (type(value), value)
+
+    def _cache_get(self, key: Any) -> tuple[bool, Any]:
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return True, self._cache[key]
+            self.misses += 1
+            return False, None
+
+    def _cache_put(self, key: Any, result: Any):
+        with self._lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _call_column(self, values: List[Any]) -> List[Any]:
+        column = numpy.asarray(values) if self.as_array else values
+        results = self.f(column)
+        #NumPy arrays (and alike) are converted back to the lists of Python objects
+        if hasattr(results, "tolist"):
+            results = results.tolist()
+        results = list(results)
+        if len(results) != len(values):
+            raise ValueError("Batch function '{}' returned {} values for {} inputs".format(self.name, len(results), len(values)))
+        return results
+
+    def _call(self, value: Any) -> Any:
+        if self.is_batch:
+            return self._call_column([value])[0]
+        return self.f(value)
+
+    def __call__(self, value: Any) -> Any:
+        if not self.is_pure:
+            return self._call(value)
+
+        key = self._cache_key(value)
+        if key is None:
+            return self._call(value)
+        is_found, result = self._cache_get(key)
+        if is_found:
+            return result
+        result = self._call(value)
+        self._cache_put(key, result)
+        return result
+
+    def call_batch(self, values: List[Any]) -> List[Any]:
+        """Calls function for the whole column of values.
+        Batch-capable functions are called once for all values which are not found in the cache, other functions are called for every value.
+
+        Args:
+            values (List[Any]): column of values
+
+        Returns:
+            List[Any]: column of results in the same order
+        """
+        if not self.is_batch:
+            return [self(v) for v in values]
+        if not self.is_pure:
+            return self._call_column(values)
+
+        results = [None] * len(values)
+        missed_idx = []
+        missed_keys = []
+        for i, v in enumerate(values):
+            key = self._cache_key(v)
+            if key is not None:
+                is_found, result = self._cache_get(key)
+                if is_found:
+                    results[i] = result
+                    continue
+            missed_idx.append(i)
+            missed_keys.append(key)
+
+        if missed_idx:
+            missed_results = self._call_column([values[i] for i in missed_idx])
+            for i, key, result in zip(missed_idx, missed_keys, missed_results):
+                results[i] = result
+                if key is not None:
+                    self._cache_put(key, result)
+        return results
+
+    def cache_info(self) -> dict[str, int]:
+        """Returns statistics of the results cache
+
+        Returns:
+            dict[str, int]: number of hits, misses and current size of the cache
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "max_size": self.cache_size}
+
+    def cache_clear(self):
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+_registered_functions: dict[str, RegisteredFunction] = {}
+
+def register_function(
+    name: str,
+    f: Callable[[Any], Any],
+    is_pure: bool = False,
+    is_batch: bool = False,
+    cache_size: int = DEFAULT_CACHE_SIZE,
+    as_array: bool = False
+):
+    """Register function `f` to be used in recipes under the `name`
 
     Args:
         name (str): name of the function
         f (Callable[[Any], Any]): function
+        is_pure (bool, optional): results of the function depend only on its argument, so they can be memoized. Memoized results are shared between records. Defaults to False.
+        is_batch (bool, optional): function receives a column of values and returns a column of results of the same length. Defaults to False.
+        cache_size (int, optional): maximum number of memoized results for pure functions. Defaults to DEFAULT_CACHE_SIZE.
+        as_array (bool, optional): batch function receives a NumPy array instead of a list (only if NumPy is installed). Defaults to False.
     """
-    _registered_functions[name] = f
+    _registered_functions[name] = RegisteredFunction(
+        name,
+        f,
+        is_pure=is_pure,
+        is_batch=is_batch,
+        cache_size=cache_size,
+        as_array=as_array
+    )
 
-def registered_functions() -> dict[str, Callable[[Any], Any]]:
+def registered_functions() -> dict[str, RegisteredFunction]:
     """Returns the dictionary with all registered functions
 
     Returns:
-        dict[str, Callable[[Any], Any]]: dictionary with names of the functions as keys and functions as values
+        dict[str, RegisteredFunction]: dictionary with names of the functions as keys and registered functions as values
     """
     return _registered_functions
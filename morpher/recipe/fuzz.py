@@ -0,0 +1,326 @@
+"""Offline differential fuzzing of execution engines against the reference interpreter (`Recipe.morph`).
+
+Usage:
+    python -m morpher.recipe.fuzz [--iterations 200] [--records 100] [--seed 0] [--engine batch cached ...]
+
+Random records and random recipes for them are morphed by the reference interpreter and by every engine,
+results, metadata and errors are compared strictly (see `shadow.find_difference`).
+"""
+import argparse
+import json
+import random
+import string
+import sys
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, List
+from .cache import CachedRecipe, ResultCache
+from .recipe import Recipe, SourceFieldStrategy
+from .shadow import Divergence, compare_results
+from .specialization import Specializer
+from ..lexer import Lexer
+from ..morpher_parser import Parser
+
+#Engine morphs the batch of records, it's created for every recipe from its text and options of `Recipe`
+EngineFactory = Callable[[str, dict], Callable[[List[dict]], List[tuple]]]
+
+FIELD_KINDS = ["string", "number", "object", "list", "scalars"]
+CAST_TYPES = ["string", "integer", "decimal", "float", "bool", "json", "timestamp", "date", "unixtime", "unixtime_ms"]
+DEFAULT_CAST_VALUES = {"string": "x", "integer": "7", "decimal": "1.5", "float": "-2.5", "unixtime": "0", "unixtime_ms": "0"}
+
+_STRINGS = [
+    "", " ", "abc", "ABC dEf", "Straße", "é✓", "12", "-7", " 42 ", "1_000", "3.25", "-0.5e3", "1e400", "nan", "inf",
+    "true", "FALSE", "2023-01-02", "2023-01-02T03:04:05+00:00", "2023-13-45", "1700000000", "1700000000000", "null", "[1, 2]"
+]
+_NUMBERS = [
+    0, 1, -1, 7, 2 ** 31, 2 ** 53 + 1, 2 ** 63, -2 ** 63, 10 ** 20, 1700000000, 1700000000000,
+    0.0, -0.0, 0.5, -2.75, 1e-7, 1e16, 1.7e9, 1e300, True, False
+]
+
+#Templates of instructions for fields of every kind: {f} is the name of the field, {i} makes created names unique
+_TEMPLATES = {
+    "any": [
+        "take {f}",
+        "take {f} . ^safe_cast {cast}",
+        "take {f} . @ {f}_a{i} . ^default_cast {default_cast}",
+        "take {f} . ! . @suffix _s{i} . ^safe_cast {cast}",
+        "drop {f}"
+    ],
+    "string": [
+        "take {f} . ^ {cast}",
+        "take {f} . !lower . @ {f}_l{i} . ^safe_cast {cast}",
+        "take {f} . !upper . @prefix p{i}_ . ^ string",
+        "take {f}\n\t!lower . @ {f}_c{i}\n\t^default_cast {default_cast}"
+    ],
+    "number": [
+        "take {f} . ^ {cast}",
+        "take {f} . @ {f}_i{i} . ^safe_cast integer"
+    ],
+    "object": [
+        "take {f} . #partial a b . @ {f}_p{i} . ^ json",
+        "take {f} . !extract $.b.c . @ {f}_e{i} . ^safe_cast {cast}",
+        "take {f} . !extract $.data[*].n . @ {f}_x{i} . ^ json",
+        "take {f} . #partial a data . !flatten . @split",
+        "take {f} . !flatten . @split"
+    ],
+    "list": [
+        "take {f} . #first . !extract $.n . @ {f}_f{i} . ^safe_cast {cast}",
+        "take {f} . #last . @ {f}_t{i} . ^ json",
+        "take {f} . #nth {k} . @ {f}_n{i} . ^ json",
+        "take {f} . !map #partial id n . @ {f}_m{i} . ^ json",
+        "take {f} . !map !extract $.n | ^safe_cast {cast} . @ {f}_v{i} . ^ json"
+    ],
+    "scalars": [
+        "take {f} . #first . @ {f}_f{i} . ^safe_cast {cast}",
+        "take {f} . #nth {k} . @ {f}_n{i} . ^safe_cast {cast}",
+        "take {f} . !map !lower | ^safe_cast {cast} . @ {f}_v{i} . ^ json",
+        "take {f} . !map ^safe_cast {cast} . @ {f}_w{i} . ^ json"
+    ]
+}
+
+#Templates of `where` clauses, operands are taken from generated values
+_FILTER_TEMPLATES = [
+    "where {f}",
+    "where {f} exists",
+    "where {f} missing",
+    "where {f} != null",
+    "where {f} == {v}",
+    "where {f} >= {v}",
+    "where {f} < {v}",
+    "where {f} in {v} {w}",
+    "where {f} not_in {v}"
+]
+
+def _operand(rnd: random.Random) -> str:
+    return json.dumps(rnd.choice(_STRINGS + _NUMBERS + [None]), ensure_ascii=False)
+
+def generate_value(rnd: random.Random, kind: str, depth: int = 0) -> Any:
+    if rnd.random() < 0.05:
+        return None
+    if kind == "string":
+        return rnd.choice(_STRINGS) if rnd.random() < 0.8 else "".join(rnd.choices(string.ascii_letters + "é✓ ", k=rnd.randint(0, 8)))
+    if kind == "number":
+        value = rnd.choice(_NUMBERS)
+        return value if rnd.random() < 0.9 else str(value)
+    if kind == "object":
+        return {
+            "a": generate_value(rnd, rnd.choice(["string", "number"])),
+            "b": {"c": generate_value(rnd, rnd.choice(["string", "number"]))} if depth < 2 else None,
+            "data": [{"n": generate_value(rnd, "number")} for _ in range(rnd.randint(0, 3))]
+        }
+    if kind == "list":
+        return [
+            {"id": rnd.choice(["x", "Y", 1, 2.5]), "n": generate_value(rnd, rnd.choice(["number", "string"]))}
+            for _ in range(rnd.randint(0, 5))
+        ]
+    return [generate_value(rnd, rnd.choice(["string", "number"])) for _ in range(rnd.randint(0, 5))]
+
+def generate_schema(rnd: random.Random, fields: int = 6) -> dict[str, str]:
+    """Generates names of fields and their kinds"""
+    return {"{}_{}".format(kind[0], i): kind for i, kind in enumerate(rnd.choices(FIELD_KINDS, k=fields))}
+
+def generate_record(rnd: random.Random, schema: dict[str, str]) -> dict:
+    #fields are sometimes absent and sometimes of another kind, so absent values and type errors are covered too
+    record = {}
+    for name, kind in schema.items():
+        if rnd.random() < 0.1:
+            continue
+        record[name] = generate_value(rnd, kind if rnd.random() < 0.95 else rnd.choice(FIELD_KINDS))
+    return record
+
+def generate_recipe(rnd: random.Random, schema: dict[str, str], lines: int = 8) -> str:
+    result = []
+    for i in range(lines):
+        name, kind = rnd.choice(list(schema.items()))
+        template = rnd.choice(_TEMPLATES["any"] + _TEMPLATES.get(kind, []))
+        default_cast = rnd.choice(list(DEFAULT_CAST_VALUES.items()))
+        result.append(template.format(
+            f=name,
+            i=i,
+            k=rnd.randint(-3, 3),
+            cast=rnd.choice(CAST_TYPES),
+            default_cast="{} {}".format(*default_cast)
+        ))
+    #records are filtered sometimes, so rejected records are covered too
+    if rnd.random() < 0.3:
+        result.insert(rnd.randint(0, len(result)), rnd.choice(_FILTER_TEMPLATES).format(
+            f=rnd.choice(list(schema)),
+            v=_operand(rnd),
+            w=_operand(rnd)
+        ))
+    return "\n".join(result)
+
+def generate_options(rnd: random.Random) -> dict:
+    return {
+        #finalization fails for records with null source fields, so it's chosen less often
+        "source_fields_stategy": SourceFieldStrategy.AUTO_FINALIZE if rnd.random() < 0.25 else SourceFieldStrategy.AUTO_DROP,
+        "with_source_fields_timestamp_cast": rnd.random() < 0.5
+    }
+
+def compile_recipe(recipe_str: str, **options) -> Recipe:
+    return Recipe(**options).translate(Parser().parse(Lexer().tokenize(recipe_str)))
+
+def _permuted(value: Any, rnd: random.Random) -> Any:
+    #the same value with keys of all objects in another order
+    if isinstance(value, dict):
+        keys = list(value)
+        rnd.shuffle(keys)
+        return {k: _permuted(value[k], rnd) for k in keys}
+    if isinstance(value, list):
+        return [_permuted(x, rnd) for x in value]
+    return value
+
+def _cached_engine(recipe_str: str, options: dict) -> Callable[[List[dict]], List[tuple]]:
+    recipe = CachedRecipe(compile_recipe(recipe_str, **options), ResultCache())
+    rnd = random.Random(0)
+    def morph_batch(ds: List[dict]) -> List[tuple]:
+        #the first run fills the cache with duplicates in another order of keys, their results must not be returned for the records,
+        #the second run fills the cache with the records, results of the third one are returned from it
+        try:
+            recipe.morph_batch([_permuted(d, rnd) for d in ds])
+        except Exception:
+            #errors of duplicates are not compared, only their cached results matter
+            pass
+        recipe.morph_batch(ds)
+        return recipe.morph_batch(ds)
+    return morph_batch
+
+def _specialized_engine(recipe_str: str, options: dict, per_record: bool = False) -> Callable[[List[dict]], List[tuple]]:
+    recipe = compile_recipe(recipe_str, with_type_specialization=True, **options)
+    #actions are specialized after the first record, so guards fail often and specialization is dropped and rebuilt as well
+    recipe.specializer = Specializer(recipe.actions_list, warmup=1)
+    def morph_batch(ds: List[dict]) -> List[tuple]:
+        recipe.morph_batch(ds)
+        if per_record:
+            return [recipe.morph(d) for d in ds]
+        return recipe.morph_batch(ds)
+    return morph_batch
+
+def _projected_engine(recipe_str: str, options: dict) -> Callable[[List[dict]], List[tuple]]:
+    recipe = compile_recipe(recipe_str, **options)
+    decode = recipe.create_decoder()
+    def morph_batch(ds: List[dict]) -> List[tuple]:
+        #records go through JSON, so only source fields read by the recipe are decoded
+        return recipe.morph_batch([decode(json.dumps(d)) for d in ds])
+    return morph_batch
+
+def _pooled_records_engine(recipe_str: str, options: dict) -> Callable[[List[dict]], List[tuple]]:
+    recipe = compile_recipe(recipe_str, with_state_pooling=True, **options)
+    def morph_batch(ds: List[dict]) -> List[tuple]:
+        #records are morphed twice, so the second run reuses values of the same fields
+        recipe.morph_batch(ds)
+        return [recipe.morph(d) for d in ds]
+    return morph_batch
+
+ENGINES: dict[str, EngineFactory] = {
+    "batch": lambda recipe_str, options: compile_recipe(recipe_str, **options).morph_batch,
+    "memory_bounded": lambda recipe_str, options: compile_recipe(recipe_str, with_memory_bounded_state=True, **options).morph_batch,
+    "cached": _cached_engine,
+    "specialized": _specialized_engine,
+    "specialized_records": lambda recipe_str, options: _specialized_engine(recipe_str, options, per_record=True),
+    "projected": _projected_engine,
+    "pooled": lambda recipe_str, options: compile_recipe(recipe_str, with_state_pooling=True, **options).morph_batch,
+    "pooled_records": _pooled_records_engine
+}
+
+@dataclass
+class FuzzFailure:
+    """Divergence of the engine found by fuzzing with the recipe which reproduces it"""
+    engine: str
+    recipe_str: str
+    options: dict
+    divergence: Divergence
+
+def _morph_each(morph_batch: Callable[[List[dict]], List[tuple]], ds: List[dict], expected: List[Any]) -> List[Any]:
+    #error fails the whole batch, so records which fail in the reference interpreter are morphed one by one
+    #and the rest of them is morphed as one batch (it's split as well if it fails too)
+    results = [None] * len(ds)
+    batch = [i for i, reference_result in enumerate(expected) if not isinstance(reference_result, Exception)]
+    single = [i for i, reference_result in enumerate(expected) if isinstance(reference_result, Exception)]
+    try:
+        for i, result in zip(batch, morph_batch([ds[i] for i in batch])):
+            results[i] = result
+    except Exception:
+        single = range(len(ds))
+    for i in single:
+        try:
+            results[i] = morph_batch([ds[i]])[0]
+        except Exception as e:
+            results[i] = e
+    return results
+
+def _difference(reference: Any, candidate: Any) -> str:
+    if isinstance(reference, Exception) or isinstance(candidate, Exception):
+        if type(reference) is type(candidate):
+            return None
+        return "reference {} != engine {}".format(
+            repr(reference) if isinstance(reference, Exception) else "result",
+            repr(candidate) if isinstance(candidate, Exception) else "result"
+        )
+    return compare_results(reference, candidate)
+
+def fuzz(
+    iterations: int = 200,
+    records: int = 100,
+    seed: int = 0,
+    engines: Iterable[str] = None,
+    max_failures: int = 20
+) -> List[FuzzFailure]:
+    """Compares engines with the reference interpreter on random recipes and records
+
+    Args:
+        iterations (int, optional): number of random recipes. Defaults to 200.
+        records (int, optional): number of random records for every recipe. Defaults to 100.
+        seed (int, optional): seed of the random generator, so failures are reproducible. Defaults to 0.
+        engines (Iterable[str], optional): names of engines from `ENGINES`. Defaults to all of them.
+        max_failures (int, optional): fuzzing stops after this number of failures. Defaults to 20.
+
+    Returns:
+        List[FuzzFailure]: found divergences
+    """
+    rnd = random.Random(seed)
+    engine_names = list(engines or ENGINES)
+    failures = []
+    for _ in range(iterations):
+        schema = generate_schema(rnd)
+        recipe_str = generate_recipe(rnd, schema)
+        options = generate_options(rnd)
+        ds = [generate_record(rnd, schema) for _ in range(records)]
+
+        reference = compile_recipe(recipe_str, **options)
+        expected = []
+        for d in ds:
+            try:
+                expected.append(reference.morph(d))
+            except Exception as e:
+                expected.append(e)
+        for name in engine_names:
+            actual = _morph_each(ENGINES[name](recipe_str, options), ds, expected)
+            for d, reference_result, candidate_result in zip(ds, expected, actual):
+                difference = _difference(reference_result, candidate_result)
+                if difference is not None:
+                    failures.append(FuzzFailure(name, recipe_str, options, Divergence(d, difference, reference_result, candidate_result)))
+                    if len(failures) >= max_failures:
+                        return failures
+                    #one failure per engine and recipe is enough to reproduce it
+                    break
+    return failures
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--iterations", type=int, default=200)
+    arg_parser.add_argument("--records", type=int, default=100)
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--engine", dest="engines", nargs="+", choices=list(ENGINES))
+    args = arg_parser.parse_args()
+
+    failures = fuzz(args.iterations, args.records, args.seed, args.engines)
+    for failure in failures:
+        print("engine: {}, options: {}".format(failure.engine, {k: getattr(v, "name", v) for k, v in failure.options.items()}))
+        print(failure.recipe_str)
+        print("record: {!r}".format(failure.divergence.record))
+        print("difference: {}\n".format(failure.divergence.difference))
+    print("{} recipes, {} divergences".format(args.iterations, len(failures)))
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import sys
+from typing import Any, Hashable, List
+
+#Maximum number of output schemas remembered by the recipe, records with other schemas get their own layout
+MAX_LAYOUTS = 1024
+
+class FrozenDict(dict):
+    """Read-only dictionary, it's still a `dict`, so it can be serialized to JSON as usual"""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("{} is read-only, copy it with dict() to change it".format(type(self).__name__))
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = __ior__ = _readonly
+
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+class OutputLayout:
+    """Key layout and metadata of one output schema: names of final fields in their order and their types.
+
+    `keys` are interned names of fields, result dicts are built from them instead of names created for the particular record
+    `metadata` is `{name: {"type": type name}}` shared by all records of the schema, so it is read-only (see `FrozenDict`)
+    """
+    __slots__ = ("keys", "metadata")
+
+    def __init__(self, keys: List[str], type_names: List[str]) -> None:
+        self.keys = tuple(sys.intern(key) for key in keys)
+        self.metadata = FrozenDict(
+            (key, FrozenDict(type=sys.intern(type_name))) for key, type_name in zip(self.keys, type_names)
+        )
+
+    def build(self, values: List[Any]) -> dict:
+        return dict(zip(self.keys, values))
+
+class LayoutCache:
+    """Layouts of output schemas seen by the recipe.
+    The number of schemas is bounded by `max_layouts`, so records with ever-changing fields (e.g. finalized source fields) don't grow it forever.
+    Layouts are immutable, so a race between threads may only create the same layout twice.
+    """
+
+    def __init__(self, max_layouts: int = MAX_LAYOUTS) -> None:
+        self.max_layouts = max_layouts
+        self._layouts: dict[Hashable, OutputLayout] = {}
+
+    def get(self, keys: tuple, types: tuple) -> OutputLayout:
+        schema = (keys, types)
+        layout = self._layouts.get(schema)
+        if layout is None:
+            layout = OutputLayout(keys, [t.name for t in types])
+            if len(self._layouts) < self.max_layouts:
+                self._layouts[schema] = layout
+        return layout
+
+    def __len__(self) -> int:
+        return len(self._layouts)
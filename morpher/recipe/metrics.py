@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Any, Iterable, List
+
+#Upper bounds of buckets of histograms (the last bucket is always +Inf)
+DEFAULT_LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+DEFAULT_BATCH_SIZE_BUCKETS = (1, 8, 16, 32, 64, 128, 256, 512, 1024, 4096)
+DEFAULT_EXPORT_INTERVAL = 15.0
+
+class Metrics(ABC):
+    """Interface of metrics collected by the recipe (see `Recipe.metrics`).
+    Methods are called from the threads which morph records, so implementations should be thread-safe and cheap.
+    """
+
+    @abstractmethod
+    def observe_record(self, latency: float, absent_fields: List[str], null_fields: List[str], failed_fields: List[str]):
+        """Called for every morphed record
+
+        Args:
+            latency (float): time to morph the record in seconds (average time per record for batches)
+            absent_fields (List[str]): final fields which were absent in the record
+            null_fields (List[str]): final fields with null values (except absent ones)
+            failed_fields (List[str]): final fields which failed to cast
+        """
+
+    @abstractmethod
+    def observe_batch(self, size: int, latency: float):
+        """Called for every batch morphed by `Recipe.morph_batch`
+
+        Args:
+            size (int): number of records in the batch
+            latency (float): time to morph the batch in seconds
+        """
+
+    def observe_rejected(self, count: int):
+        """Called for records rejected by `where` clauses, they are not morphed and not observed as records
+
+        Args:
+            count (int): number of rejected records
+        """
+
+class Histogram:
+    """Histogram with fixed buckets, not thread-safe by itself"""
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float, count: int = 1):
+        self.counts[bisect_left(self.buckets, value)] += count
+        self.sum += value * count
+        self.count += count
+
+    def cumulative_counts(self) -> List[tuple[float, int]]:
+        result = []
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+class MetricsAggregator(Metrics):
+    """In-process aggregator of metrics: counters of records, rejected records, absent, null and failed fields per field,
+    histograms of per-record latency and batch size.
+    """
+
+    def __init__(
+        self,
+        latency_buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS,
+        batch_size_buckets: Iterable[float] = DEFAULT_BATCH_SIZE_BUCKETS
+    ) -> None:
+        self.latency_buckets = tuple(latency_buckets)
+        self.batch_size_buckets = tuple(batch_size_buckets)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.monotonic()
+            self.records = 0
+            self.rejected_records = 0
+            self.absent_fields = {}
+            self.null_fields = {}
+            self.failed_fields = {}
+            self.latency = Histogram(self.latency_buckets)
+            self.batch_size = Histogram(self.batch_size_buckets)
+
+    @staticmethod
+    def _count(counters: dict[str, int], names: List[str]):
+        for name in names:
+            counters[name] = counters.get(name, 0) + 1
+
+    def observe_record(self, latency: float, absent_fields: List[str], null_fields: List[str], failed_fields: List[str]):
+        with self._lock:
+            self.records += 1
+            self.latency.observe(latency)
+            if absent_fields:
+                self._count(self.absent_fields, absent_fields)
+            if null_fields:
+                self._count(self.null_fields, null_fields)
+            if failed_fields:
+                self._count(self.failed_fields, failed_fields)
+
+    def observe_batch(self, size: int, latency: float):
+        with self._lock:
+            self.batch_size.observe(size)
+
+    def observe_rejected(self, count: int):
+        with self._lock:
+            self.rejected_records += count
+
+    def snapshot(self) -> dict[str, Any]:
+        """Returns current values of all metrics
+
+        Returns:
+            dict[str, Any]: counters, histograms and average number of records per second since the start (or since the last reset)
+        """
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at
+            return {
+                "records": self.records,
+                "records_per_second": self.records / elapsed if elapsed > 0 else 0.0,
+                "rejected_records": self.rejected_records,
+                "absent_fields": dict(self.absent_fields),
+                "null_fields": dict(self.null_fields),
+                "cast_failures": dict(self.failed_fields),
+                "latency": {"buckets": self.latency.cumulative_counts(), "sum": self.latency.sum, "count": self.latency.count},
+                "batch_size": {"buckets": self.batch_size.cumulative_counts(), "sum": self.batch_size.sum, "count": self.batch_size.count}
+            }
+
+    def to_prometheus(self, prefix: str = "morpher") -> str:
+        """Renders metrics in Prometheus text exposition format
+
+        Args:
+            prefix (str, optional): prefix of names of metrics. Defaults to "morpher".
+
+        Returns:
+            str: metrics in text format
+        """
+        snapshot = self.snapshot()
+        lines = [
+            "# HELP {}_records_total Number of morphed records.".format(prefix),
+            "# TYPE {}_records_total counter".format(prefix),
+            "{}_records_total {}".format(prefix, snapshot["records"]),
+            "# HELP {}_rejected_records_total Number of records rejected by where clauses.".format(prefix),
+            "# TYPE {}_rejected_records_total counter".format(prefix),
+            "{}_rejected_records_total {}".format(prefix, snapshot["rejected_records"])
+        ]
+        for name, title in [
+            ("absent_fields", "Number of final fields which were absent in the record."),
+            ("null_fields", "Number of final fields with null values."),
+            ("cast_failures", "Number of failed casts of final fields.")
+        ]:
+            metric = "{}_{}_total".format(prefix, name)
+            lines.append("# HELP {} {}".format(metric, title))
+            lines.append("# TYPE {} counter".format(metric))
+            for field_name, count in sorted(snapshot[name].items()):
+                lines.append('{}{{field="{}"}} {}'.format(metric, _escape_label(field_name), count))
+        for name, title in [
+            ("latency", "Time to morph a record in seconds."),
+            ("batch_size", "Number of records in a batch.")
+        ]:
+            metric = "{}_record_latency_seconds".format(prefix) if name == "latency" else "{}_batch_size".format(prefix)
+            histogram = snapshot[name]
+            lines.append("# HELP {} {}".format(metric, title))
+            lines.append("# TYPE {} histogram".format(metric))
+            for bound, count in histogram["buckets"]:
+                lines.append('{}_bucket{{le="{}"}} {}'.format(metric, "+Inf" if bound == float("inf") else repr(bound), count))
+            lines.append("{}_sum {}".format(metric, repr(float(histogram["sum"]))))
+            lines.append("{}_count {}".format(metric, histogram["count"]))
+        return "\n".join(lines) + "\n"
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class PrometheusFileExporter:
+    """Writes metrics of the aggregator into a file in Prometheus text format, e.g. for node_exporter textfile collector.
+    The file is replaced atomically, so readers never see a partially written file.
+    """
+
+    def __init__(
+        self,
+        aggregator: MetricsAggregator,
+        path: str,
+        interval: float = DEFAULT_EXPORT_INTERVAL,
+        prefix: str = "morpher"
+    ) -> None:
+        self.aggregator = aggregator
+        self.path = path
+        self.interval = interval
+        self.prefix = prefix
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def export(self):
+        tmp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(tmp_path, "w") as f:
+            f.write(self.aggregator.to_prometheus(self.prefix))
+        os.replace(tmp_path, self.path)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.export()
+            except OSError:
+                #metrics are exported again after the interval
+                pass
+
+    def start(self) -> "PrometheusFileExporter":
+        """Starts a daemon thread which exports metrics every `interval` seconds"""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="morpher-metrics-exporter", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the exporting thread and exports final values of metrics"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+        self.export()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,123 @@
+import json
+import re
+import threading
+from typing import Any, Callable, List, Optional
+from ..morpher_parser import Instruction, InputOperation, FilterOperation, Input, Pointer, Transformation
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+#Projection maps names of members to projections of their values, None means the whole value is needed
+Projection = dict[str, Optional["Projection"]]
+
+_MISSING = object()
+
+#`!extract` paths which only select members of nested objects (e.g. `$.a.b`) let the decoder skip the rest of the object
+_SIMPLE_PATH_RE = re.compile(r"\$((?:\.[A-Za-z_][A-Za-z0-9_]*)+)")
+
+def _path_projection(path: str) -> Optional[Projection]:
+    match = _SIMPLE_PATH_RE.fullmatch(path)
+    if match is None:
+        return None
+    projection = None
+    for key in reversed(match.group(1)[1:].split(".")):
+        projection = {key: projection}
+    return projection
+
+def _merge(a: Optional[Projection], b: Optional[Projection]) -> Optional[Projection]:
+    #the whole value is needed if any of the uses needs it
+    if a is None or b is None:
+        return None
+    result = dict(a)
+    for key, projection in b.items():
+        result[key] = _merge(result[key], projection) if key in result else projection
+    return result
+
+def _instruction_projection(instruction: Instruction) -> Optional[Projection]:
+    #only `take <field> . # . !extract <simple path>` reads a part of the field, any other instruction reads the whole field
+    operations = instruction.operations
+    if (
+        len(operations) > 2
+        and operations[0].operation == Input.TAKE
+        and operations[1].operation == Pointer.FULL
+        and operations[2].operation == Transformation.EXTRACT
+    ):
+        return _path_projection(operations[2].args[0][0])
+    return None
+
+def source_projection(instructions: List[Instruction]) -> Projection:
+    """Finds source fields read by instructions and parts of them which are read with `!extract`.
+    Names of temp fields are included as well, because they can't be told apart from source fields statically.
+    Fields of `where` clauses are always read as a whole.
+
+    Args:
+        instructions (List[Instruction]): instructions of the recipe
+
+    Returns:
+        Projection: projection of the record
+    """
+    projection = {}
+    for instruction in instructions:
+        if not instruction.operations or not isinstance(instruction[0], (InputOperation, FilterOperation)):
+            continue
+        name = instruction[0].args[0][0]
+        field_projection = _instruction_projection(instruction) if isinstance(instruction[0], InputOperation) else None
+        projection[name] = _merge(projection[name], field_projection) if name in projection else field_projection
+    return projection
+
+class ProjectingDecoder:
+    """Decoder of JSON records which materializes only members of the projection.
+
+    Records are parsed by simdjson, which skips unreferenced members without creating Python objects for them.
+    Records which simdjson rejects (e.g. integers beyond 64 bits, NaN, lone surrogates) and records which aren't objects
+    are decoded by `json.loads`, so errors and values stay the same. Unlike `json.loads`, the first one of duplicate keys is taken.
+    """
+
+    def __init__(self, projection: Projection) -> None:
+        self.projection = projection
+        #parser can't be shared between threads and it's reused only after all objects of the previous document are released
+        self._local = threading.local()
+
+    def _parser(self) -> Any:
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            parser = self._local.parser = simdjson.Parser()
+        return parser
+
+    def _project(self, obj: Any, projection: Projection) -> dict:
+        result = {}
+        for key, value_projection in projection.items():
+            value = obj.get(key, _MISSING)
+            if value is _MISSING:
+                continue
+            if value.__class__ is simdjson.Object:
+                value = value.as_dict() if value_projection is None else self._project(value, value_projection)
+            elif value.__class__ is simdjson.Array:
+                value = value.as_list()
+            result[key] = value
+        return result
+
+    def decode(self, raw: bytes | str) -> Any:
+        try:
+            doc = self._parser().parse(raw)
+            if doc.__class__ is simdjson.Object:
+                return self._project(doc, self.projection)
+        except (ValueError, RuntimeError):
+            pass
+        doc = None
+        return json.loads(raw)
+
+def create_decoder(projection: Optional[Projection]) -> Callable[[bytes | str], Any]:
+    """Returns the decoder of records for the projection: `ProjectingDecoder.decode` if simdjson is installed, `json.loads` otherwise
+
+    Args:
+        projection (Optional[Projection]): projection of the record, None if the whole record is needed
+
+    Returns:
+        Callable[[bytes | str], Any]: function which decodes a JSON record
+    """
+    if projection is None or simdjson is None:
+        return json.loads
+    return ProjectingDecoder(projection).decode
@@ -1,10 +1,21 @@
+import hashlib
+import threading
+import time
 from copy import copy
 from enum import Enum 
-from typing import List, Any
+from typing import Callable, List, Any, Optional
 from .state import MorphState
 from .values import Value
-from .value_types import TempType, FinalType
+from .value_types import TempType, FinalType, CastStatistics
 from .actions import *
+from .explain import Plan, explain_recipe, DEFAULT_CALIBRATION_RUNS
+from .metrics import Metrics
+from .layout import LayoutCache
+from .specialization import Specializer, dict_to_state as specialized_dict_to_state
+from .projection import source_projection, create_decoder
+from .filters import RecordFilter, FilterStatistics, is_filter_instruction
+from .context import MorphContext
+from .functions import RegisteredFunction
 from ..morpher_parser import Instruction, Input, Pointer, Transformation, Naming, Casting
 from ..morpher_parser import InputOperation, PointerOperation, TransformationOperation, NamingOperation, CastingOperation
 
@@ -25,6 +36,7 @@ class Recipe:
         Transformation.APPLY: Apply,
         Transformation.LOWER: Lower,
         Transformation.UPPER: Upper,
+        Transformation.MAP: Map,
         Naming.ALIAS: Alias,
         Naming.PREFIX: Prefix,
         Naming.SUFFIX: Suffix,
@@ -46,21 +58,47 @@ class Recipe:
     def __init__(
         self, 
         source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP, 
-        with_source_fields_timestamp_cast: bool = False
+        with_source_fields_timestamp_cast: bool = False,
+        with_memory_bounded_state: bool = False,
+        metrics: Metrics = None,
+        with_type_specialization: bool = False,
+        with_state_pooling: bool = False
     ) -> None:
         self.source_fields_stategy = source_fields_stategy
         self.with_source_fields_timestamp_cast = with_source_fields_timestamp_cast
+        #in memory-bounded mode fields are released right after the last instruction which reads them
+        #and the returned state keeps only final and dropped fields
+        self.with_memory_bounded_state = with_memory_bounded_state
+        #actions are specialized for classes of values observed in the first records (see `Specializer`)
+        self.with_type_specialization = with_type_specialization
+        self.specializer = None
+        #states and values of source fields are reused between records by every thread (see `MorphContext`),
+        #so states are not returned, they are None
+        self.with_state_pooling = with_state_pooling
+        self._contexts = threading.local()
+        #source fields and their parts read by the recipe, None if the whole record is needed (see `create_decoder`)
+        self.projection = None
+        #predicates of `where` clauses, records which don't pass them are not morphed at all
+        self.filters = ()
+        self.filter_statistics = FilterStatistics()
+        self.live_names = None
         self.is_set_up = False
+        self.fingerprint = None
+        #registered functions called by `!apply` (including `!map` steps), resolved when the recipe is translated
+        self.functions = ()
+        #counters of all cast actions of the recipe, including finalization ones
+        self.statistics = CastStatistics()
+        self.layouts = LayoutCache()
+        #nothing is measured without metrics, so there is no overhead by default
+        self.metrics = metrics
 
     def _create_default_instruction(self, field_name: str, original_type: TempType, value: Any) -> Instruction:
         final_type = self._initial_type_to_final_type[original_type]
         
         if final_type == "string" and self.with_source_fields_timestamp_cast:
-            try:
-                FinalType.TIMESTAMP.cast(value)
+            _, e = FinalType.TIMESTAMP.converter()(value)
+            if e is None:
                 final_type = "timestamp"
-            except Exception as e:
-                pass
         
         ops = [
             InputOperation.new(Input.TAKE, [field_name]),
@@ -72,22 +110,34 @@ class Recipe:
 
         return Instruction(ops)
 
-    def _process_source_fields(self, source_fields: dict[str, Value]) -> List[Action]:
+    def _create_finalization_instructions(self, source_fields: dict[str, Value]) -> List[Instruction]:
         if self.source_fields_stategy == SourceFieldStrategy.AUTO_DROP:
-            self.finalization_instructions = []
-            return self.actions_list 
+            return []
         elif self.source_fields_stategy == SourceFieldStrategy.AUTO_FINALIZE:
             instructions = []
             for k, v in source_fields.items():
                 instructions.append(self._create_default_instruction(k, v.original_type, v.value))
-            actions = self._translate_ops_to_actions(instructions)
-            self.finalization_instructions = instructions
-            self.actions_list = actions + self.actions_list
-            return self.actions_list
+            return instructions
         else:
             raise ValueError
 
-    def _translate_ops_to_actions(self, instructions: List[Instruction]) -> List[Action]:
+    def _create_finalization_actions(self, source_fields: dict[str, Value]) -> tuple[Action, ...]:
+        instructions = self._create_finalization_instructions(source_fields)
+        if not instructions:
+            return ()
+        actions = self._translate_ops_to_actions(instructions, self.live_names)
+        if self.with_memory_bounded_state:
+            actions += (ReleaseFields([source_fields.keys(), self.live_names]),)
+        return actions
+
+    def _process_source_fields(self, source_fields: dict[str, Value]) -> tuple[Action, ...]:
+        #finalization actions are created for every record and never stored in the recipe, so the recipe is not changed during morphing
+        actions = self._create_finalization_actions(source_fields)
+        if not actions:
+            return self.actions_list
+        return actions + self.actions_list
+
+    def _translate_ops_to_actions(self, instructions: List[Instruction], live_names: frozenset = None) -> tuple[Action, ...]:
         actions_list = []
         for instruction in instructions:
             for op in instruction:
@@ -95,15 +145,191 @@ class Recipe:
                 if action_class is None:
                     raise ValueError
                 action = action_class(*op.args)
+                if isinstance(action, Cast):
+                    action.statistics = self.statistics
+                if live_names is not None:
+                    action.live_names = live_names
                 actions_list.append(action)
-        return actions_list
+        #compiled actions are immutable, so one recipe can be shared between threads
+        return tuple(actions_list)
+
+    @staticmethod
+    def _field_name(instruction: Instruction) -> Optional[str]:
+        #instruction starts with Input operation with the name of the field as the only argument
+        if not instruction.operations or not isinstance(instruction[0], InputOperation):
+            return None
+        return instruction[0].args[0][0]
+
+    def _live_names_after(self, instructions: List[Instruction]) -> List[frozenset]:
+        """Liveness analysis of fields: for every instruction finds names of fields read by any of the following instructions.
+        Fields are read only by Input operations, so the field is live until the last instruction which takes or drops it.
+
+        Args:
+            instructions (List[Instruction]): instructions of the recipe
+
+        Returns:
+            List[frozenset]: names of fields which are live after every instruction
+        """
+        live_names_after = [None] * len(instructions)
+        live_names = frozenset()
+        for i in range(len(instructions) - 1, -1, -1):
+            live_names_after[i] = live_names
+            name = self._field_name(instructions[i])
+            if name is not None:
+                live_names = live_names | {name}
+        self.live_names = live_names
+        return live_names_after
+
+    def _create_fingerprint(self) -> str:
+        #identity of the recipe: options and instructions which affect results, but not the memory mode
+        h = hashlib.sha256()
+        h.update("{}|{}".format(self.source_fields_stategy.name, self.with_source_fields_timestamp_cast).encode("utf-8"))
+        for instruction in self.original_instructions:
+            h.update(repr(instruction).encode("utf-8"))
+        return h.hexdigest()
+
+    @staticmethod
+    def _used_functions(actions: tuple[Action, ...]) -> tuple[RegisteredFunction, ...]:
+        functions = []
+        for action in actions:
+            if isinstance(action, Apply):
+                functions.append(action.f)
+            elif isinstance(action, Map):
+                functions.extend(step for step in action.steps if isinstance(step, RegisteredFunction))
+        return tuple(functions)
 
     def translate(self, instructions: List[Instruction]):
-        self.original_instructions = instructions
-        self.actions_list = self._translate_ops_to_actions(instructions)
+        self.original_instructions = tuple(instructions)
+        self.fingerprint = self._create_fingerprint()
+        #`where` clauses don't produce actions, they are checked against the raw record before it's converted to the state
+        self.filters = tuple(RecordFilter(x[0].args[0]) for x in instructions if is_filter_instruction(x))
+        if self.filters:
+            instructions = [x for x in instructions if not is_filter_instruction(x)]
+        #actions of every instruction, in memory-bounded mode they are followed by release of fields which are not read anymore
+        instruction_actions = []
+        if not self.with_memory_bounded_state:
+            for instruction in instructions:
+                instruction_actions.append(self._translate_ops_to_actions([instruction]))
+        else:
+            for instruction, live_names in zip(instructions, self._live_names_after(instructions)):
+                actions = self._translate_ops_to_actions([instruction], live_names)
+                name = self._field_name(instruction)
+                if name is not None and name not in live_names:
+                    actions += (ReleaseFields([[name], live_names]),)
+                instruction_actions.append(actions)
+        self.instruction_actions = tuple(instruction_actions)
+        self.actions_list = tuple(action for actions in instruction_actions for action in actions)
+        self.functions = self._used_functions(self.actions_list)
+        if self.with_type_specialization:
+            self.specializer = Specializer(self.actions_list)
+        if self.source_fields_stategy == SourceFieldStrategy.AUTO_DROP:
+            #fields which are not read by instructions never get into the result, so they don't have to be decoded
+            self.projection = source_projection(self.original_instructions)
         self.is_set_up = True
         return self
 
+    def explain(self, sample: dict = None, runs: int = DEFAULT_CALIBRATION_RUNS) -> Plan:
+        """Returns the execution plan of the recipe: actions of every instruction with the source line, injected default operations,
+        cast kernels, fields read and written by the instruction and applied optimizations.
+        If the sample record is provided, the cost of every action is estimated by morphing it `runs` times.
+
+        Args:
+            sample (dict, optional): record to calibrate costs. Defaults to None.
+            runs (int, optional): number of calibration runs. Defaults to DEFAULT_CALIBRATION_RUNS.
+
+        Raises:
+            ValueError: recipe is not translated yet
+
+        Returns:
+            Plan: plan of the recipe, `str(plan)` is a human-readable report
+        """
+        if not self.is_set_up:
+            raise ValueError
+        return explain_recipe(self, sample, runs)
+
+    def create_decoder(self) -> Callable[[bytes | str], Any]:
+        """Returns the decoder of JSON records which materializes only source fields (and parts of them for `!extract`) read by the recipe.
+        Results of morphing decoded records are the same, but their states don't have unreferenced source fields.
+        The whole record is decoded with `AUTO_FINALIZE` strategy or when simdjson isn't installed.
+
+        Raises:
+            ValueError: recipe is not translated yet
+
+        Returns:
+            Callable[[bytes | str], Any]: function which decodes a JSON record
+        """
+        if not self.is_set_up:
+            raise ValueError
+        return create_decoder(self.projection)
+
+    def cast_statistics(self) -> dict[str, dict[str, int]]:
+        """Returns counters of casts per final field name since the recipe was created (or since the last reset)
+
+        Returns:
+            dict[str, dict[str, int]]: numbers of successful casts, failed casts and null values for every field
+        """
+        return self.statistics.as_dict()
+
+    def reset_cast_statistics(self):
+        self.statistics.reset()
+
+    def filtering_statistics(self) -> dict[str, Any]:
+        """Returns counters of `where` clauses since the recipe was created (or since the last reset)
+
+        Returns:
+            dict[str, Any]: numbers of accepted and rejected records and of records rejected by every clause (the first one which failed)
+        """
+        return self.filter_statistics.as_dict()
+
+    def reset_filtering_statistics(self):
+        self.filter_statistics.reset()
+
+    def accepts(self, d: dict) -> bool:
+        """Checks the record against `where` clauses of the recipe, the result is counted in filtering statistics
+
+        Args:
+            d (dict): record
+
+        Returns:
+            bool: True if the record passes all clauses
+        """
+        for record_filter in self.filters:
+            if not record_filter.test(d):
+                self.filter_statistics.add(0, [record_filter.text])
+                if self.metrics is not None:
+                    self.metrics.observe_rejected(1)
+                return False
+        self.filter_statistics.add(1)
+        return True
+
+    def _accepted_positions(self, ds: List[dict]) -> Optional[List[int]]:
+        #positions of records which pass all clauses, None if all of them do
+        positions = []
+        rejected_by = []
+        for i, d in enumerate(ds):
+            for record_filter in self.filters:
+                if not record_filter.test(d):
+                    rejected_by.append(record_filter.text)
+                    break
+            else:
+                positions.append(i)
+        self.filter_statistics.add(len(positions), rejected_by)
+        if not rejected_by:
+            return None
+        if self.metrics is not None:
+            self.metrics.observe_rejected(len(rejected_by))
+        return positions
+
+    def specialization_statistics(self) -> Optional[dict[str, Any]]:
+        """Returns counters of type specialization: specializations, specialized actions, deoptimizations (failed guards) and dropped specializations
+
+        Returns:
+            Optional[dict[str, Any]]: counters or None if type specialization is off
+        """
+        if self.specializer is None:
+            return None
+        return self.specializer.stats()
+
     def dict_to_state(self, s: dict) -> MorphState:
         source_fields = {}
         for k,v in s.items():
@@ -113,27 +339,122 @@ class Recipe:
 
     def _state_to_dict_and_metadata(self, state: MorphState) -> tuple[dict, dict, MorphState]:
         final_fields = state.final_fields
-        dropped_fields = state.dropped_fields
-        result = {}
-        metadata = {}
+        keys = []
+        types = []
+        values = []
+        #final fields of dropped source fields are already removed by `Drop`
         for k,v in final_fields.items():
-            if v == dropped_fields.get(k, None):
+            keys.append(k)
+            types.append(v.actual_type)
+            values.append(v.value)
+        #metadata is shared by all records with the same output schema and result keys are interned names of the layout
+        layout = self.layouts.get(tuple(keys), tuple(types))
+        result = layout.build(values)
+        metadata = layout.metadata
+        if self.with_memory_bounded_state:
+            state.source_fields.clear()
+            state.temp_fields.clear()
+            state.lazy_fields.clear()
+            state.value = None
+        #pooled state is reused by the next record, so it never leaves the recipe
+        return result, metadata, None if self.with_state_pooling else state
+
+    def _context(self) -> MorphContext:
+        context = getattr(self._contexts, "context", None)
+        if context is None:
+            context = self._contexts.context = MorphContext()
+        return context
+
+    def _observe_record(self, latency: float, state: MorphState, result: dict):
+        absent_fields = []
+        null_fields = []
+        for k, v in state.final_fields.items():
+            if k not in result:
                 continue
-            result[k] = v.value
-            metadata[k] = {
-                "type": v.actual_type.name
-            }
-        return result, metadata, state
+            if isinstance(v, AbsentValue):
+                absent_fields.append(k)
+            elif v.value is None:
+                null_fields.append(k)
+        self.metrics.observe_record(latency, absent_fields, null_fields, state.failed_fields)
+
+    def morph(self, d: dict) -> Optional[tuple[dict, dict, MorphState]]:
+        if not self.is_set_up:
+            raise ValueError
+        if self.filters and not self.accepts(d):
+            return None
+        if self.metrics is not None:
+            started_at = time.perf_counter()
+        if self.with_state_pooling:
+            state = self._context().state(d)
+        elif self.specializer is not None:
+            state = specialized_dict_to_state(d)
+        else:
+            state = copy(self.dict_to_state(d))
+        if self.specializer is not None:
+            #finalization actions depend on the source fields of the particular record, so they are never specialized
+            for action in self._create_finalization_actions(state.source_fields):
+                state = action.run(state)
+            state = self.specializer.run(state)
+        else:
+            for action in self._process_source_fields(state.source_fields):
+                state = action.run(state)
 
-    def morph(self, d: dict) -> tuple[dict, dict, MorphState]:
+        result = self._state_to_dict_and_metadata(state)
+        if self.metrics is not None:
+            self._observe_record(time.perf_counter() - started_at, state, result[0])
+        return result
+
+    def morph_batch(self, ds: List[dict]) -> List[Optional[tuple[dict, dict, MorphState]]]:
+        """Morphs the batch of records.
+        Every action runs for the whole batch before the next one, so actions are able to process the column of values at once (see `Action.run_batch`).
+        Records rejected by `where` clauses are not morphed, their results are None.
+
+        Args:
+            ds (List[dict]): records to morph
+
+        Raises:
+            ValueError: recipe is not translated yet
+
+        Returns:
+            List[Optional[tuple[dict, dict, MorphState]]]: results, metadata and states for every record in the same order
+        """
         if not self.is_set_up:
             raise ValueError
-        initial_state = self.dict_to_state(d)
-        actual_actions_list = self._process_source_fields(initial_state.source_fields)
-        state = copy(initial_state)
-        for action in actual_actions_list:
-            state = action.run(state)
+        if self.filters:
+            positions = self._accepted_positions(ds)
+            if positions is not None:
+                results = [None] * len(ds)
+                for i, result in zip(positions, self._morph_batch([ds[i] for i in positions])):
+                    results[i] = result
+                return results
+        return self._morph_batch(ds)
 
-        return self._state_to_dict_and_metadata(state)
+    def _morph_batch(self, ds: List[dict]) -> List[tuple[dict, dict, MorphState]]:
+        if self.metrics is not None:
+            started_at = time.perf_counter()
+        if self.with_state_pooling:
+            initial_states = self._context().batch_states(ds)
+        else:
+            dict_to_state = self.dict_to_state if self.specializer is None else specialized_dict_to_state
+            initial_states = [copy(dict_to_state(d)) for d in ds]
+        states = []
+        for state in initial_states:
+            #finalization instructions depend on the source fields of the particular record
+            for action in self._create_finalization_actions(state.source_fields):
+                state = action.run(state)
+            states.append(state)
 
+        if self.specializer is not None:
+            states = self.specializer.run_batch(states)
+        else:
+            for action in self.actions_list:
+                states = action.run_batch(states)
 
+        results = [self._state_to_dict_and_metadata(state) for state in states]
+        if self.metrics is not None and results:
+            latency = time.perf_counter() - started_at
+            self.metrics.observe_batch(len(results), latency)
+            #records of the batch are morphed together, so every record gets the average latency
+            for state, (result, _, _) in zip(states, results):
+                self._observe_record(latency / len(results), state, result)
+        return results
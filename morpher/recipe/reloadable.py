@@ -0,0 +1,157 @@
+import hashlib
+import os
+import threading
+from typing import Callable, List, Optional
+from .recipe import Recipe, SourceFieldStrategy
+from .metrics import Metrics
+from .state import MorphState
+from ..lexer import Lexer
+from ..morpher_parser import Parser
+
+DEFAULT_POLL_INTERVAL = 1.0
+
+class ReloadableRecipe:
+    """Handle to a recipe which is recompiled when its `.morph` file changes.
+
+    The file is polled by its modification time and size, and its content is compared by hash, so touching the file without changes doesn't recompile it.
+    A new recipe is compiled aside and swapped atomically, so calls which have already started finish with the previous version.
+    If the new text fails to lex, parse or translate, the last good recipe stays active and the error is available in `last_error`.
+    """
+
+    def __init__(
+        self,
+        recipe_path: str,
+        source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP,
+        with_source_fields_timestamp_cast: bool = False,
+        with_memory_bounded_state: bool = False,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        on_reload: Optional[Callable[[Recipe], None]] = None,
+        on_error: Optional[Callable[[Exception], None]] = None,
+        metrics: Metrics = None,
+        with_type_specialization: bool = False,
+        with_state_pooling: bool = False
+    ) -> None:
+        self.recipe_path = recipe_path
+        self.source_fields_stategy = source_fields_stategy
+        self.with_source_fields_timestamp_cast = with_source_fields_timestamp_cast
+        self.with_memory_bounded_state = with_memory_bounded_state
+        self.with_type_specialization = with_type_specialization
+        self.with_state_pooling = with_state_pooling
+        self.poll_interval = poll_interval
+        self.on_reload = on_reload
+        self.on_error = on_error
+        #all versions of the recipe report to the same metrics
+        self.metrics = metrics
+
+        self.version = 0
+        self.last_error = None
+        self.last_callback_error = None
+        self._recipe = None
+        self._stat = None
+        self._digest = None
+        self._check_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        #the first version is compiled synchronously, so errors in the initial recipe are raised immediately
+        if not self.check():
+            raise self.last_error
+
+    @property
+    def recipe(self) -> Recipe:
+        """Currently active recipe"""
+        return self._recipe
+
+    def _compile(self, recipe_str: str) -> Recipe:
+        tokens = Lexer().tokenize(recipe_str)
+        instructions = Parser().parse(tokens)
+        return Recipe(
+            source_fields_stategy=self.source_fields_stategy,
+            with_source_fields_timestamp_cast=self.with_source_fields_timestamp_cast,
+            with_memory_bounded_state=self.with_memory_bounded_state,
+            metrics=self.metrics,
+            with_type_specialization=self.with_type_specialization,
+            with_state_pooling=self.with_state_pooling
+        ).translate(instructions)
+
+    def _call_back(self, callback: Optional[Callable], arg: Recipe | Exception):
+        #errors of callbacks don't change the result of the check and never stop the watcher, the last one is kept in `last_callback_error`
+        if callback is None:
+            return
+        try:
+            callback(arg)
+        except Exception as e:
+            e.add_note("Error in callback of reloading recipe: {}".format(self.recipe_path))
+            self.last_callback_error = e
+
+    def check(self) -> bool:
+        """Checks the file and recompiles the recipe if its content has changed.
+        Callbacks are called after the check, their errors are kept in `last_callback_error`
+
+        Returns:
+            bool: False if the file can't be read or compiled, True otherwise
+        """
+        with self._check_lock:
+            reloaded = None
+            try:
+                st = os.stat(self.recipe_path)
+                stat = (st.st_mtime_ns, st.st_size)
+                if stat == self._stat:
+                    return True
+
+                with open(self.recipe_path, "rb") as f:
+                    content = f.read()
+                #failed version is not retried until the file changes again
+                self._stat = stat
+                digest = hashlib.sha256(content).digest()
+                if digest != self._digest:
+                    recipe = self._compile(content.decode("utf-8"))
+                    #swapping a reference is atomic, calls in progress keep using the recipe they've already got
+                    self._recipe = recipe
+                    self._digest = digest
+                    self.version += 1
+                    reloaded = recipe
+                self.last_error = None
+            except Exception as e:
+                e.add_note("Error in reloading recipe: {}".format(self.recipe_path))
+                self.last_error = e
+                self._call_back(self.on_error, e)
+                return False
+            if reloaded is not None:
+                self._call_back(self.on_reload, reloaded)
+            return True
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                #the watcher keeps polling whatever happens, so hot reload never stops silently
+                self.last_error = e
+
+    def start(self) -> "ReloadableRecipe":
+        """Starts watching the file in a background thread"""
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._watch, name="morpher-recipe-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops watching the file"""
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def morph(self, d: dict) -> Optional[tuple[dict, dict, MorphState]]:
+        return self._recipe.morph(d)
+
+    def morph_batch(self, ds: List[dict]) -> List[Optional[tuple[dict, dict, MorphState]]]:
+        return self._recipe.morph_batch(ds)
@@ -0,0 +1,219 @@
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, List, Optional
+from .recipe import Recipe
+from .state import MorphState
+
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_MAX_DIVERGENCES = 100
+
+def find_difference(reference: Any, candidate: Any, path: str = "") -> Optional[str]:
+    """Compares values strictly: types, order of keys and values must be the same (e.g. 1 differs from 1.0 and True, NaN equals NaN)
+
+    Args:
+        reference (Any): expected value
+        candidate (Any): actual value
+        path (str, optional): path of compared values used in the description. Defaults to "".
+
+    Returns:
+        Optional[str]: description of the first difference or None if values are the same
+    """
+    if isinstance(reference, dict) and isinstance(candidate, dict):
+        if list(reference) != list(candidate):
+            return "{}: keys {} != {}".format(path or "$", list(reference), list(candidate))
+        for k, v in reference.items():
+            difference = find_difference(v, candidate[k], "{}.{}".format(path or "$", k))
+            if difference is not None:
+                return difference
+        return None
+    if type(reference) is not type(candidate):
+        return "{}: {!r} ({}) != {!r} ({})".format(path or "$", reference, type(reference).__name__, candidate, type(candidate).__name__)
+    if isinstance(reference, (list, tuple)):
+        if len(reference) != len(candidate):
+            return "{}: length {} != {}".format(path or "$", len(reference), len(candidate))
+        for i, (a, b) in enumerate(zip(reference, candidate)):
+            difference = find_difference(a, b, "{}[{}]".format(path or "$", i))
+            if difference is not None:
+                return difference
+        return None
+    if isinstance(reference, float) and math.isnan(reference) and math.isnan(candidate):
+        return None
+    if reference != candidate:
+        return "{}: {!r} != {!r}".format(path or "$", reference, candidate)
+    return None
+
+def compare_results(reference: Optional[tuple], candidate: Optional[tuple]) -> Optional[str]:
+    """Compares results and metadata of two engines (states are not compared), None is the result of the record rejected by `where` clauses
+
+    Returns:
+        Optional[str]: description of the first difference or None if results and metadata are the same
+    """
+    if reference is None or candidate is None:
+        if reference is candidate:
+            return None
+        return "record is rejected by {}".format("the reference" if reference is None else "the engine")
+    difference = find_difference(reference[0], candidate[0], "result")
+    if difference is None:
+        difference = find_difference(reference[1], candidate[1], "metadata")
+    return difference
+
+@dataclass
+class Divergence:
+    """Record for which the engine returned something else than the reference interpreter.
+    `reference` and `candidate` are (result, metadata) tuples or the error raised
+    """
+    record: dict
+    difference: str
+    reference: Any
+    candidate: Any
+
+@dataclass
+class ShadowReport:
+    """Results of the shadow verification.
+
+    `records` is the number of records morphed by the engine, `sampled` is the number of them verified with the reference interpreter
+    `reference_time` and `engine_time` are total times spent on sampled records in seconds
+    `divergences` keeps at most `max_divergences` first divergences, `divergence_count` counts all of them
+    """
+    records: int = 0
+    sampled: int = 0
+    divergence_count: int = 0
+    reference_time: float = 0.0
+    engine_time: float = 0.0
+    divergences: List[Divergence] = field(default_factory=list)
+
+    @property
+    def speedup(self) -> float:
+        """Ratio of the time of the reference interpreter to the time of the engine on sampled records"""
+        return self.reference_time / self.engine_time if self.engine_time > 0 else 0.0
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "records": self.records,
+            "sampled": self.sampled,
+            "divergences": self.divergence_count,
+            "divergence_ratio": self.divergence_count / self.sampled if self.sampled else 0.0,
+            "reference_time": self.reference_time,
+            "engine_time": self.engine_time,
+            "speedup": self.speedup
+        }
+
+class ShadowRecipe:
+    """Recipe which morphs records with a fast engine and verifies a sample of them with the reference interpreter (`Recipe.morph`).
+
+    The engine is anything with `morph` and `morph_batch` (e.g. `Recipe` used in batches, `CachedRecipe`, `ReloadableRecipe`),
+    its results are always returned, so the shadow mode never changes the output. Sampled records are morphed by the reference
+    recipe too, results and metadata are compared strictly (see `find_difference`) and divergences are recorded in the report.
+    Errors are compared as well: the engine error is raised as usual after it's verified, an engine error for a record the reference morphs
+    and a reference error for a successful engine result are divergences (the error is kept as `candidate` or `reference`).
+    An error of the batch is expected if the reference raises an error of the same type for any record of the batch.
+    """
+
+    def __init__(
+        self,
+        engine: Any,
+        reference: Recipe,
+        sample_rate: float = DEFAULT_SAMPLE_RATE,
+        max_divergences: int = DEFAULT_MAX_DIVERGENCES,
+        seed: int = None
+    ) -> None:
+        if not 0 <= sample_rate <= 1:
+            raise ValueError("Sample rate should be between 0 and 1")
+        self.engine = engine
+        self.reference = reference
+        self.sample_rate = sample_rate
+        self.max_divergences = max_divergences
+        self.report = ShadowReport()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _is_sampled(self) -> bool:
+        with self._lock:
+            return self.sample_rate >= 1 or self._random.random() < self.sample_rate
+
+    def _run_reference(self, d: dict) -> tuple[Any, float]:
+        started_at = time.perf_counter()
+        try:
+            reference = self.reference.morph(d)
+        except Exception as e:
+            reference = e
+        return reference, time.perf_counter() - started_at
+
+    @staticmethod
+    def _difference(reference: Any, candidate: Any, is_expected_error: bool) -> Optional[str]:
+        if isinstance(candidate, Exception):
+            if is_expected_error or (isinstance(reference, Exception) and type(reference) is type(candidate)):
+                return None
+            return "engine raised {!r}".format(candidate)
+        if isinstance(reference, Exception):
+            return "reference raised {!r}".format(reference)
+        return compare_results(reference, candidate)
+
+    def _verify(self, d: dict, candidate: Any, engine_time: float, reference: tuple[Any, float] = None, is_expected_error: bool = False):
+        #candidate is the result of the engine or the error it raised
+        reference, reference_time = reference or self._run_reference(d)
+        difference = self._difference(reference, candidate, is_expected_error)
+        if not isinstance(reference, Exception) and reference is not None:
+            reference = reference[:2]
+        if not isinstance(candidate, Exception) and candidate is not None:
+            candidate = candidate[:2]
+        with self._lock:
+            self.report.sampled += 1
+            self.report.reference_time += reference_time
+            self.report.engine_time += engine_time
+            if difference is not None:
+                self.report.divergence_count += 1
+                if len(self.report.divergences) < self.max_divergences:
+                    self.report.divergences.append(Divergence(d, difference, reference, candidate))
+
+    def morph(self, d: dict) -> Optional[tuple[dict, dict, Optional[MorphState]]]:
+        is_sampled = self._is_sampled()
+        started_at = time.perf_counter()
+        try:
+            result = self.engine.morph(d)
+        except Exception as e:
+            with self._lock:
+                self.report.records += 1
+            if is_sampled:
+                self._verify(d, e, time.perf_counter() - started_at)
+            raise
+        engine_time = time.perf_counter() - started_at
+        with self._lock:
+            self.report.records += 1
+        if is_sampled:
+            self._verify(d, result, engine_time)
+        return result
+
+    def _verify_failed_batch(self, ds: List[dict], sampled: List[int], error: Exception, engine_time: float):
+        #the error of the batch may come from any of its records, so it's expected for every sampled record
+        #if the reference raises an error of the same type for any record of the batch
+        references = [self._run_reference(d) for d in ds]
+        is_expected_error = any(isinstance(reference, Exception) and type(reference) is type(error) for reference, _ in references)
+        for i in sampled:
+            self._verify(ds[i], error, engine_time, references[i], is_expected_error)
+
+    def morph_batch(self, ds: List[dict]) -> List[Optional[tuple[dict, dict, Optional[MorphState]]]]:
+        sampled = [i for i in range(len(ds)) if self._is_sampled()]
+        started_at = time.perf_counter()
+        try:
+            results = self.engine.morph_batch(ds)
+        except Exception as e:
+            with self._lock:
+                self.report.records += len(ds)
+            if sampled:
+                self._verify_failed_batch(ds, sampled, e, (time.perf_counter() - started_at) / len(ds))
+            raise
+        #records of the batch are morphed together, so every record gets the average time
+        engine_time = (time.perf_counter() - started_at) / len(ds) if ds else 0.0
+        with self._lock:
+            self.report.records += len(ds)
+        for i in sampled:
+            self._verify(ds[i], results[i], engine_time)
+        return results
+
+    def reset_report(self):
+        with self._lock:
+            self.report = ShadowReport()
@@ -0,0 +1,193 @@
+from threading import Lock
+from typing import Any, Callable, List, Optional
+from .actions import Action
+from .state import MorphState
+from .values import Value, NullValue, ListValue, ScalarValue, ObjectValue
+from .value_types import TempType
+
+#Number of records observed before actions are specialized
+DEFAULT_WARMUP_RECORDS = 100
+#Specialization is dropped and types are observed again when guards fail for a larger share of records
+DEFAULT_MAX_DEOPTIMIZATION_RATIO = 0.1
+
+#Value classes and temp types by the exact type of the raw value, it's the same mapping as the isinstance chain of `Value.create_value`
+#(bool is a subclass of int, so booleans are integers there), values of other types (e.g. subclasses of dict) go through `Value.create_value`
+_value_classes = {
+    int: (ScalarValue, TempType.INTEGER),
+    bool: (ScalarValue, TempType.INTEGER),
+    float: (ScalarValue, TempType.FLOAT),
+    str: (ScalarValue, TempType.STRING),
+    list: (ListValue, TempType.LIST),
+    dict: (ObjectValue, TempType.OBJECT),
+    type(None): (NullValue, None)
+}
+
+def dict_to_state(d: dict) -> MorphState:
+    """Same as `Recipe.dict_to_state`, but the class of every value is found by one lookup instead of the chain of isinstance checks"""
+    source_fields = {}
+    for k, v in d.items():
+        value_class = _value_classes.get(v.__class__)
+        if value_class is None:
+            source_fields[k] = Value.create_value(k, v)
+        else:
+            cls, temp_type = value_class
+            source_fields[k] = cls(k, k, temp_type, temp_type, v)
+    return MorphState(source_fields)
+
+class _Chain:
+    """Actions of the recipe with guarded specialized functions in place of actions with a stable class of the value"""
+    __slots__ = ("steps", "batch_steps", "specialized", "records", "deoptimized_records")
+
+    def __init__(self, steps: tuple, batch_steps: tuple, specialized: int) -> None:
+        self.steps = steps
+        self.batch_steps = batch_steps
+        self.specialized = specialized
+        self.records = 0
+        self.deoptimized_records = 0
+
+class Specializer:
+    """Adaptive type-specialized execution of actions of the recipe.
+
+    Classes of the current value are observed before every action during the first `warmup` records. Then every action which
+    saw exactly one class is replaced by its specialized version (see `Action.specialize`), which skips checks of the type,
+    and no-op actions are removed. Specialized version is guarded by the check of the exact class of the value:
+    if the class differs, the generic `run` is called (deoptimization). When guards fail for more than `max_deoptimization_ratio`
+    of records, specialization is dropped and classes are observed again.
+    """
+
+    def __init__(
+        self,
+        actions: tuple[Action, ...],
+        warmup: int = DEFAULT_WARMUP_RECORDS,
+        max_deoptimization_ratio: float = DEFAULT_MAX_DEOPTIMIZATION_RATIO
+    ) -> None:
+        self.actions = actions
+        self.warmup = warmup
+        self.max_deoptimization_ratio = max_deoptimization_ratio
+        #number of times the actions were specialized, specialized actions in the current chain,
+        #failed guards and specializations dropped because of too many failed guards
+        self.specializations = 0
+        self.specialized_actions = 0
+        self.deoptimizations = 0
+        self.despecializations = 0
+        self._lock = Lock()
+        self._chain: Optional[_Chain] = None
+        self._reset_observations()
+
+    def _reset_observations(self):
+        self._observed = [set() for _ in self.actions]
+        self._observed_records = 0
+
+    def _guard(self, action: Action, value_class: type, specialized: Callable[[MorphState], MorphState]) -> Callable[[MorphState], MorphState]:
+        generic = action.run
+
+        def run(input: MorphState) -> MorphState:
+            if input.value.__class__ is value_class:
+                return specialized(input)
+            #failed guards are counted in the state, so the hot path doesn't take the lock
+            input.deoptimizations += 1
+            return generic(input)
+        return run
+
+    def _build_chain(self) -> _Chain:
+        steps = []
+        batch_steps = []
+        specialized = 0
+        for action, observed in zip(self.actions, self._observed):
+            if action.is_noop:
+                continue
+            step = None
+            if len(observed) == 1:
+                value_class = next(iter(observed))
+                specialized_run = action.specialize(value_class)
+                if specialized_run is not None:
+                    step = self._guard(action, value_class, specialized_run)
+                    specialized += 1
+            if step is None:
+                steps.append(action.run)
+                batch_steps.append(action.run_batch)
+            else:
+                steps.append(step)
+                batch_steps.append(lambda inputs, step=step: [step(input) for input in inputs])
+        return _Chain(tuple(steps), tuple(batch_steps), specialized)
+
+    def _observe(self, records: int):
+        with self._lock:
+            self._observed_records += records
+            if self._chain is None and self._observed_records >= self.warmup:
+                self._chain = self._build_chain()
+                self.specializations += 1
+                self.specialized_actions = self._chain.specialized
+
+    def _check_chain(self, chain: _Chain, states: List[MorphState]):
+        deoptimizations = 0
+        deoptimized_records = 0
+        for state in states:
+            if state.deoptimizations:
+                deoptimizations += state.deoptimizations
+                deoptimized_records += 1
+        with self._lock:
+            chain.records += len(states)
+            if not deoptimized_records:
+                return
+            self.deoptimizations += deoptimizations
+            chain.deoptimized_records += deoptimized_records
+            if (
+                chain is self._chain
+                and chain.records >= self.warmup
+                and chain.deoptimized_records > chain.records * self.max_deoptimization_ratio
+            ):
+                self._chain = None
+                self.specialized_actions = 0
+                self.despecializations += 1
+                self._reset_observations()
+
+    def run(self, state: MorphState) -> MorphState:
+        chain = self._chain
+        if chain is None:
+            for observed, action in zip(self._observed, self.actions):
+                observed.add(state.value.__class__)
+                state = action.run(state)
+            self._observe(1)
+            return state
+
+        for step in chain.steps:
+            state = step(state)
+        if state.deoptimizations:
+            self._check_chain(chain, [state])
+        else:
+            #counter of records is approximate when records are morphed by several threads, it's used only for the ratio of deoptimizations
+            chain.records += 1
+        return state
+
+    def run_batch(self, states: List[MorphState]) -> List[MorphState]:
+        chain = self._chain
+        if chain is None:
+            for observed, action in zip(self._observed, self.actions):
+                for state in states:
+                    observed.add(state.value.__class__)
+                states = action.run_batch(states)
+            self._observe(len(states))
+            return states
+
+        for batch_step in chain.batch_steps:
+            states = batch_step(states)
+        self._check_chain(chain, states)
+        return states
+
+    def stats(self) -> dict[str, Any]:
+        """Returns counters of specialization
+
+        Returns:
+            dict[str, Any]: numbers of specializations, specialized actions of the current chain (of all actions),
+                failed guards (deoptimizations) and dropped specializations
+        """
+        with self._lock:
+            return {
+                "is_specialized": self._chain is not None,
+                "specializations": self.specializations,
+                "specialized_actions": self.specialized_actions,
+                "actions": len(self.actions),
+                "deoptimizations": self.deoptimizations,
+                "despecializations": self.despecializations
+            }
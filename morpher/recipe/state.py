@@ -11,10 +11,16 @@ class MorphState:
     `temp_fields` is a dictionary with all fields created during processing (especially from Naming operations)
     `final_fields` is a dictionary with all fields which will be included into the result structure
     `dropped_fields` is a dictionary of all dropped fields from the original structure
+    `lazy_fields` is a list of views which are split into temp fields on demand (see `Split`)
+    `failed_fields` is a list of names of final fields which failed to cast
+    `deoptimizations` is the number of failed guards of specialized actions (see `specialization`)
     `value` is a current processing value
     """
     source_fields: dict[str, Value] = field(default_factory=dict)
     temp_fields: dict[str, Value] = field(default_factory=dict)
     final_fields: dict[str, Value] = field(default_factory=dict)
     dropped_fields: dict[str, Value] = field(default_factory=dict)
+    lazy_fields: list = field(default_factory=list)
+    failed_fields: list = field(default_factory=list)
+    deoptimizations: int = 0
     value: Value = None
\ No newline at end of file
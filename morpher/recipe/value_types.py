@@ -1,7 +1,37 @@
 import arrow
 import json
+import math
+import re
+from arrow.constants import MAX_TIMESTAMP
 from enum import Enum, auto
-from typing import Any, Optional
+from threading import Lock
+from typing import Any, List, Optional
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#Patterns to pre-validate strings before conversion, so invalid values are rejected without raising and catching exceptions
+#Patterns may accept some invalid strings (conversion of such strings fails in a regular way), but they never reject valid ones
+_INTEGER_RE = re.compile(r"\s*[+-]?\d(?:_?\d)*\s*")
+_FLOAT_RE = re.compile(r"\s*[+-]?(?:(?:\d(?:_?\d)*(?:\.(?:\d(?:_?\d)*)?)?|\.\d(?:_?\d)*)(?:[eE][+-]?\d(?:_?\d)*)?|(?i:inf|infinity|nan))\s*")
+#every date recognized by arrow contains a year of 4 digits
+_DATE_RE = re.compile(r"\d{4}")
+
+_TRUE_VALUES = frozenset([True, "true", "TRUE"])
+_FALSE_VALUES = frozenset([False, "false", "FALSE"])
+
+#Columns shorter than this are cast value by value, because conversion to arrays doesn't pay off for them
+MIN_VECTORIZED_COLUMN_SIZE = 64
+
+_INT64_LIMIT = 2 ** 63
+
+class CastError(ValueError):
+    pass
+
+#Marker of the value which was rejected by pre-validation
+INVALID = CastError("Invalid value")
 
 class ValueType(Enum):
     pass 
@@ -30,6 +60,12 @@ class FinalType(ValueType):
         return str(value), None
 
     def _to_integer(self, value: Any) -> tuple[int, Optional[Exception]]:
+        if isinstance(value, str):
+            if not _INTEGER_RE.fullmatch(value):
+                return None, INVALID
+        elif isinstance(value, float):
+            if not math.isfinite(value):
+                return None, INVALID
         try:
             return int(value), None
         except Exception as e:
@@ -39,52 +75,75 @@ class FinalType(ValueType):
         return self._to_float(value)
 
     def _to_float(self, value: Any) -> tuple[float, Optional[Exception]]:
+        if isinstance(value, str) and not _FLOAT_RE.fullmatch(value):
+            return None, INVALID
         try:
             return float(value), None 
         except Exception as e:
             return None, e
 
     def _to_timestamp(self, value: Any) -> tuple[str, Optional[Exception]]:
+        if isinstance(value, str):
+            if not _DATE_RE.search(value):
+                return None, INVALID
+        elif not isinstance(value, int) or isinstance(value, bool):
+            return None, INVALID
         try:
-            if isinstance(value, str) or isinstance(value, int):
-                return arrow.get(value).to("UTC").isoformat()[:-6], None
-            else:
-                raise ValueError
+            return arrow.get(value).to("UTC").isoformat()[:-6], None
         except Exception as e:
             return None, e
 
     def _to_unixtime(self, value: Any) -> tuple[int, Optional[Exception]]:
-        try:
-            if isinstance(value, str):
+        if isinstance(value, str):
+            if not _DATE_RE.search(value):
+                return None, INVALID
+            try:
                 return int(arrow.get(value).to("UTC").timestamp()), None
-            elif isinstance(value, int) or isinstance(value, float):
+            except Exception as e:
+                return None, e
+        elif isinstance(value, int) or isinstance(value, float):
+            if isinstance(value, float) and not math.isfinite(value):
+                return None, INVALID
+            #timestamps in seconds are converted without arrow (larger numbers are treated by arrow as milli- and microseconds)
+            if 0 <= value < MAX_TIMESTAMP:
+                return int(value), None
+            try:
                 return int(arrow.get(int(value)).to("UTC").timestamp()), None
-            else:
-                raise ValueError
-        except Exception as e:
-            return None, e
+            except Exception as e:
+                return None, e
+        else:
+            return None, INVALID
 
     def _to_unixtime_ms(self, value: Any) -> tuple[int, Optional[Exception]]:
+        if isinstance(value, str):
+            if not _DATE_RE.search(value):
+                return None, INVALID
+        elif isinstance(value, int) or isinstance(value, float):
+            if isinstance(value, bool) or (isinstance(value, float) and not math.isfinite(value)):
+                return None, INVALID
+            #integer timestamps in seconds are converted without arrow (float ones are rounded by arrow to microseconds)
+            if isinstance(value, int) and 0 <= value < MAX_TIMESTAMP:
+                return value * 1000, None
+        else:
+            return None, INVALID
         try:
-            if isinstance(value, str):
-                return int(arrow.get(value).to("UTC").timestamp() * 1000), None
-            elif isinstance(value, int) or isinstance(value, float):
-                return int(arrow.get(value).to("UTC").timestamp() * 1000), None
-            else:
-                raise ValueError
+            return int(arrow.get(value).to("UTC").timestamp() * 1000), None
         except Exception as e:
             return None, e
 
     def _to_bool(self, value: Any) -> tuple[bool, Optional[Exception]]:
-        try:
+        #only hashable values may be looked up in sets, other values are never equal to the accepted ones
+        if isinstance(value, (str, int, float)):
+            if value in _TRUE_VALUES:
+                return True, None 
+            elif value in _FALSE_VALUES:
+                return False, None
+        elif not isinstance(value, (list, dict)):
             if value in [True, "true", "TRUE", 1]:
                 return True, None 
             elif value in [False, "false", "FALSE", 0]:
                 return False, None
-            else: 
-                raise ValueError
-        except Exception as e:
-            return None, e
+        return None, INVALID
 
     def _to_json(self, value: Any) -> tuple[str, Optional[Exception]]:
         try:
@@ -93,63 +152,255 @@ class FinalType(ValueType):
             return None, e
 
     def _to_date(self, value: Any) -> tuple[str, Optional[Exception]]:
+        if isinstance(value, str) and not _DATE_RE.search(value):
+            return None, INVALID
         try:
             return arrow.get(value).date().isoformat(), None
         except Exception as e:
             return None, e
 
+    def converter(self):
+        """Returns the conversion function for this type.
+        Conversion function returns a tuple of converted value and an error (None if the conversion succeeded)
+        """
+        return getattr(self, _final_type_to_converter[self.name])
+
+    def default_value(self) -> Any:
+        return _default_values[self.name]
+
     def cast(self, value: Any, is_safe: bool=False, with_default: bool=False, default_value: Any=None) -> Any:
-        if value is None:
-            return None
+        return CastKernel(self, is_safe=is_safe, with_default=with_default, default_value=default_value)(value)
+
+_final_type_to_converter = {
+    "STRING": "_to_string",
+    "INTEGER": "_to_integer",
+    "DECIMAL": "_to_decimal",
+    "FLOAT": "_to_float",
+    "TIMESTAMP": "_to_timestamp",
+    "UNIXTIME": "_to_unixtime",
+    "UNIXTIME_MS": "_to_unixtime_ms",
+    "BOOL": "_to_bool",
+    "JSON": "_to_json",
+    "DATE": "_to_date"
+}
+
+_default_values = {
+    "STRING": "",
+    "INTEGER": 0,
+    "DECIMAL": 0.0,
+    "FLOAT": 0.0,
+    "TIMESTAMP": None,
+    "UNIXTIME": 0,
+    "UNIXTIME_MS": 0,
+    "BOOL": None,
+    "JSON": "{}",
+    "DATE": None
+}
+
+_VECTORIZED_TYPES = frozenset([FinalType.INTEGER, FinalType.FLOAT, FinalType.DECIMAL, FinalType.UNIXTIME, FinalType.UNIXTIME_MS])
+
+def _convert_column_vectorized(target_type: FinalType, values: List[Any]) -> Optional[tuple[list, Any, Any, Any]]:
+    """Converts the column of numbers with numpy.
+    Only columns of ints or floats (maybe with nulls) are vectorized; bools, strings and mixed columns are left to the scalar conversion.
+    Values which can't be converted exactly as by the scalar conversion (e.g. timestamps in milliseconds, which are parsed by arrow) are marked as fallback ones.
+
+    Args:
+        target_type (FinalType): type to cast to
+        values (List[Any]): raw values
 
-        default_values = {
-            "STRING": "",
-            "INTEGER": 0,
-            "DECIMAL": 0.0,
-            "FLOAT": 0.0,
-            "TIMESTAMP": None,
-            "UNIXTIME": 0,
-            "UNIXTIME_MS": 0,
-            "BOOL": None,
-            "JSON": "{}",
-            "DATE": None
-        }
-
-        if self.name == "STRING":
-            v, e = self._to_string(value)
-        elif self.name == "INTEGER":
-            v, e = self._to_integer(value)
-        elif self.name == "DECIMAL":
-            v, e = self._to_decimal(value)
-        elif self.name == "FLOAT":
-            v, e = self._to_float(value)
-        elif self.name == "TIMESTAMP":
-            v, e = self._to_timestamp(value)
-        elif self.name == "UNIXTIME":
-            v, e = self._to_unixtime(value)
-        elif self.name == "UNIXTIME_MS":
-            v, e = self._to_unixtime_ms(value)
-        elif self.name == "BOOL":
-            v, e = self._to_bool(value)
-        elif self.name == "JSON":
-            v, e = self._to_json(value)
-        elif self.name == "DATE":
-            v, e = self._to_date(value)
+    Returns:
+        Optional[tuple[list, Any, Any, Any]]: converted values, masks of failed, null and fallback values, or None if the column can't be vectorized
+    """
+    if target_type not in _VECTORIZED_TYPES:
+        return None
+    types = set(map(type, values))
+    types.discard(type(None))
+    if len(types) != 1:
+        return None
+    (value_type,) = types
+    if value_type is float and target_type == FinalType.UNIXTIME_MS:
+        #arrow rounds float timestamps to microseconds, so they are never vectorized
+        return None
+    if value_type not in (int, float):
+        return None
+
+    n = len(values)
+    column = values
+    null = numpy.zeros(n, dtype=bool)
+    if None in values:
+        column = numpy.array(values, dtype=object)
+        null = numpy.equal(column, None)
+        column[null] = 0
+    try:
+        arr = numpy.array(column, dtype=numpy.int64 if value_type is int else numpy.float64)
+    except OverflowError:
+        #integers out of int64 range
+        return None
+
+    failed = numpy.zeros(n, dtype=bool)
+    fallback = numpy.zeros(n, dtype=bool)
+    if value_type is float and target_type != FinalType.FLOAT and target_type != FinalType.DECIMAL:
+        failed = ~numpy.isfinite(arr) & ~null
+        arr = numpy.where(failed, 0.0, arr)
+
+    if target_type == FinalType.INTEGER:
+        if value_type is float:
+            fallback = numpy.abs(arr) >= _INT64_LIMIT
+            result = numpy.trunc(numpy.where(fallback, 0.0, arr)).astype(numpy.int64)
         else:
-            raise ValueError
+            result = arr
+    elif target_type == FinalType.FLOAT or target_type == FinalType.DECIMAL:
+        result = arr.astype(numpy.float64)
+    elif target_type == FinalType.UNIXTIME or target_type == FinalType.UNIXTIME_MS:
+        #only timestamps in seconds are converted without arrow (see `FinalType._to_unixtime`)
+        fallback = ~((arr >= 0) & (arr < MAX_TIMESTAMP)) & ~failed & ~null
+        in_range = numpy.where(fallback | failed, 0, arr)
+        if value_type is float:
+            in_range = numpy.trunc(in_range).astype(numpy.int64)
+        result = in_range * 1000 if target_type == FinalType.UNIXTIME_MS else in_range
+
+    return result.tolist(), failed, null, fallback
+
+class CastKernel:
+    """Cast to the particular final type with the particular failure policy.
+    Kernel binds conversion function and default value once, so nothing is looked up when a value is cast.
+
+    Failure policies:
+    - not safe: error is raised
+    - safe: None is returned
+    - safe with default: default value is returned (provided one or the default value of the type)
+    """
+    __slots__ = ("target_type", "convert", "is_safe", "with_default", "default_value")
+
+    def __init__(self, target_type: FinalType, is_safe: bool=False, with_default: bool=False, default_value: Any=None) -> None:
+        self.target_type = target_type
+        self.convert = target_type.converter()
+        self.is_safe = is_safe
+        self.with_default = with_default
+        self.default_value = default_value if default_value else target_type.default_value()
+
+    def __repr__(self) -> str:
+        policy = "raise"
+        if self.is_safe and self.with_default:
+            policy = "default {!r}".format(self.default_value)
+        elif self.is_safe:
+            policy = "null"
+        return "CastKernel({}, {}, on failure: {})".format(self.target_type.name, self.convert.__name__, policy)
+
+    def is_vectorized(self) -> bool:
+        """Whether numeric columns are cast with numpy in batch mode (see `convert_column`)"""
+        return numpy is not None and self.target_type in _VECTORIZED_TYPES
+
+    def on_failure(self, value: Any, e: Exception) -> Any:
+        """Applies failure policy to the value which can't be converted
+
+        Args:
+            value (Any): raw value
+            e (Exception): error of the conversion
+
+        Raises:
+            CastError: value is rejected by pre-validation and cast is not safe
+            e: conversion error if cast is not safe
+
+        Returns:
+            Any: None or default value
+        """
+        if self.is_safe and self.with_default:
+            return self.default_value
+        elif self.is_safe and not self.with_default:
+            return None 
+        elif e is INVALID:
+            raise CastError("Can't cast {!r} to {}".format(value, self.target_type.name))
+        else: 
+            raise e
 
+    def __call__(self, value: Any) -> Any:
+        if value is None:
+            return None
+        v, e = self.convert(value)
         if e is None:
-            return v 
-        else:
-            if is_safe and with_default:
-                default = default_value if default_value else default_values[self.name]
-                return default
-            elif is_safe and not with_default:
-                return None 
-            else: 
-                raise e 
-             
+            return v
+        return self.on_failure(value, e)
+
+    def convert_column(self, values: List[Any]) -> tuple[list, List[bool], List[bool]]:
+        """Converts the column of raw values at once.
+        Numeric columns are converted with numpy if it's installed (see `_convert_column_vectorized`), any other column is converted value by value.
+
+        Args:
+            values (List[Any]): raw values
+
+        Returns:
+            tuple[list, List[bool], List[bool]]: converted values (None for failed and null values), masks of failed and null values
+        """
+        if numpy is not None and len(values) >= MIN_VECTORIZED_COLUMN_SIZE:
+            vectorized = _convert_column_vectorized(self.target_type, values)
+            if vectorized is not None:
+                converted, failed, null, fallback = vectorized
+                for i in numpy.flatnonzero(failed | null).tolist():
+                    converted[i] = None
+                for i in numpy.flatnonzero(fallback).tolist():
+                    converted[i], e = self.convert(values[i])
+                    failed[i] = e is not None
+                return converted, failed.tolist(), null.tolist()
+
+        convert = self.convert
+        converted = []
+        failed = []
+        null = []
+        for value in values:
+            if value is None:
+                converted.append(None)
+                failed.append(False)
+                null.append(True)
+                continue
+            v, e = convert(value)
+            converted.append(v)
+            failed.append(e is not None)
+            null.append(False)
+        return converted, failed, null
+
+    def cast_column(self, values: List[Any]) -> list:
+        """Casts the column of raw values with the failure policy of the kernel, every value is cast exactly as by `__call__`
+
+        Args:
+            values (List[Any]): raw values
+
+        Returns:
+            list: cast values
+        """
+        converted, failed, _ = self.convert_column(values)
+        for i, is_failed in enumerate(failed):
+            if is_failed:
+                converted[i] = self.on_failure(values[i], self.convert(values[i])[1])
+        return converted
+
+class CastStatistics:
+    """Counters of cast results per field: successful casts, failed casts and null values (which are not cast at all)"""
+
+    def __init__(self) -> None:
+        self._counters = {}
+        self._lock = Lock()
+
+    def add(self, name: str, is_null: bool, is_failed: bool):
+        with self._lock:
+            counters = self._counters.get(name)
+            if counters is None:
+                counters = self._counters[name] = [0, 0, 0]
+            counters[2 if is_null else (1 if is_failed else 0)] += 1
 
+    def add_counts(self, name: str, success: int, failure: int, null: int):
+        with self._lock:
+            counters = self._counters.get(name)
+            if counters is None:
+                counters = self._counters[name] = [0, 0, 0]
+            counters[0] += success
+            counters[1] += failure
+            counters[2] += null
 
+    def as_dict(self) -> dict[str, dict[str, int]]:
+        with self._lock:
+            return {k: {"success": v[0], "failure": v[1], "null": v[2]} for k, v in self._counters.items()}
 
-             
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
@@ -1,5 +1,6 @@
+from collections.abc import Mapping, Sequence
 from dataclasses import dataclass
-from typing import Any
+from typing import Any, Iterator, Optional
 from .value_types import ValueType, TempType
 
 @dataclass
@@ -81,4 +82,110 @@ class ScalarValue(Value):
 
 @dataclass
 class ObjectValue(Value):
-    pass
\ No newline at end of file
+    pass
+
+class ObjectView(Mapping):
+    """Read-only view of the object which keeps only some of its keys (see `Partial`).
+    It references the source object without copying and is materialized into a dict only when the actual dict is needed.
+    """
+    __slots__ = ("source", "keys_to_keep")
+
+    def __init__(self, source: Mapping, keys_to_keep: frozenset) -> None:
+        #views are never nested, a view of a view references the original object
+        if isinstance(source, ObjectView):
+            keys_to_keep = keys_to_keep & source.keys_to_keep
+            source = source.source
+        self.source = source
+        self.keys_to_keep = keys_to_keep
+
+    def __getitem__(self, k: Any) -> Any:
+        if k in self.keys_to_keep:
+            return self.source[k]
+        raise KeyError(k)
+
+    def __contains__(self, k: Any) -> bool:
+        return k in self.keys_to_keep and k in self.source
+
+    def __iter__(self) -> Iterator:
+        keys_to_keep = self.keys_to_keep
+        return (k for k in self.source if k in keys_to_keep)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __repr__(self) -> str:
+        return "ObjectView({!r})".format(self.materialize())
+
+    def materialize(self) -> dict:
+        keys_to_keep = self.keys_to_keep
+        return {k: v for k, v in self.source.items() if k in keys_to_keep}
+
+class FlattenView(Sequence):
+    """Read-only view of the object as a list of its values (see `Flatten`).
+    Every item is a `Value` named `<name of the object>_<key>`, which is created only when the item is accessed.
+    """
+    __slots__ = ("parent", "source", "_keys")
+
+    def __init__(self, parent: Value, source: Mapping) -> None:
+        self.parent = parent
+        self.source = source
+        self._keys = None
+
+    def _item(self, k: Any) -> Value:
+        new_value = Value.create_value_from_previous(self.parent, self.source[k])
+        new_value.actual_name = self.parent.actual_name + "_" + k
+        return new_value
+
+    def _get_keys(self) -> list:
+        if self._keys is None:
+            self._keys = list(self.source)
+        return self._keys
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._item(k) for k in self._get_keys()[i]]
+        return self._item(self._get_keys()[i])
+
+    def __iter__(self) -> Iterator[Value]:
+        return (self._item(k) for k in self.source)
+
+    def __len__(self) -> int:
+        return len(self.source)
+
+    def __repr__(self) -> str:
+        return "FlattenView({!r})".format(self.materialize())
+
+    def find(self, name: str) -> Optional[Value]:
+        """Finds the item as if it was split into temp fields named `<name of the item>$<index>` (see `Split`)
+
+        Args:
+            name (str): name of the item with or without index
+
+        Returns:
+            Optional[Value]: found item or None
+        """
+        prefix = self.parent.actual_name + "_"
+        if not name.startswith(prefix):
+            return None
+        k, delimiter, index = name[len(prefix):].partition("$")
+        if k not in self.source:
+            return None
+        if delimiter and (not index.isdigit() or self._get_keys().index(k) != int(index)):
+            return None
+        return self._item(k)
+
+    def materialize(self) -> list:
+        return list(self)
+
+def materialize(value: Any) -> Any:
+    """Materializes views into the actual dicts and lists, any other value is returned as is
+
+    Args:
+        value (Any): raw value
+
+    Returns:
+        Any: raw value without views
+    """
+    if isinstance(value, (ObjectView, FlattenView)):
+        return value.materialize()
+    return value
@@ -0,0 +1,3 @@
+from .server import MorphServer, WorkerType
+from .client import MorphClient, MorphServerError
+from .protocol import Framing, ProtocolError
\ No newline at end of file
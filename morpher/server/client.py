@@ -0,0 +1,215 @@
+import itertools
+import socket
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Iterable, Iterator, List, Optional
+from .protocol import Framing, MessageReader, ProtocolError, encode_message, parse_address
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_BATCH_SIZE = 256
+DEFAULT_WINDOW = 8
+
+class MorphServerError(RuntimeError):
+    pass
+
+class _Connection:
+    """Single connection to the server.
+    Requests are pipelined: they are sent without waiting for the previous responses, which are read by a separate thread and matched by `id`.
+    """
+
+    def __init__(self, family: int, address: Any, framing: Framing, timeout: float = None) -> None:
+        self.framing = framing
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(address)
+        self.sock.settimeout(None)
+        self.write_lock = threading.Lock()
+        self.pending: dict[int, Future] = {}
+        self.pending_lock = threading.Lock()
+        self.is_broken = False
+        self.reader = MessageReader(self.sock, framing)
+        self.thread = threading.Thread(target=self._read_responses, name="morpher-client-reader", daemon=True)
+        self.thread.start()
+
+    def _read_responses(self):
+        error = None
+        try:
+            while True:
+                response = self.reader.read()
+                if response is None:
+                    break
+                with self.pending_lock:
+                    future = self.pending.pop(response.get("id"), None)
+                if future is None:
+                    continue
+                if "error" in response:
+                    future.set_exception(MorphServerError(response["error"]))
+                else:
+                    future.set_result(response)
+        except (OSError, ProtocolError) as e:
+            error = e
+        finally:
+            self.is_broken = True
+            with self.pending_lock:
+                pending = list(self.pending.values())
+                self.pending.clear()
+            for future in pending:
+                future.set_exception(error or MorphServerError("Connection closed by the server"))
+
+    def send(self, request_id: int, message: dict) -> Future:
+        future = Future()
+        with self.pending_lock:
+            if self.is_broken:
+                raise MorphServerError("Connection is closed")
+            self.pending[request_id] = future
+        data = encode_message(message, self.framing)
+        try:
+            with self.write_lock:
+                self.sock.sendall(data)
+        except OSError:
+            with self.pending_lock:
+                self.pending.pop(request_id, None)
+            self.is_broken = True
+            raise
+        return future
+
+    def load(self) -> int:
+        return len(self.pending)
+
+    def close(self):
+        self.is_broken = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        self.thread.join()
+
+class MorphClient:
+    """Client of `MorphServer` with a pool of pipelined connections.
+
+    Connections are opened lazily up to `pool_size`, and every request is sent over the least loaded one.
+    Broken connections are dropped from the pool and replaced by new ones.
+    """
+
+    def __init__(
+        self,
+        address: Any,
+        pool_size: int = DEFAULT_POOL_SIZE,
+        framing: Framing = Framing.LENGTH_PREFIXED,
+        timeout: float = None
+    ) -> None:
+        self.family, self.address = parse_address(address)
+        self.pool_size = pool_size
+        self.framing = framing
+        self.timeout = timeout
+        self._connections: List[_Connection] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+
+    def _connection(self) -> _Connection:
+        with self._lock:
+            broken = [c for c in self._connections if c.is_broken]
+            self._connections = [c for c in self._connections if not c.is_broken]
+            idle = [c for c in self._connections if c.load() == 0]
+            if idle:
+                connection = idle[0]
+            elif len(self._connections) < self.pool_size:
+                connection = _Connection(self.family, self.address, self.framing, self.timeout)
+                self._connections.append(connection)
+            else:
+                connection = min(self._connections, key=lambda c: c.load())
+        for c in broken:
+            c.close()
+        return connection
+
+    def _request(self, message: dict) -> Future:
+        request_id = next(self._ids)
+        message["id"] = request_id
+        return self._connection().send(request_id, message)
+
+    def morph_async(self, recipe: str, records: List[dict]) -> Future:
+        """Sends the batch of records without waiting for the response
+
+        Args:
+            recipe (str): name of the recipe preloaded by the server
+            records (List[dict]): records to morph
+
+        Returns:
+            Future: future with the list of (result, metadata) tuples, None for records rejected by `where` clauses
+        """
+        future = Future()
+        response_future = self._request({"op": "morph", "recipe": recipe, "records": records})
+
+        def on_done(f: Future):
+            try:
+                #records rejected by `where` clauses have null results
+                future.set_result([None if x is None else tuple(x) for x in f.result()["results"]])
+            except Exception as e:
+                future.set_exception(e)
+
+        response_future.add_done_callback(on_done)
+        return future
+
+    def morph(self, recipe: str, records: List[dict]) -> List[Optional[tuple[dict, dict]]]:
+        """Morphs the batch of records and waits for the response
+
+        Args:
+            recipe (str): name of the recipe preloaded by the server
+            records (List[dict]): records to morph
+
+        Returns:
+            List[Optional[tuple[dict, dict]]]: result and metadata for every record, None for records rejected by `where` clauses
+        """
+        return self.morph_async(recipe, records).result(self.timeout)
+
+    def morph_many(
+        self,
+        recipe: str,
+        records: Iterable[dict],
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        window: int = DEFAULT_WINDOW
+    ) -> Iterator[Optional[tuple[dict, dict]]]:
+        """Morphs a stream of records keeping up to `window` batches in flight
+
+        Args:
+            recipe (str): name of the recipe preloaded by the server
+            records (Iterable[dict]): records to morph
+            batch_size (int, optional): number of records in one request. Defaults to DEFAULT_BATCH_SIZE.
+            window (int, optional): maximum number of requests sent without response. Defaults to DEFAULT_WINDOW.
+
+        Yields:
+            Iterator[Optional[tuple[dict, dict]]]: result and metadata for every record in the order of the input,
+                None for records rejected by `where` clauses
+        """
+        futures = deque()
+        it = iter(records)
+        while True:
+            batch = list(itertools.islice(it, batch_size))
+            if not batch:
+                break
+            futures.append(self.morph_async(recipe, batch))
+            if len(futures) >= window:
+                yield from futures.popleft().result(self.timeout)
+        while futures:
+            yield from futures.popleft().result(self.timeout)
+
+    def ping(self) -> bool:
+        return self._request({"op": "ping"}).result(self.timeout).get("ok", False)
+
+    def recipes(self) -> List[str]:
+        return self._request({"op": "recipes"}).result(self.timeout)["recipes"]
+
+    def close(self):
+        with self._lock:
+            connections = self._connections
+            self._connections = []
+        for c in connections:
+            c.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,106 @@
+import json
+import socket
+import struct
+from enum import Enum
+from typing import Any, Optional
+
+#Messages are JSON objects, framed in one of two ways:
+#- LENGTH_PREFIXED: 4-byte big-endian length of the payload followed by the UTF-8 payload
+#- NDJSON: one message per line
+#The framing is detected by the server from the first byte of the connection: NDJSON messages always start with "{",
+#while the first byte of the length is 0 for any payload shorter than MAX_MESSAGE_SIZE
+Framing = Enum("Framing", ["LENGTH_PREFIXED", "NDJSON"])
+
+MAX_MESSAGE_SIZE = 16 * 1024 * 1024
+LENGTH_PREFIX = struct.Struct(">I")
+NDJSON_STARTER = b"{"
+
+class ProtocolError(ValueError):
+    pass
+
+def encode_message(message: dict, framing: Framing) -> bytes:
+    payload = json.dumps(message, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if framing == Framing.NDJSON:
+        return payload + b"\n"
+    if len(payload) >= MAX_MESSAGE_SIZE:
+        raise ProtocolError("Message of {} bytes exceeds the limit of {} bytes".format(len(payload), MAX_MESSAGE_SIZE))
+    return LENGTH_PREFIX.pack(len(payload)) + payload
+
+class MessageReader:
+    """Reads framed messages from a socket"""
+
+    def __init__(self, sock: socket.socket, framing: Optional[Framing] = None) -> None:
+        self.file = sock.makefile("rb")
+        self.framing = framing
+
+    def _read_exactly(self, n: int) -> Optional[bytes]:
+        data = self.file.read(n)
+        if not data:
+            return None
+        if len(data) < n:
+            raise ProtocolError("Connection closed in the middle of a message")
+        return data
+
+    def read(self) -> Optional[dict]:
+        """Reads the next message
+
+        Raises:
+            ProtocolError: message is malformed or too large
+
+        Returns:
+            Optional[dict]: message or None if the connection is closed
+        """
+        if self.framing is None:
+            first_byte = self.file.peek(1)[:1]
+            if not first_byte:
+                return None
+            self.framing = Framing.NDJSON if first_byte == NDJSON_STARTER else Framing.LENGTH_PREFIXED
+
+        if self.framing == Framing.NDJSON:
+            line = self.file.readline(MAX_MESSAGE_SIZE + 1)
+            while line and not line.strip():
+                line = self.file.readline(MAX_MESSAGE_SIZE + 1)
+            if not line:
+                return None
+            if len(line) > MAX_MESSAGE_SIZE:
+                raise ProtocolError("Message exceeds the limit of {} bytes".format(MAX_MESSAGE_SIZE))
+            payload = line
+        else:
+            header = self._read_exactly(LENGTH_PREFIX.size)
+            if header is None:
+                return None
+            (length,) = LENGTH_PREFIX.unpack(header)
+            if length >= MAX_MESSAGE_SIZE:
+                raise ProtocolError("Message of {} bytes exceeds the limit of {} bytes".format(length, MAX_MESSAGE_SIZE))
+            payload = self._read_exactly(length) if length else b""
+            if payload is None:
+                raise ProtocolError("Connection closed in the middle of a message")
+
+        try:
+            message = json.loads(payload)
+        except ValueError as e:
+            raise ProtocolError("Malformed message: {}".format(e)) from e
+        if not isinstance(message, dict):
+            raise ProtocolError("Message should be a JSON object")
+        return message
+
+    def close(self):
+        self.file.close()
+
+def parse_address(address: Any) -> tuple[int, Any]:
+    """Parses the address of the server
+
+    Args:
+        address (Any): path of Unix domain socket, "unix:<path>", "<host>:<port>" or (host, port) tuple
+
+    Returns:
+        tuple[int, Any]: socket family and address for this family
+    """
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:"):]
+    host, delimiter, port = address.rpartition(":")
+    if delimiter and port.isdigit():
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    return socket.AF_UNIX, address
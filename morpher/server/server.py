@@ -0,0 +1,227 @@
+import errno
+import importlib
+import os
+import socket
+import socketserver
+import stat
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, ProcessPoolExecutor
+from enum import Enum
+from typing import Any, Iterable, List
+from .protocol import Framing, MessageReader, ProtocolError, encode_message, parse_address
+from ..morpher import create_recipe
+from ..recipe import Recipe, SourceFieldStrategy
+
+WorkerType = Enum("WorkerType", ["THREAD", "PROCESS"])
+
+DEFAULT_MAX_IN_FLIGHT = 64
+
+#Recipes compiled in the worker process (see `WorkerType.PROCESS`)
+_worker_recipes: dict[str, Recipe] = {}
+
+def _compile_recipes(recipes: dict[str, str], recipe_options: dict) -> dict[str, Recipe]:
+    return {name: create_recipe(recipe_str=recipe_str, **recipe_options) for name, recipe_str in recipes.items()}
+
+def _init_worker(recipes: dict[str, str], recipe_options: dict, imports: Iterable[str]):
+    #modules are imported to register functions used by recipes
+    for module in imports:
+        importlib.import_module(module)
+    _worker_recipes.update(_compile_recipes(recipes, recipe_options))
+
+def _morph_records(recipe: Recipe, records: List[dict]) -> List[list]:
+    #records rejected by `where` clauses get null results
+    return [None if x is None else [x[0], x[1]] for x in recipe.morph_batch(records)]
+
+def _morph_in_worker(name: str, records: List[dict]) -> List[list]:
+    return _morph_records(_worker_recipes[name], records)
+
+def _remove_stale_socket(path: str):
+    #only a socket nobody listens on is left by the previous run, any other file or a live socket is never removed
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(errno.EEXIST, "Path of the socket exists and it's not a socket", path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+            return
+    raise OSError(errno.EADDRINUSE, "Socket is used by another running server", path)
+
+class MorphServer:
+    """Local server which morphs batches of records with preloaded named recipes.
+
+    Server listens on a Unix domain socket or on a TCP port and accepts messages framed as length-prefixed JSON or NDJSON (see `protocol`).
+    Requests are `{"id": ..., "recipe": <name>, "records": [...]}`, responses are `{"id": ..., "results": [[result, metadata], ...]}`
+    (null for records rejected by `where` clauses) or `{"id": ..., "error": <message>}`. Requests of one connection are pipelined: they are morphed concurrently
+    by the worker pool and responses are sent as soon as they are ready, so clients match them by `id`.
+    """
+
+    def __init__(
+        self,
+        recipes: dict[str, str],
+        address: Any,
+        workers: int = None,
+        worker_type: WorkerType = WorkerType.THREAD,
+        source_fields_stategy: SourceFieldStrategy = SourceFieldStrategy.AUTO_DROP,
+        with_source_fields_timestamp_cast: bool = False,
+        imports: Iterable[str] = (),
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+    ) -> None:
+        self.family, self.address = parse_address(address)
+        self.workers = workers or os.cpu_count() or 1
+        self.worker_type = worker_type
+        self.max_in_flight = max_in_flight
+        self.imports = tuple(imports)
+        for module in self.imports:
+            importlib.import_module(module)
+
+        recipe_options = {
+            "source_fields_stategy": source_fields_stategy,
+            "with_source_fields_timestamp_cast": with_source_fields_timestamp_cast
+        }
+        #recipes are compiled in the server process in any case, so errors in recipes are raised before serving
+        self.recipes = _compile_recipes(recipes, recipe_options)
+
+        if worker_type == WorkerType.THREAD:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="morpher-worker")
+        elif worker_type == WorkerType.PROCESS:
+            self.pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(recipes, recipe_options, self.imports)
+            )
+        else:
+            raise ValueError("Unknown worker type {}".format(worker_type))
+
+        self._server = self._create_socket_server()
+
+    def _create_socket_server(self) -> socketserver.BaseServer:
+        morph_server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                morph_server._handle_connection(self.request)
+
+        if self.family == socket.AF_UNIX:
+            #stale socket file from the previous run prevents binding
+            _remove_stale_socket(self.address)
+            server = socketserver.ThreadingUnixStreamServer(self.address, Handler, bind_and_activate=False)
+        else:
+            server = socketserver.ThreadingTCPServer(self.address, Handler, bind_and_activate=False)
+            server.allow_reuse_address = True
+        server.daemon_threads = True
+        try:
+            server.server_bind()
+            server.server_activate()
+        except Exception:
+            server.server_close()
+            raise
+        return server
+
+    @property
+    def server_address(self) -> Any:
+        return self._server.server_address
+
+    def submit(self, message: dict) -> Future:
+        """Submits the request to the worker pool
+
+        Args:
+            message (dict): request
+
+        Raises:
+            ProtocolError: request is malformed or refers to unknown recipe
+
+        Returns:
+            Future: future with the list of results and metadata
+        """
+        name = message.get("recipe")
+        records = message.get("records")
+        if name not in self.recipes:
+            raise ProtocolError("Unknown recipe '{}'".format(name))
+        if not isinstance(records, list):
+            raise ProtocolError("Records should be a list")
+        if self.worker_type == WorkerType.PROCESS:
+            return self.pool.submit(_morph_in_worker, name, records)
+        return self.pool.submit(_morph_records, self.recipes[name], records)
+
+    def _handle_connection(self, sock: socket.socket):
+        reader = MessageReader(sock)
+        write_lock = threading.Lock()
+        #number of requests of this connection being processed is bounded, so a fast client can't exhaust the memory of the server
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+
+        def respond(response: dict):
+            data = encode_message(response, reader.framing or Framing.LENGTH_PREFIXED)
+            with write_lock:
+                try:
+                    sock.sendall(data)
+                except OSError:
+                    pass
+
+        def on_done(request_id: Any, future: Future):
+            try:
+                respond({"id": request_id, "results": future.result()})
+            except Exception as e:
+                respond({"id": request_id, "error": "{}: {}".format(type(e).__name__, e)})
+            finally:
+                in_flight.release()
+
+        try:
+            while True:
+                try:
+                    message = reader.read()
+                except ProtocolError as e:
+                    respond({"id": None, "error": str(e)})
+                    break
+                if message is None:
+                    break
+
+                request_id = message.get("id")
+                op = message.get("op", "morph")
+                if op == "ping":
+                    respond({"id": request_id, "ok": True})
+                    continue
+                elif op == "recipes":
+                    respond({"id": request_id, "recipes": sorted(self.recipes)})
+                    continue
+                elif op != "morph":
+                    respond({"id": request_id, "error": "Unknown operation '{}'".format(op)})
+                    continue
+
+                in_flight.acquire()
+                try:
+                    future = self.submit(message)
+                except Exception as e:
+                    in_flight.release()
+                    respond({"id": request_id, "error": str(e)})
+                    continue
+                future.add_done_callback(lambda f, request_id=request_id: on_done(request_id, f))
+        finally:
+            #waiting for all requests of the connection before closing it
+            for _ in range(self.max_in_flight):
+                in_flight.acquire()
+            reader.close()
+
+    def serve_forever(self, poll_interval: float = 0.5):
+        self._server.serve_forever(poll_interval)
+
+    def shutdown(self):
+        """Stops serving and releases the socket and the worker pool. Must be called from another thread than `serve_forever`"""
+        self._server.shutdown()
+        self.close()
+
+    def close(self):
+        self._server.server_close()
+        self.pool.shutdown(wait=True)
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,2 @@
+from .transport import SharedMemoryExecutor, MessageKind, ResultEncoder, ResultDecoder
+from .ring_buffer import RingBuffer, TransportError
\ No newline at end of file
@@ -0,0 +1,137 @@
+import multiprocessing
+import struct
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Optional
+
+DEFAULT_SLOTS = 16
+DEFAULT_SLOT_SIZE = 256 * 1024
+#Interval of checks that the other side is still alive while waiting for a slot, in seconds
+POLL_INTERVAL = 0.1
+
+#Every slot starts with the header: size of the chunk, kind of the message and whether the chunk is the last one of the message
+_SLOT_HEADER = struct.Struct("<IBB")
+
+class TransportError(RuntimeError):
+    pass
+
+class RingBuffer:
+    """Single-producer single-consumer queue of messages in a shared memory block.
+
+    The block is divided into `slots` fixed-size slots. Messages larger than a slot are split into chunks written into
+    consecutive slots, so a message of any size passes through the buffer of a fixed size. Free and filled slots are counted
+    by two semaphores: the writer waits for a free slot when the reader lags behind (flow control), the reader waits for a filled one.
+    While waiting, both sides poll `is_alive` of the other side, so the death of a peer process raises `TransportError` instead of hanging.
+
+    The buffer is created by the parent process and passed to the child as an argument of `multiprocessing.Process`,
+    the child attaches to the same block. Only the creator unlinks the block (see `unlink`).
+    """
+
+    def __init__(
+        self,
+        slots: int = DEFAULT_SLOTS,
+        slot_size: int = DEFAULT_SLOT_SIZE,
+        context: Any = None
+    ) -> None:
+        if slots < 1 or slot_size <= _SLOT_HEADER.size:
+            raise ValueError("Ring buffer needs at least one slot larger than {} bytes".format(_SLOT_HEADER.size))
+        context = context or multiprocessing.get_context()
+        self.slots = slots
+        self.slot_size = slot_size
+        self.shm = SharedMemory(create=True, size=slots * slot_size)
+        self._free = context.Semaphore(slots)
+        self._filled = context.Semaphore(0)
+        self._is_owner = True
+        self._init_positions()
+
+    def _init_positions(self):
+        #every side keeps its own position: the writer never reads, the reader never writes
+        self._write_slot = 0
+        self._read_slot = 0
+
+    def __getstate__(self) -> dict:
+        return {
+            "name": self.shm.name,
+            "slots": self.slots,
+            "slot_size": self.slot_size,
+            "free": self._free,
+            "filled": self._filled
+        }
+
+    def __setstate__(self, state: dict):
+        self.slots = state["slots"]
+        self.slot_size = state["slot_size"]
+        self.shm = SharedMemory(name=state["name"])
+        self._free = state["free"]
+        self._filled = state["filled"]
+        self._is_owner = False
+        self._init_positions()
+
+    @property
+    def chunk_size(self) -> int:
+        return self.slot_size - _SLOT_HEADER.size
+
+    def _acquire(self, semaphore: Any, is_alive: Optional[Callable[[], bool]]):
+        while not semaphore.acquire(timeout=POLL_INTERVAL):
+            if is_alive is not None and not is_alive():
+                raise TransportError("Process on the other side of the ring buffer has exited")
+
+    def write(self, kind: int, payload: bytes = b"", is_alive: Optional[Callable[[], bool]] = None):
+        """Writes the message, waiting for free slots if the buffer is full
+
+        Args:
+            kind (int): kind of the message (0-255), it's returned by `read` as is
+            payload (bytes, optional): content of the message. Defaults to b"".
+            is_alive (Optional[Callable[[], bool]], optional): check of the reader process. Defaults to None.
+
+        Raises:
+            TransportError: reader has exited
+        """
+        buf = self.shm.buf
+        view = memoryview(payload)
+        chunk_size = self.chunk_size
+        position = 0
+        while True:
+            chunk = view[position:position + chunk_size]
+            position += len(chunk)
+            is_last = position >= len(view)
+            self._acquire(self._free, is_alive)
+            offset = self._write_slot * self.slot_size
+            _SLOT_HEADER.pack_into(buf, offset, len(chunk), kind, is_last)
+            buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + len(chunk)] = chunk
+            self._write_slot = (self._write_slot + 1) % self.slots
+            self._filled.release()
+            if is_last:
+                return
+
+    def read(self, is_alive: Optional[Callable[[], bool]] = None) -> tuple[int, bytes]:
+        """Reads the next message, waiting for it if the buffer is empty
+
+        Args:
+            is_alive (Optional[Callable[[], bool]], optional): check of the writer process. Defaults to None.
+
+        Raises:
+            TransportError: writer has exited
+
+        Returns:
+            tuple[int, bytes]: kind and payload of the message
+        """
+        buf = self.shm.buf
+        chunks = []
+        while True:
+            self._acquire(self._filled, is_alive)
+            offset = self._read_slot * self.slot_size
+            size, kind, is_last = _SLOT_HEADER.unpack_from(buf, offset)
+            chunks.append(bytes(buf[offset + _SLOT_HEADER.size:offset + _SLOT_HEADER.size + size]))
+            self._read_slot = (self._read_slot + 1) % self.slots
+            self._free.release()
+            if is_last:
+                return kind, chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+    def close(self):
+        self.shm.close()
+
+    def unlink(self):
+        """Closes the buffer and removes the shared memory block, it's done by the creator of the buffer after all readers and writers are done"""
+        self.shm.close()
+        if self._is_owner:
+            self.shm.unlink()
@@ -0,0 +1,324 @@
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+from collections import deque
+from enum import Enum
+from typing import Any, Iterable, Iterator, List
+from .ring_buffer import RingBuffer, TransportError, DEFAULT_SLOTS, DEFAULT_SLOT_SIZE
+from ..recipe.executor import DEFAULT_BATCH_SIZE
+from ..recipe.layout import MAX_LAYOUTS, OutputLayout
+
+#Messages to workers carry pickled lists of records or NDJSON lines which are decoded by the worker,
+#messages from workers carry encoded results (see `ResultEncoder`) or pickled errors
+MessageKind = Enum("MessageKind", ["RECORDS", "LINES", "RESULTS", "ERROR", "CLOSE"])
+
+#Seconds to wait for workers to exit after they are asked to stop
+SHUTDOWN_TIMEOUT = 5.0
+
+class ResultEncoder:
+    """Encodes batches of results compactly: every output schema (keys and types of the result) gets a number and it's sent
+    only with the first batch where it appears, results are sent as rows of values.
+    When the number of schemas reaches `max_layouts`, both sides forget them and start over.
+    """
+
+    def __init__(self, max_layouts: int = MAX_LAYOUTS) -> None:
+        self.max_layouts = max_layouts
+        self._schemas: dict[tuple, int] = {}
+
+    def encode(self, results: List[tuple]) -> bytes:
+        #schemas are forgotten only between batches, so every batch is decoded with one table
+        is_reset = len(self._schemas) >= self.max_layouts
+        if is_reset:
+            self._schemas.clear()
+        new_schemas = []
+        rows = []
+        for x in results:
+            #records rejected by `where` clauses are not sent at all
+            if x is None:
+                continue
+            result, metadata = x[0], x[1]
+            keys = tuple(result)
+            type_names = tuple([m["type"] for m in metadata.values()])
+            schema = (keys, type_names)
+            layout_id = self._schemas.get(schema)
+            if layout_id is None:
+                layout_id = self._schemas[schema] = len(self._schemas)
+                new_schemas.append((layout_id, keys, type_names))
+            rows.append((layout_id, list(result.values())))
+        return pickle.dumps((is_reset, new_schemas, rows), protocol=pickle.HIGHEST_PROTOCOL)
+
+class ResultDecoder:
+    """Decodes batches encoded by `ResultEncoder`. Results of the same schema share interned keys and read-only metadata (see `OutputLayout`)"""
+
+    def __init__(self) -> None:
+        self._layouts: dict[int, OutputLayout] = {}
+
+    def decode(self, payload: bytes) -> List[tuple[dict, dict, None]]:
+        is_reset, new_schemas, rows = pickle.loads(payload)
+        if is_reset:
+            self._layouts.clear()
+        for layout_id, keys, type_names in new_schemas:
+            self._layouts[layout_id] = OutputLayout(keys, type_names)
+        results = []
+        layouts = self._layouts
+        for layout_id, values in rows:
+            layout = layouts[layout_id]
+            results.append((layout.build(values), layout.metadata, None))
+        return results
+
+def _dump_error(error: Exception) -> bytes:
+    try:
+        return pickle.dumps(error, protocol=pickle.HIGHEST_PROTOCOL)
+    except Exception:
+        return pickle.dumps(TransportError("{}: {}".format(type(error).__name__, error)))
+
+def _split_lines(payload: bytes) -> Iterator[bytes]:
+    for line in payload.split(b"\n"):
+        if line and not line.isspace():
+            yield line
+
+def _serve(
+    input_buffer: RingBuffer,
+    output_buffer: RingBuffer,
+    recipe_str: str,
+    recipe_options: dict,
+    imports: Iterable[str],
+    with_projection: bool
+):
+    #body of the worker process: batches are morphed in the order they come until the parent asks to stop
+    parent = multiprocessing.parent_process()
+    is_alive = parent.is_alive if parent is not None else None
+    try:
+        for module in imports:
+            importlib.import_module(module)
+        from ..morpher import create_recipe
+        recipe = create_recipe(recipe_str=recipe_str, **recipe_options)
+        decode = recipe.create_decoder() if with_projection else json.loads
+        encoder = ResultEncoder()
+        while True:
+            kind, payload = input_buffer.read(is_alive)
+            if kind == MessageKind.CLOSE.value:
+                break
+            try:
+                if kind == MessageKind.RECORDS.value:
+                    records = pickle.loads(payload)
+                else:
+                    records = [decode(line) for line in _split_lines(payload)]
+                output_buffer.write(MessageKind.RESULTS.value, encoder.encode(recipe.morph_batch(records)), is_alive)
+            except TransportError:
+                raise
+            except Exception as e:
+                output_buffer.write(MessageKind.ERROR.value, _dump_error(e), is_alive)
+        output_buffer.write(MessageKind.CLOSE.value, b"", is_alive)
+    except TransportError:
+        #parent has exited, there is nobody to report to
+        pass
+    finally:
+        input_buffer.close()
+        output_buffer.close()
+
+class _Worker:
+    """Worker process with its pair of ring buffers and the thread which drains results of the worker into the queue"""
+
+    def __init__(self, index: int, context: Any, slots: int, slot_size: int, args: tuple) -> None:
+        self.input_buffer = RingBuffer(slots, slot_size, context)
+        self.output_buffer = RingBuffer(slots, slot_size, context)
+        self.results = queue.Queue()
+        self.process = context.Process(
+            target=_serve,
+            args=(self.input_buffer, self.output_buffer, *args),
+            name="morpher-worker-{}".format(index),
+            daemon=True
+        )
+        self.thread = threading.Thread(target=self._read_results, name="morpher-worker-reader-{}".format(index), daemon=True)
+        self.process.start()
+
+    def _read_results(self):
+        decoder = ResultDecoder()
+        try:
+            while True:
+                kind, payload = self.output_buffer.read(self.process.is_alive)
+                if kind == MessageKind.CLOSE.value:
+                    return
+                if kind == MessageKind.RESULTS.value:
+                    self.results.put(decoder.decode(payload))
+                else:
+                    self.results.put(pickle.loads(payload))
+        except Exception as e:
+            self.results.put(e if isinstance(e, TransportError) else TransportError("Malformed results: {}".format(e)))
+
+    def send(self, kind: MessageKind, payload: bytes):
+        self.input_buffer.write(kind.value, payload, self.process.is_alive)
+
+    def receive(self) -> List[tuple[dict, dict, None]]:
+        results = self.results.get()
+        if isinstance(results, Exception):
+            raise results
+        return results
+
+    def stop(self):
+        if self.process.is_alive():
+            try:
+                self.send(MessageKind.CLOSE, b"")
+            except TransportError:
+                pass
+        self.process.join(SHUTDOWN_TIMEOUT)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        if self.thread.is_alive():
+            self.thread.join()
+        self.input_buffer.unlink()
+        self.output_buffer.unlink()
+
+class SharedMemoryExecutor:
+    """Morphs records in worker processes connected to the parent by shared-memory ring buffers (see `RingBuffer`).
+
+    Every worker compiles the recipe from `recipe_str` and gets its own pair of buffers. Batches of records are sent
+    to workers in turn as pickled lists (`map`) or as raw NDJSON lines decoded by the worker (`map_lines`),
+    so the parent doesn't decode records at all. Results come back as rows of values and every output schema is sent only once
+    (see `ResultEncoder`), results of the same schema share keys and metadata. States are not sent, they are None.
+
+    Only `workers * 2` batches are in flight at once and writers wait for free slots of buffers, so memory use is bounded.
+    Results are always yielded in the order of the input records, records rejected by `where` clauses are skipped. Errors raised by the recipe are raised by `map`
+    as they are, the death of a worker raises `TransportError`. `close` asks workers to stop and removes the buffers.
+    """
+
+    def __init__(
+        self,
+        recipe_str: str,
+        recipe_options: dict = None,
+        workers: int = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        imports: Iterable[str] = (),
+        with_projection: bool = False,
+        slots: int = DEFAULT_SLOTS,
+        slot_size: int = DEFAULT_SLOT_SIZE
+    ) -> None:
+        self.recipe_str = recipe_str
+        self.recipe_options = recipe_options or {}
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.imports = tuple(imports)
+        self.with_projection = with_projection
+        self.slots = slots
+        self.slot_size = slot_size
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+
+        for module in self.imports:
+            importlib.import_module(module)
+        from ..morpher import create_recipe
+        #recipe is compiled in this process too, so errors in the recipe are raised before starting workers
+        create_recipe(recipe_str=recipe_str, **self.recipe_options)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def start(self):
+        if self._workers:
+            return
+        context = multiprocessing.get_context()
+        args = (self.recipe_str, self.recipe_options, self.imports, self.with_projection)
+        try:
+            for index in range(self.workers):
+                self._workers.append(_Worker(index, context, self.slots, self.slot_size, args))
+            #readers are started after all processes, so processes aren't forked while other threads run.
+            #results are drained all the time, so a worker never waits for the parent while the parent waits for the worker
+            for worker in self._workers:
+                worker.thread.start()
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        workers = self._workers
+        self._workers = []
+        for worker in workers:
+            worker.stop()
+
+    def _run(self, batches: Iterable[tuple[MessageKind, bytes]]) -> Iterator[tuple[dict, dict, None]]:
+        #one stream at a time, otherwise results of concurrent streams would be mixed
+        with self._lock:
+            self.start()
+            pending = deque()
+            max_pending = len(self._workers) * 2
+            index = 0
+            try:
+                for kind, payload in batches:
+                    worker = self._workers[index % len(self._workers)]
+                    index += 1
+                    worker.send(kind, payload)
+                    pending.append(worker)
+                    if len(pending) >= max_pending:
+                        yield from pending.popleft().receive()
+                while pending:
+                    yield from pending.popleft().receive()
+            finally:
+                #results of batches left in flight (after an error or when the caller stops early) are skipped,
+                #so the next stream doesn't get them
+                while pending:
+                    try:
+                        pending.popleft().receive()
+                    except TransportError:
+                        self.close()
+                        pending.clear()
+                    except Exception:
+                        pass
+
+    def _record_batches(self, ds: Iterable[dict]) -> Iterator[tuple[MessageKind, bytes]]:
+        batch = []
+        for d in ds:
+            batch.append(d)
+            if len(batch) >= self.batch_size:
+                yield MessageKind.RECORDS, pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+                batch = []
+        if batch:
+            yield MessageKind.RECORDS, pickle.dumps(batch, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _line_batches(self, lines: Iterable[bytes]) -> Iterator[tuple[MessageKind, bytes]]:
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= self.batch_size:
+                yield MessageKind.LINES, b"\n".join(batch)
+                batch = []
+        if batch:
+            yield MessageKind.LINES, b"\n".join(batch)
+
+    def map(self, ds: Iterable[dict]) -> Iterator[tuple[dict, dict, None]]:
+        """Morphs every record from `ds` in worker processes
+
+        Args:
+            ds (Iterable[dict]): records to morph
+
+        Raises:
+            TransportError: worker process has exited
+
+        Yields:
+            Iterator[tuple[dict, dict, None]]: result and metadata for every accepted record
+        """
+        yield from self._run(self._record_batches(ds))
+
+    def map_lines(self, lines: Iterable[bytes]) -> Iterator[tuple[dict, dict, None]]:
+        """Morphs records given as NDJSON lines (e.g. lines of a file opened in binary mode), lines are decoded by workers.
+        With `with_projection` only source fields read by the recipe are decoded (see `Recipe.create_decoder`). Blank lines are skipped.
+
+        Args:
+            lines (Iterable[bytes]): lines with one JSON record each
+
+        Raises:
+            TransportError: worker process has exited
+
+        Yields:
+            Iterator[tuple[dict, dict, None]]: result and metadata for every non-blank line with an accepted record
+        """
+        yield from self._run(self._line_batches(lines))
@@ -18,12 +18,20 @@ setup(
     author_email="cheyuriydev@gmail.com",
     license="Apache 2.0",
     packages=find_packages(),
+    entry_points={
+        "console_scripts": [
+            "morpher=morpher.cli:main"
+        ]
+    },
     zip_safe=False,
     python_requires=">=3.11",
     install_requires=[
         "jsonpath-ng",
         "arrow"
     ],
+    extras_require={
+        "simdjson": ["pysimdjson"]
+    },
     classifiers=[
         "Development Status :: 5 - Production/Stable",
         "Intended Audience :: Developers",